@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate
 from users.models import User
 from attendance.models import AttendanceRecord
+from labour_management.shards import fan_out, on_shard, record_aliases
 
 @api_view(['POST'])
 def login_api(request):
@@ -25,7 +26,9 @@ def login_api(request):
 @api_view(['GET'])
 def dashboard_api(request):
     # Return dashboard data as JSON
+    # Counted in every database holding attendance at once
+    attendance_counts = fan_out(lambda alias: on_shard(AttendanceRecord.objects.all(), alias).count(), record_aliases())
     return Response({
         'total_users': User.objects.count(),
-        'total_attendance': AttendanceRecord.objects.count()
+        'total_attendance': sum(attendance_counts)
     })
\ No newline at end of file
@@ -1,15 +1,48 @@
 from django.contrib import admin
-from .models import AttendanceRecord, UploadHistory
+from .models import ArchivedAttendanceRecord, AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary, UploadHistory, UploadJob
 
 @admin.register(AttendanceRecord)
 class AttendanceRecordAdmin(admin.ModelAdmin):
     list_display = ['user', 'date', 'status', 'hours_worked', 'overtime', 'created_at']
-    list_filter = ['status', 'date', 'user__company_name']
+    list_filter = ['status', 'date', 'company']
     search_fields = ['user__username', 'user__ep_number', 'user__first_name', 'user__last_name']
     date_hierarchy = 'date'
 
+@admin.register(ArchivedAttendanceRecord)
+class ArchivedAttendanceRecordAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'status', 'hours_worked', 'overtime', 'archived_at']
+    list_filter = ['status', 'company']
+    search_fields = ['user__username', 'user__ep_number', 'user__first_name', 'user__last_name']
+    date_hierarchy = 'date'
+
+    # Moved back with archive_attendance --restore, never edited in place
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(UploadHistory)
 class UploadHistoryAdmin(admin.ModelAdmin):
-    list_display = ['filename', 'uploaded_by', 'total_rows', 'accepted_rows', 'rejected_rows', 'upload_date']
+    list_display = ['filename', 'uploaded_by', 'total_rows', 'accepted_rows', 'unchanged_rows', 'rejected_rows', 'upload_date']
     list_filter = ['upload_date', 'uploaded_by']
-    search_fields = ['filename', 'uploaded_by__username']
\ No newline at end of file
+    search_fields = ['filename', 'uploaded_by__username']
+
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'filename', 'company_name', 'uploaded_by', 'status', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['filename', 'company_name', 'uploaded_by__username']
+    readonly_fields = ['result', 'error', 'started_at', 'finished_at']
+
+@admin.register(DailyAttendanceSummary)
+class DailyAttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ['company', 'date', 'department', 'shift', 'status', 'record_count', 'hours_worked', 'overtime']
+    list_filter = ['status', 'company']
+    date_hierarchy = 'date'
+
+@admin.register(MonthlyAttendanceSummary)
+class MonthlyAttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'month', 'status', 'record_count', 'hours_worked', 'overtime']
+    list_filter = ['status', 'month']
+    search_fields = ['user__username', 'user__ep_number']
@@ -0,0 +1,174 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import ArchivedAttendanceRecord, AttendanceRecord
+from .summaries import month_start, next_month
+from labour_management.shards import (
+    CombinedQuerySet, current_shard, fan_out, record_aliases, shards_for_companies, use_shard,
+)
+from users.dashboard import bump_all_dashboards
+
+logger = logging.getLogger(__name__)
+
+# Records moved per statement and per transaction
+ARCHIVE_BATCH_SIZE = 1000
+
+# Copied as they are, id and timestamps included, so a record moved back is unchanged
+MOVED_COLUMNS = [field.column for field in AttendanceRecord._meta.concrete_fields]
+
+
+def default_cutoff(today=None):
+    """First month kept live: ATTENDANCE_ARCHIVE_MONTHS before the current one"""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - settings.ATTENDANCE_ARCHIVE_MONTHS
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def archive_horizon():
+    """
+    First day not archived: every earlier record is in the archive. None
+    while it is empty. With company shards each database has its own,
+    and this is the current one's (see use_shard).
+    """
+    last = ArchivedAttendanceRecord.objects.order_by('-date').values_list('date', flat=True).first()
+    return next_month(last) if last else None
+
+
+def reaches_archive(start_date):
+    """Whether records from start_date on (None for all of them) include archived ones, in any database"""
+    def horizon_in(alias):
+        with use_shard(alias):
+            return archive_horizon()
+
+    horizons = [horizon for horizon in fan_out(horizon_in, record_aliases()) if horizon]
+    if not horizons:
+        return False
+    horizon = max(horizons)
+    if isinstance(start_date, str):
+        start_date = date.fromisoformat(start_date) if start_date else None
+    return start_date is None or start_date < horizon
+
+
+def read_through(scope):
+    """A RecordScope's records, archived ones included, read as one queryset"""
+    return CombinedQuerySet(scope.record_parts() + scope.record_parts(ArchivedAttendanceRecord))
+
+
+def _copy(source, target, ids, extra_columns=(), extra_values=()):
+    """INSERT INTO target ... SELECT ... FROM source WHERE id IN (ids), without a round trip through Python"""
+    connection = connections[current_shard()]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in MOVED_COLUMNS)
+    target_columns = ', '.join([columns] + [quote(column) for column in extra_columns])
+    selected = ', '.join([columns] + ['%s'] * len(extra_values))
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(target._meta.db_table)} ({target_columns}) '
+            f'SELECT {selected} FROM {quote(source._meta.db_table)} WHERE {quote("id")} IN ({placeholders})',
+            [*extra_values, *ids],
+        )
+        return cursor.rowcount
+
+
+def _move(source, target, ids):
+    """
+    Move the records with these ids from source to target in the caller's
+    transaction. A record the target already has for the same employee and
+    day was replaced by the one moving in, and is dropped.
+    """
+    pairs = set(source.objects.filter(id__in=ids).values_list('user_id', 'date'))
+    stale = [
+        pk for pk, user_id, day in target.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs}, date__in={day for _, day in pairs}
+        ).values_list('id', 'user_id', 'date')
+        if (user_id, day) in pairs
+    ]
+    if stale:
+        target.objects.filter(id__in=stale).delete_moved()
+    if target is ArchivedAttendanceRecord:
+        moved = _copy(source, target, ids, ['archived_at'], [timezone.now()])
+    else:
+        moved = _copy(source, target, ids)
+    source.objects.filter(id__in=ids).delete_moved()
+    return moved
+
+
+def _move_all(records, target, batch_size, label):
+    """Move records to target in primary key order, one batch per transaction, in the current database"""
+    moved = last_id = 0
+    while True:
+        ids = list(records.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic(using=current_shard()):
+            moved += _move(records.model, target, ids)
+        last_id = ids[-1]
+        logger.info('%s: %s attendance records moved', label, moved)
+    if moved:
+        # Recent records on the dashboards may have moved
+        bump_all_dashboards()
+    return moved
+
+
+def archive_before(cutoff, batch_size=ARCHIVE_BATCH_SIZE, aliases=None):
+    """
+    Move live records dated before the month of cutoff to the archive, in
+    every database holding attendance or only these aliases; returns how
+    many moved.
+    """
+    cutoff = month_start(cutoff)
+    moved = 0
+    for alias in aliases or record_aliases():
+        with use_shard(alias):
+            moved += _move_all(AttendanceRecord.objects.filter(date__lt=cutoff), ArchivedAttendanceRecord,
+                               batch_size, f'Archive before {cutoff} in {alias}')
+    return moved
+
+
+def restore_from(start=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move archived records from the month of start on (all of them if None) back; returns how many moved"""
+    if start is not None:
+        start = month_start(start)
+    moved = 0
+    for alias in record_aliases():
+        with use_shard(alias):
+            records = ArchivedAttendanceRecord.objects.all()
+            if start is not None:
+                records = records.filter(date__gte=start)
+            moved += _move_all(records, AttendanceRecord, batch_size, f'Restore from {start or "the start"} in {alias}')
+    return moved
+
+
+def archive_late_records(keys):
+    """
+    Move records just written for archived days, given as (user_id,
+    company_id, date) keys, into the archive, so each day stays in one table.
+    """
+    keys_by_alias = defaultdict(set)
+    aliases = shards_for_companies({company_id for _, company_id, _ in keys})
+    for user_id, company_id, day in keys:
+        keys_by_alias[aliases[company_id]].add((user_id, company_id, day))
+    moved = 0
+    for alias, alias_keys in keys_by_alias.items():
+        with use_shard(alias):
+            moved += _archive_late(alias_keys)
+    return moved
+
+
+def _archive_late(keys):
+    horizon = archive_horizon()
+    late = {(user_id, day) for user_id, _, day in keys if horizon and day < horizon}
+    if not late:
+        return 0
+    ids = list(AttendanceRecord.objects.filter(
+        user_id__in={user_id for user_id, _ in late}, date__in={day for _, day in late}, date__lt=horizon
+    ).order_by('id').values_list('id', flat=True))
+    moved = 0
+    for start in range(0, len(ids), ARCHIVE_BATCH_SIZE):
+        with transaction.atomic(using=current_shard()):
+            moved += _move(AttendanceRecord, ArchivedAttendanceRecord, ids[start:start + ARCHIVE_BATCH_SIZE])
+    return moved
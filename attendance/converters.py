@@ -0,0 +1,117 @@
+from datetime import datetime
+from functools import lru_cache
+
+# Distinct cell values remembered per converter; punch times and dates repeat constantly
+MEMO_SIZE = 4096
+
+TIME_COLUMNS = [
+    ('IN1', 'in1'),
+    ('OUT1', 'out1'),
+    ('IN2', 'in2'),
+    ('OUT2', 'out2'),
+    ('IN3', 'in3'),
+    ('OUT3', 'out3'),
+]
+
+HOURS_COLUMNS = [
+    ('Hours Worked', 'hours_worked'),
+    ('Overtime', 'overtime'),
+]
+
+
+def parse_date(date_str):
+    try:
+        return datetime.strptime(date_str, '%d-%m-%Y').date()
+    except ValueError:
+        raise ValueError(f"Invalid date format: {date_str}. Expected DD-MM-YYYY")
+
+
+def parse_time(time_str):
+    """Parse HH:MM and HH:MM (N) (next day) punch times"""
+    if not time_str or time_str.strip() == '':
+        return None
+
+    time_str = time_str.strip()
+
+    # Handle HH:MM (N) format - remove (N) indicator
+    if '(N)' in time_str or '(n)' in time_str:
+        time_str = time_str.replace('(N)', '').replace('(n)', '').strip()
+
+    try:
+        return datetime.strptime(time_str, '%H:%M').time()
+    except ValueError:
+        raise ValueError(f"Invalid time format: {time_str}. Expected HH:MM or HH:MM (N)")
+
+
+def parse_hours(hours_str):
+    """Parse hours given as decimal or HH:MM, falling back to 0"""
+    if not hours_str or str(hours_str).strip() == '':
+        return 0
+    hours_str = str(hours_str).strip()
+
+    # Check if it's in HH:MM format
+    if ':' in hours_str:
+        try:
+            parts = hours_str.split(':')
+            hours = int(parts[0])
+            minutes = int(parts[1]) if len(parts) > 1 else 0
+            return hours + (minutes / 60.0)
+        except (ValueError, IndexError):
+            return 0
+    else:
+        # Assume it's decimal format
+        try:
+            return float(hours_str)
+        except (ValueError, TypeError):
+            return 0
+
+
+# Memoized versions; invalid values raise every time since exceptions aren't cached
+convert_date = lru_cache(maxsize=MEMO_SIZE)(parse_date)
+convert_time = lru_cache(maxsize=MEMO_SIZE)(parse_time)
+convert_hours = lru_cache(maxsize=MEMO_SIZE)(parse_hours)
+
+
+class AttendanceRowConverter:
+    """
+    Turns attendance rows into AttendanceRecord field values.
+
+    Built once per file from its header, it converts a whole chunk column
+    by column. Each row keeps only its first error, in the order the
+    columns used to be checked row by row: Date, then IN1..OUT3.
+    """
+
+    def __init__(self, fieldnames):
+        self.fieldnames = list(fieldnames or [])
+        present = set(self.fieldnames)
+        self.columns = [('Date', 'date', convert_date)]
+        # Columns absent from the header convert to the same value on every row
+        self.constants = {}
+        for column, field, convert in (
+            [(column, field, convert_time) for column, field in TIME_COLUMNS]
+            + [(column, field, convert_hours) for column, field in HOURS_COLUMNS]
+        ):
+            if column in present:
+                self.columns.append((column, field, convert))
+            else:
+                self.constants[field] = convert(None)
+
+    def convert(self, rows):
+        """Return field values for each row and {row index: error message}"""
+        values = [dict(self.constants) for _ in rows]
+        errors = {}
+
+        for column, field, convert in self.columns:
+            for index, raw in enumerate([row.get(column) for row in rows]):
+                if index in errors:
+                    continue
+                try:
+                    values[index][field] = convert(raw)
+                except Exception as e:
+                    errors[index] = str(e)
+
+        for index, row in enumerate(rows):
+            values[index]['status'] = row.get('Status', 'P')
+            values[index]['shift'] = row.get('Shift')
+
+        return values, errors
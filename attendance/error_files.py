@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import datetime
+from django.core.files.storage import default_storage
+from .models import UploadHistory
+
+ERROR_DIR = 'upload_errors/'
+
+# Suffix of error files still being written; the sweeper removes abandoned ones
+PARTIAL_SUFFIX = '.part'
+
+
+def error_filename(filename):
+    return f"errors_{filename}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv.gz"
+
+
+class ErrorFileWriter:
+    """
+    Writes rejected rows to a gzip-compressed CSV as they are found, so the
+    error report never has to be held in memory. The file is created next to
+    its final location on the first error and moved into place by save().
+    """
+
+    def __init__(self, fieldnames, directory=ERROR_DIR):
+        self.fieldnames = ['Row_Number', 'Error_Message'] + list(fieldnames or [])
+        self.directory = directory
+        self.count = 0
+        self._file = None
+        self._gzip = None
+        self._text = None
+        self._writer = None
+
+    def write(self, row_num, row, error_msg):
+        if self._writer is None:
+            self._open()
+        failed_row = dict(row)
+        failed_row['Error_Message'] = error_msg
+        failed_row['Row_Number'] = row_num
+        self._writer.writerow(failed_row)
+        self.count += 1
+
+    def _open(self):
+        directory = default_storage.path(self.directory)
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix=PARTIAL_SUFFIX, delete=False)
+        # No filename in the header, the temp name means nothing to the downloader
+        self._gzip = gzip.GzipFile(filename='', fileobj=self._file, mode='wb')
+        self._text = io.TextIOWrapper(self._gzip, encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._text, fieldnames=self.fieldnames)
+        self._writer.writeheader()
+
+    def save(self, filename, max_length=None):
+        """Move the finished file into place; returns its storage name, or '' if nothing failed"""
+        if self._writer is None:
+            return ''
+        self._text.close()
+        self._file.close()
+        name = default_storage.get_available_name(self.directory + error_filename(filename), max_length=max_length)
+        os.replace(self._file.name, default_storage.path(name))
+        self._writer = None
+        return name
+
+
+def sweep_error_files(cutoff, directories=(ERROR_DIR,), dry_run=False, storage=default_storage):
+    """
+    Delete error reports last modified before cutoff, along with partial
+    files abandoned by interrupted uploads. Returns the deleted names.
+    """
+    deleted = []
+    for directory in directories:
+        if not storage.exists(directory):
+            continue
+        _, files = storage.listdir(directory)
+        for filename in files:
+            name = directory + filename
+            if storage.get_modified_time(name) < cutoff:
+                deleted.append(name)
+
+    if not dry_run:
+        for name in deleted:
+            storage.delete(name)
+        if storage is default_storage:
+            UploadHistory.objects.filter(error_file__in=deleted).update(error_file='')
+    return deleted
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from django.conf import settings
+from django.db.models import Count, Max
+from .exports import csv_stream, write_xlsx
+from .progress import progress_cache
+
+EMPLOYEE_DATA_KEY = 'export_employee_data_changed_at'
+
+# Partial files older than this were left by a crashed export
+STALE_PART_SECONDS = 24 * 60 * 60
+
+EXPORT_EXTENSIONS = {
+    'xlsx': 'xlsx',
+    'csv': 'csv',
+    'csv.gz': 'csv.gz',
+}
+
+
+def touch_employee_data():
+    """
+    Export rows include employee details, which AttendanceRecord.updated_at
+    doesn't cover; saving an employee moves this stamp instead.
+    """
+    progress_cache().set(EMPLOYEE_DATA_KEY, time.time(), None)
+
+
+def employee_data_stamp():
+    stamp = progress_cache().get(EMPLOYEE_DATA_KEY)
+    if stamp is None:
+        # Lost or never set: a fresh stamp can't match any older artifact
+        progress_cache().add(EMPLOYEE_DATA_KEY, time.time(), None)
+        stamp = progress_cache().get(EMPLOYEE_DATA_KEY)
+    return stamp
+
+
+def data_version(queryset):
+    """
+    Changes whenever a matching record is added, edited or deleted: edits
+    and inserts move the newest updated_at, deletes lower the count.
+    """
+    version = queryset.order_by().aggregate(count=Count('id'), last_id=Max('id'), updated=Max('updated_at'))
+    return [version['count'], version['last_id'], str(version['updated']), employee_data_stamp()]
+
+
+def export_cache_dir():
+    return settings.EXPORT_CACHE_DIR
+
+
+class CachedExport:
+    """
+    An export artifact on disk, named after everything that determines its
+    content: who may see which records, the date range, the format and the
+    data version. A new version simply produces a new file; stale ones age
+    out through evict().
+    """
+
+    def __init__(self, scope, queryset, export_format, start_date=None, end_date=None):
+        self.queryset = queryset
+        self.export_format = export_format
+        key = json.dumps([scope, start_date or '', end_date or '', export_format, data_version(queryset)])
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        self.path = os.path.join(export_cache_dir(), f'{digest}.{EXPORT_EXTENSIONS[export_format]}')
+
+    def open_cached(self):
+        """The cached file opened for reading, or None on a miss"""
+        try:
+            cached = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        # Reads don't reliably update atime, so a hit refreshes mtime for LRU eviction
+        os.utime(self.path)
+        return cached
+
+    def _temp_file(self):
+        os.makedirs(export_cache_dir(), exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=export_cache_dir(), suffix='.part', delete=False)
+
+    def build(self):
+        """Generate the artifact into the cache and return it opened for reading"""
+        with self._temp_file() as output:
+            if self.export_format == 'xlsx':
+                write_xlsx(self.queryset, output)
+            else:
+                for data in csv_stream(self.queryset, compress=self.export_format == 'csv.gz'):
+                    output.write(data)
+        os.replace(output.name, self.path)
+        evict()
+        return open(self.path, 'rb')
+
+    def stream(self):
+        """
+        Yield a CSV export to the client while saving it to the cache. The
+        file is only kept if the whole export was generated.
+        """
+        output = self._temp_file()
+        try:
+            for data in csv_stream(self.queryset, compress=self.export_format == 'csv.gz'):
+                output.write(data)
+                yield data
+        except BaseException:
+            output.close()
+            os.remove(output.name)
+            raise
+        output.close()
+        os.replace(output.name, self.path)
+        evict()
+
+
+def evict(max_bytes=None):
+    """Delete the least recently used artifacts until the cache fits max_bytes"""
+    if max_bytes is None:
+        max_bytes = settings.EXPORT_CACHE_MAX_BYTES
+    directory = export_cache_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    entries = []
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if not entry.name.endswith('.part'):
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        elif stat.st_mtime < time.time() - STALE_PART_SECONDS:
+            os.remove(entry.path)
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+    return removed
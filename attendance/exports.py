@@ -0,0 +1,186 @@
+import csv
+import itertools
+import tempfile
+import zlib
+from .archive import reaches_archive, read_through
+from .models import AttendanceRecord, format_hours
+from users.scope import scope_for
+
+EXPORT_HEADERS = [
+    'EP Number', 'Name', 'Company Name', 'Plant', 'Department', 'Trade', 'Skill', 'Shift',
+    'Date', 'IN1', 'OUT1', 'IN2', 'OUT2', 'IN3', 'OUT3', 'Hours Worked', 'Overtime', 'Status',
+    'Supervisor Remarks', 'Employee Remarks'
+]
+
+# Only the columns the report needs, read straight into tuples
+EXPORT_FIELDS = [
+    'user__ep_number', 'user__first_name', 'user__last_name', 'user__company_name', 'user__plant',
+    'user__department', 'user__trade', 'user__skill', 'shift', 'user__shift', 'date',
+    'in1', 'out1', 'in2', 'out2', 'in3', 'out3', 'hours_worked', 'overtime', 'status',
+    'supervisor_remarks', 'employee_remarks'
+]
+
+# Employees have no export access
+EXPORT_ROLES = ('master', 'user1', 'user2')
+
+# Rows fetched per database round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Column widths are measured on the header and this many leading rows
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COLUMN_WIDTH = 50
+
+
+def export_scope(user):
+    """
+    (label, queryset) for the records a user may export. Users with the
+    same label see exactly the same records; None means nothing to export.
+    """
+    if user.role not in EXPORT_ROLES:
+        return None, AttendanceRecord.objects.none()
+    scope = scope_for(user)
+    return scope.label, scope.records()
+
+
+def filter_dates(attendance_records, start_date=None, end_date=None):
+    if start_date:
+        attendance_records = attendance_records.filter(date__gte=start_date)
+    if end_date:
+        attendance_records = attendance_records.filter(date__lte=end_date)
+    return attendance_records
+
+
+def export_queryset(user, start_date=None, end_date=None):
+    """
+    Attendance records the user may export, limited to the date range.
+    A range starting before the archive horizon reads the archive too.
+    """
+    scope, attendance_records = export_scope(user)
+    if scope is not None and reaches_archive(start_date):
+        attendance_records = read_through(scope_for(user))
+    return filter_dates(attendance_records, start_date, end_date)
+
+
+def _time(value):
+    return value.strftime('%H:%M') if value else ''
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield report rows in EXPORT_HEADERS order without building model instances"""
+    for (ep_number, first_name, last_name, company_name, plant, department, trade, skill, shift, user_shift,
+         date, in1, out1, in2, out2, in3, out3, hours_worked, overtime, status,
+         supervisor_remarks, employee_remarks) in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        yield (
+            ep_number,
+            f"{first_name} {last_name}".strip(),
+            company_name,
+            plant,
+            department,
+            trade,
+            skill,
+            shift or user_shift,
+            date.strftime('%d-%m-%Y'),
+            _time(in1),
+            _time(out1),
+            _time(in2),
+            _time(out2),
+            _time(in3),
+            _time(out3),
+            format_hours(hours_worked),
+            format_hours(overtime),
+            status,
+            supervisor_remarks or '',
+            employee_remarks or '',
+        )
+
+
+def column_widths(rows):
+    """Widest value per column plus padding, capped like the report always was"""
+    widths = [len(str(header)) for header in EXPORT_HEADERS]
+    for row in rows:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def write_xlsx(queryset, output):
+    """
+    Write the attendance report to output with openpyxl's write-only mode.
+    Rows go to disk as they are produced; widths come from a sample because
+    write-only sheets need them before the first row.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Attendance Report")
+
+    rows = export_rows(queryset)
+    sample = list(itertools.islice(rows, WIDTH_SAMPLE_ROWS))
+    for index, width in enumerate(column_widths(sample), 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    # Header styling
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_cells = []
+    for header in EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for row in itertools.chain(sample, rows):
+        ws.append(row)
+
+    wb.save(output)
+
+
+def build_xlsx_export(queryset):
+    """The report as an anonymous temp file, rewound and ready to stream"""
+    output = tempfile.TemporaryFile()
+    write_xlsx(queryset, output)
+    output.seek(0)
+    return output
+
+
+class _Echo:
+    """File-like object handing each csv.writer line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(queryset, compress=False, rows_per_chunk=500):
+    """
+    Yield the report as CSV bytes, gzip-compressed if asked, a batch of rows
+    at a time. The header goes out before the query runs.
+    """
+    writer = csv.writer(_Echo())
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(lines, flush=False):
+        data = ''.join(lines).encode('utf-8')
+        if compressor is None:
+            return data
+        data = compressor.compress(data)
+        if flush:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    yield encode([writer.writerow(EXPORT_HEADERS)], flush=True)
+
+    rows = export_rows(queryset)
+    while True:
+        lines = [writer.writerow(row) for row in itertools.islice(rows, rows_per_chunk)]
+        if not lines:
+            break
+        data = encode(lines)
+        if data:
+            yield data
+
+    if compressor is not None:
+        yield compressor.flush()
@@ -3,8 +3,18 @@ from .models import AttendanceRecord
 
 class AttendanceUploadForm(forms.Form):
     csv_file = forms.FileField(
-        widget=forms.FileInput(attrs={'accept': '.csv', 'class': 'form-control'})
+        widget=forms.FileInput(attrs={'accept': '.csv,.xlsx', 'class': 'form-control'})
     )
+    validate_only = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    
+    def clean_csv_file(self):
+        csv_file = self.cleaned_data['csv_file']
+        if not csv_file.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Please upload a .csv or .xlsx file.')
+        return csv_file
 
 class AttendanceEditForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,462 @@
+import hashlib
+from collections import defaultdict
+from decimal import Decimal
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from .archive import archive_horizon, archive_late_records
+from .converters import AttendanceRowConverter
+from .error_files import ERROR_DIR, ErrorFileWriter
+from .models import ArchivedAttendanceRecord, AttendanceRecord, UploadHistory
+from .summaries import refresh_records
+from labour_management.shards import (
+    current_shard, fan_out, mirror, record_aliases, shards_configured, shards_for_companies, use_shard,
+)
+from users.dashboard import bump_dashboards
+from users.hashers import make_provisional_password
+from users.models import Company, User
+from users.search import index_users
+
+# Rows are resolved, validated and upserted this many at a time, each chunk in its own transaction
+CHUNK_SIZE = 1000
+
+ATTENDANCE_VALUE_FIELDS = ['in1', 'out1', 'in2', 'out2', 'in3', 'out3', 'hours_worked', 'overtime', 'status', 'shift']
+
+
+def record_fingerprint(values):
+    """
+    Digest of an attendance row's stored columns. Works on converted upload
+    values and on values read back from the database alike, so a re-uploaded
+    row can be compared with its record without writing it.
+    """
+    parts = []
+    for field in ATTENDANCE_VALUE_FIELDS:
+        value = values.get(field)
+        if field in ('hours_worked', 'overtime'):
+            # Stored as DecimalField(max_digits=5, decimal_places=2)
+            value = AttendanceRecord._meta.get_field(field).to_python(value).quantize(Decimal('0.01'))
+        # NUL keeps a missing value distinct from an empty string
+        parts.append('\x00' if value is None else str(value))
+    return hashlib.sha1('\x1e'.join(parts).encode()).hexdigest()
+
+
+def employee_defaults(row, ep_number):
+    """Fields used when an attendance row introduces a new employee"""
+    return {
+        'username': ep_number,
+        'first_name': row.get('Name', '').split()[0] if row.get('Name') else '',
+        'last_name': ' '.join(row.get('Name', '').split()[1:]) if row.get('Name') else '',
+        'company_name': row.get('Company Name'),
+        'plant': row.get('Plant'),
+        'department': row.get('Department'),
+        'trade': row.get('Trade'),
+        'skill': row.get('Skill'),
+        'shift': row.get('Shift'),
+        'role': 'user3'
+    }
+
+
+class AttendanceImporter:
+    """
+    Imports attendance rows chunk by chunk.
+
+    Each chunk resolves its EP numbers with one IN query, creates missing
+    employees with bulk_create and upserts attendance on (user, date) with
+    bulk_create(update_conflicts=True). Rows whose fingerprint matches the
+    stored record are counted as unchanged and not written; rows for records
+    already in the archive update them there. If a chunk fails as a whole
+    it is replayed row by row so every bad row gets its own error, exactly
+    as the row-at-a-time upload did.
+    """
+
+    error_dir = ERROR_DIR
+
+    def __init__(self, fieldnames, progress=None, chunk_size=CHUNK_SIZE):
+        self.fieldnames = fieldnames
+        self.converter = AttendanceRowConverter(fieldnames)
+        self.error_writer = ErrorFileWriter(fieldnames, directory=self.error_dir)
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.created_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.error_count = 0
+        self.processed = 0
+        self._user_ids = {}
+        # Employee id -> company id, copied onto their attendance records
+        self._company_ids = {}
+        # (user_id, company_id, date) of every record written, for the summaries
+        self._written_keys = set()
+        # (user_id, date) -> id of the chunk's existing records that are in the archive
+        self._archived_ids = {}
+        self.duplicate_of = None
+
+    @property
+    def accepted_count(self):
+        return self.created_count + self.updated_count + self.unchanged_count
+
+    @property
+    def total_count(self):
+        return self.accepted_count + self.error_count
+
+    def run(self, rows):
+        try:
+            for chunk in self.parsed_chunks(rows):
+                self._apply_chunk(*chunk)
+        finally:
+            self.publish_writes()
+
+    def run_parsed(self, parsed_chunks):
+        """Import chunks already produced by parsed_chunks(), e.g. during validation"""
+        try:
+            for chunk in parsed_chunks:
+                self._apply_chunk(*chunk)
+        finally:
+            self.publish_writes()
+
+    def publish_writes(self):
+        """
+        Bring the attendance summaries and dashboards up to date with the
+        records written so far. Runs once per import, so a day touched by
+        many chunks is only summarised again once.
+        """
+        if self._written_keys:
+            # Rows for archived days join the rest of their month in the archive
+            archive_late_records(self._written_keys)
+            refresh_records(self._written_keys)
+            bump_dashboards({company_id for _, company_id, _ in self._written_keys})
+            self._written_keys = set()
+
+    def parsed_chunks(self, rows):
+        """Split rows into chunks and run the checks that don't need the database"""
+        chunk = []
+        for row_num, row in enumerate(rows, start=2):
+            chunk.append((row_num, row))
+            if len(chunk) >= self.chunk_size:
+                yield self._parse_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield self._parse_chunk(chunk)
+
+    def replay(self, previous):
+        """Take the outcome of an identical earlier upload instead of reading the file"""
+        self.duplicate_of = previous
+        self.unchanged_count = previous.accepted_rows
+        self.error_count = previous.rejected_rows
+        self.processed = previous.total_rows
+        self._update_progress()
+
+    def _parse_chunk(self, chunk):
+        """Returns (chunk, errors by row, employee defaults by EP, converted rows)"""
+        errors = {}
+        valid = []
+        employees = {}
+
+        for row_num, row in chunk:
+            try:
+                ep_number = row.get('EP Number')
+                if not ep_number:
+                    raise ValueError("EP Number is required")
+                defaults = employee_defaults(row, ep_number)
+            except Exception as e:
+                errors[row_num] = str(e)
+                continue
+
+            employees.setdefault(ep_number, defaults)
+            valid.append((row_num, ep_number, row))
+
+        values, value_errors = self.converter.convert([row for _, _, row in valid])
+        pending = [
+            (row_num, ep_number, values[index], value_errors.get(index))
+            for index, (row_num, ep_number, _) in enumerate(valid)
+        ]
+        return chunk, errors, employees, pending
+
+    def _apply_chunk(self, chunk, errors, employees, pending):
+        errors = dict(errors)
+        new_employees = {ep: defaults for ep, defaults in employees.items() if ep not in self._user_ids}
+        # The employee is provisioned even if the rest of the row is invalid
+        user_errors = self._resolve_users(new_employees)
+
+        records = []
+        for row_num, ep_number, values, error in pending:
+            if ep_number in user_errors:
+                errors[row_num] = user_errors[ep_number]
+            elif error:
+                errors[row_num] = error
+            else:
+                records.append((row_num, self._user_ids[ep_number], values))
+
+        if records:
+            self._write(records, errors)
+
+        rows_by_num = dict(chunk)
+        for row_num in sorted(errors):
+            self._record_error(row_num, rows_by_num[row_num], errors[row_num])
+
+        self.processed += len(chunk)
+        self._update_progress()
+
+    def _write(self, records, errors):
+        for alias, shard_records in self._by_database(records):
+            with use_shard(alias):
+                fingerprints = self._stored_fingerprints(shard_records)
+                try:
+                    with transaction.atomic(using=alias):
+                        created, updated, unchanged = self._upsert(shard_records, dict(fingerprints))
+                    self.created_count += created
+                    self.updated_count += updated
+                    self.unchanged_count += unchanged
+                except Exception:
+                    for row_num, error in self._upsert_row_by_row(shard_records, fingerprints).items():
+                        errors[row_num] = error
+
+    def _by_database(self, records):
+        """(alias, records) of each database holding the attendance of the records' companies"""
+        if not records:
+            return []
+        if not shards_configured():
+            return [(DEFAULT_DB_ALIAS, records)]
+        aliases = shards_for_companies({self._company_ids.get(user_id) for _, user_id, _ in records})
+        by_alias = defaultdict(list)
+        for record in records:
+            by_alias[aliases[self._company_ids.get(record[1])]].append(record)
+        return list(by_alias.items())
+
+    def _resolve_users(self, new_employees):
+        """Map EP numbers to user ids, creating missing employees; returns per-EP errors"""
+        if not new_employees:
+            return {}
+
+        ep_numbers = list(new_employees)
+        self._remember_users(User.objects.filter(ep_number__in=ep_numbers))
+        missing = [ep for ep in ep_numbers if ep not in self._user_ids]
+        if not missing:
+            return {}
+
+        # bulk_create skips User.save(), which would set the company
+        companies = {}
+        for ep_number in missing:
+            name = new_employees[ep_number]['company_name']
+            if name not in companies:
+                companies[name] = Company.objects.for_name(name)
+
+        users = []
+        for ep_number in missing:
+            user = User(ep_number=ep_number, company=companies[new_employees[ep_number]['company_name']],
+                        **new_employees[ep_number])
+            user.password = make_provisional_password(ep_number)
+            users.append(user)
+
+        errors = {}
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=self.chunk_size)
+        except Exception:
+            # Isolate the offending employees (e.g. username already taken)
+            for ep_number in missing:
+                try:
+                    with transaction.atomic():
+                        user, created = User.objects.get_or_create(
+                            ep_number=ep_number, defaults=new_employees[ep_number]
+                        )
+                        if created:
+                            user.password = make_provisional_password(ep_number)
+                            user.save(update_fields=['password'])
+                    self._user_ids[ep_number] = user.id
+                    self._company_ids[user.id] = user.company_id
+                except Exception as e:
+                    errors[ep_number] = str(e)
+            return errors
+
+        self._remember_users(User.objects.filter(ep_number__in=missing))
+        # bulk_create sends no post_save, so the search index, shard copies and dashboards are updated here
+        index_users(self._user_ids[ep_number] for ep_number in missing)
+        mirror(User, [self._user_ids[ep_number] for ep_number in missing])
+        bump_dashboards(company.pk if company else None for company in companies.values())
+        return errors
+
+    def _remember_users(self, users):
+        for ep_number, user_id, company_id in users.values_list('ep_number', 'id', 'company_id'):
+            self._user_ids[ep_number] = user_id
+            self._company_ids[user_id] = company_id
+
+    def _stored_fingerprints(self, records):
+        """
+        Fingerprints of the existing records for a chunk, keyed by (user_id,
+        date). Records of archived days are looked up in the archive, and
+        their ids remembered so they are updated where they are.
+        """
+        user_ids = {user_id for _, user_id, _ in records}
+        dates = {values['date'] for _, _, values in records}
+        fingerprints = {}
+        self._archived_ids = {}
+
+        horizon = archive_horizon()
+        archived_dates = {day for day in dates if horizon and day < horizon}
+        if archived_dates:
+            archived = ArchivedAttendanceRecord.objects.filter(user_id__in=user_ids, date__in=archived_dates)
+            for values in archived.values('id', 'user_id', 'date', *ATTENDANCE_VALUE_FIELDS):
+                key = (values['user_id'], values['date'])
+                fingerprints[key] = record_fingerprint(values)
+                self._archived_ids[key] = values['id']
+
+        existing = AttendanceRecord.objects.filter(user_id__in=user_ids, date__in=dates).values(
+            'user_id', 'date', *ATTENDANCE_VALUE_FIELDS
+        )
+        for values in existing:
+            key = (values['user_id'], values['date'])
+            # A live record for an archived day is about to replace the archived one
+            self._archived_ids.pop(key, None)
+            fingerprints[key] = record_fingerprint(values)
+        return fingerprints
+
+    def _changes(self, records, fingerprints):
+        """Classify rows as created, updated or unchanged; returns the counts and the rows to write"""
+        stored = dict(fingerprints)
+        created = updated = unchanged = 0
+        latest = {}
+        for _, user_id, values in records:
+            key = (user_id, values['date'])
+            fingerprint = record_fingerprint(values)
+            if key not in fingerprints:
+                created += 1
+            elif fingerprints[key] == fingerprint:
+                unchanged += 1
+            else:
+                updated += 1
+            fingerprints[key] = fingerprint
+            # A later row for the same employee and day wins, as it did row by row
+            latest[key] = values
+
+        changed = {key: values for key, values in latest.items() if fingerprints[key] != stored.get(key)}
+        return (created, updated, unchanged), changed
+
+    def _upsert(self, records, fingerprints):
+        counts, changed = self._changes(records, fingerprints)
+        archived = {key: changed.pop(key) for key in list(changed) if key in self._archived_ids}
+        if archived:
+            self._update_archived(archived)
+        if changed:
+            objs = [
+                AttendanceRecord(user_id=user_id, company_id=self._company_ids.get(user_id), **values)
+                for (user_id, _), values in changed.items()
+            ]
+            options = {'update_conflicts': True, 'update_fields': ATTENDANCE_VALUE_FIELDS + ['company', 'updated_at']}
+            if connections[current_shard()].features.supports_update_conflicts_with_target:
+                options['unique_fields'] = ['user', 'date']
+            AttendanceRecord.objects.bulk_create(objs, batch_size=self.chunk_size, **options)
+            self._written_keys.update((obj.user_id, obj.company_id, obj.date) for obj in objs)
+        return counts
+
+    def _update_archived(self, changed):
+        """
+        Update archived records in place, keeping their ids and creation
+        times. archived_at moves too, for find_duplicate_upload().
+        """
+        now = timezone.now()
+        objs = [
+            ArchivedAttendanceRecord(id=self._archived_ids[user_id, day], user_id=user_id,
+                                     company_id=self._company_ids.get(user_id), updated_at=now, archived_at=now,
+                                     **values)
+            for (user_id, day), values in changed.items()
+        ]
+        ArchivedAttendanceRecord.objects.bulk_update(
+            objs, ATTENDANCE_VALUE_FIELDS + ['company', 'updated_at', 'archived_at'], batch_size=self.chunk_size
+        )
+        self._written_keys.update((obj.user_id, obj.company_id, obj.date) for obj in objs)
+
+    def _upsert_row_by_row(self, records, fingerprints):
+        errors = {}
+        for row_num, user_id, values in records:
+            key = (user_id, values['date'])
+            fingerprint = record_fingerprint(values)
+            if fingerprints.get(key) == fingerprint:
+                self.unchanged_count += 1
+                continue
+            values = dict(values, company_id=self._company_ids.get(user_id))
+            date = values.pop('date')
+            try:
+                with transaction.atomic(using=current_shard()):
+                    if key in self._archived_ids:
+                        now = timezone.now()
+                        ArchivedAttendanceRecord.objects.filter(id=self._archived_ids[key]).update(
+                            updated_at=now, archived_at=now, **values
+                        )
+                        created_record = False
+                    else:
+                        _, created_record = AttendanceRecord.objects.update_or_create(
+                            user_id=user_id, date=date, defaults=values
+                        )
+                self._written_keys.add((user_id, values['company_id'], date))
+                if created_record:
+                    self.created_count += 1
+                else:
+                    self.updated_count += 1
+                fingerprints[key] = fingerprint
+            except Exception as e:
+                errors[row_num] = str(e)
+        return errors
+
+    def _record_error(self, row_num, row, error_msg):
+        self.error_count += 1
+        self.error_writer.write(row_num, row, error_msg)
+
+    def _update_progress(self):
+        if self.progress:
+            self.progress.update(self.processed, self.accepted_count, self.error_count)
+
+    def save_history(self, uploaded_by, filename, file_hash=''):
+        """Record the upload and attach the gzipped error CSV of the rejected rows"""
+        upload_history = UploadHistory.objects.create(
+            uploaded_by=uploaded_by,
+            filename=filename,
+            total_rows=self.total_count,
+            accepted_rows=self.accepted_count,
+            rejected_rows=self.error_count,
+            unchanged_rows=self.unchanged_count,
+            file_hash=file_hash
+        )
+
+        if self.duplicate_of and self.duplicate_of.error_file:
+            # Same file, same rejected rows: point at the existing error report
+            upload_history.error_file = self.duplicate_of.error_file.name
+            upload_history.save(update_fields=['error_file'])
+
+        error_file = self.error_writer.save(
+            filename, max_length=UploadHistory._meta.get_field('error_file').max_length
+        )
+        if error_file:
+            upload_history.error_file = error_file
+            upload_history.save(update_fields=['error_file'])
+
+        return upload_history
+
+
+def find_duplicate_upload(uploaded_by, file_hash):
+    """
+    The earlier upload of a byte-identical file by the same company, if
+    re-processing it could not change anything: no attendance record has
+    been written since it was imported. Deletes clear the stored hashes.
+    """
+    if not file_hash:
+        return None
+    previous = UploadHistory.objects.filter(
+        file_hash=file_hash, uploaded_by__company=uploaded_by.company_id
+    ).order_by('-upload_date').first()
+    if previous is None:
+        return None
+
+    def written_since(alias):
+        with use_shard(alias):
+            # Records written since may have gone on to the archive, or been updated there
+            return (AttendanceRecord.objects.filter(updated_at__gt=previous.upload_date).exists()
+                    or ArchivedAttendanceRecord.objects.filter(archived_at__gt=previous.upload_date).exists())
+
+    if any(fan_out(written_since, record_aliases())):
+        return None
+    return previous
+
+
+def forget_file_hashes():
+    """For raw attendance deletes, which bypass AttendanceQuerySet.delete()"""
+    UploadHistory.objects.forget_file_hashes()
@@ -0,0 +1,317 @@
+import logging
+from datetime import timedelta
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .ingestion import AttendanceImporter, find_duplicate_upload
+from .models import UploadJob
+from .progress import ProgressTracker, set_progress
+from .purge import Purge, purge_summary
+from .readers import XlsxDictReader, file_sha256, is_xlsx, open_csv, open_upload
+from .validation import take_validation, validate_upload, validated_chunks
+from users.models import Notification
+from users.utils import import_users
+
+logger = logging.getLogger(__name__)
+
+# Company key of jobs that may write to any company; they run alone
+ALL_COMPANIES = '*'
+
+# A worker renews the lease of its running jobs this often; jobs whose
+# lease is older than JOB_LEASE_SECONDS were left by a stopped worker
+HEARTBEAT_SECONDS = 30
+JOB_LEASE_SECONDS = 5 * 60
+
+
+# Rows read in the upload request to find the company a file is for. A longer file
+# is queued for every company and narrowed down by the worker, see narrow_company()
+TARGET_COMPANY_ROWS = 1000
+
+
+def target_company(uploaded_file, filename, max_rows=None):
+    """
+    Company key of an upload: the company every row names in its Company
+    Name column ('' for none), or ALL_COMPANIES if the rows name several,
+    or if there are more than max_rows of them.
+    """
+    names = set()
+    try:
+        rows = XlsxDictReader(uploaded_file) if is_xlsx(filename) else open_csv(uploaded_file)
+        for count, row in enumerate(rows, start=1):
+            if max_rows is not None and count > max_rows:
+                return ALL_COMPANIES
+            names.add(row.get('Company Name') or '')
+            if len(names) > 1:
+                break
+    except Exception:
+        # The worker reports what is wrong with the file
+        return ALL_COMPANIES
+    if len(names) > 1:
+        return ALL_COMPANIES
+    return names.pop() if names else ''
+
+
+def narrow_company(job):
+    """
+    Key a running upload queued for every company on the one company its
+    rows name, if they do, so other companies' jobs can start next to it.
+    Reads the file on the worker instead of in the upload request.
+    """
+    if job.kind == 'purge' or job.company_name != ALL_COMPANIES:
+        return
+    with job.file.open('rb'):
+        company_name = target_company(job.file, job.filename)
+    if company_name != ALL_COMPANIES:
+        UploadJob.objects.filter(pk=job.pk, status='running').update(company_name=company_name)
+        job.company_name = company_name
+
+
+def enqueue_upload(kind, uploaded_file, uploaded_by, session_id=''):
+    """Store an uploaded file and queue it for the upload worker"""
+    job = UploadJob(
+        kind=kind,
+        uploaded_by=uploaded_by,
+        # Keyed on the company the rows are for, whoever uploads them
+        company_name=target_company(uploaded_file, uploaded_file.name, max_rows=TARGET_COMPANY_ROWS),
+        filename=uploaded_file.name,
+        session_id=session_id
+    )
+    job.file.save(uploaded_file.name, uploaded_file, save=False)
+    job.save()
+    return job
+
+
+def enqueue_purge(params, requested_by, description, company_name=ALL_COMPANIES):
+    """Queue a purge (see attendance.purge) for the upload worker; by default it spans every company"""
+    return UploadJob.objects.create(
+        kind='purge',
+        uploaded_by=requested_by,
+        # Keeps uploads for the company from running while it is purged
+        company_name=company_name,
+        filename=description,
+        params=params
+    )
+
+
+def renew_leases(job_ids):
+    """Tell other workers these jobs are still being run"""
+    return UploadJob.objects.filter(id__in=job_ids, status='running').update(heartbeat_at=timezone.now())
+
+
+def requeue_interrupted_jobs():
+    """
+    Put jobs left running by a stopped worker, whose lease has run out, back
+    on the queue; purges resume where they stopped.
+    """
+    expired = Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=timezone.now() - timedelta(seconds=JOB_LEASE_SECONDS))
+    return UploadJob.objects.filter(expired, status='running').update(
+        status='queued', started_at=None, heartbeat_at=None
+    )
+
+
+def _claim(job_id, company_name):
+    """
+    Mark a queued job running unless a job for its company is. The jobs it
+    could conflict with are locked first, so a worker claiming for the same
+    company at the same time waits and then sees this claim; the UPDATE only
+    takes a job still queued. Returns whether this worker got the job.
+    """
+    with transaction.atomic():
+        conflicting = UploadJob.objects.select_for_update().filter(status__in=['queued', 'running'])
+        if company_name != ALL_COMPANIES:
+            conflicting = conflicting.filter(company_name__in=[company_name, ALL_COMPANIES])
+        statuses = list(conflicting.order_by('id').values_list('status', flat=True))
+        if 'running' in statuses:
+            return False
+        now = timezone.now()
+        claimed = UploadJob.objects.filter(id=job_id, status='queued').update(
+            status='running', started_at=now, heartbeat_at=now
+        )
+        return claimed == 1
+
+
+def claim_next_job(busy_companies=()):
+    """
+    Claim the oldest queued job whose company has nothing running.
+    Jobs for the same company are handed out strictly one at a time, and
+    an ALL_COMPANIES job waits for every running job and holds back the
+    jobs queued after it.
+    """
+    blocked = set(busy_companies)
+    blocked.update(UploadJob.objects.filter(status='running').values_list('company_name', flat=True))
+    if ALL_COMPANIES in blocked:
+        return None
+
+    queued = UploadJob.objects.filter(status='queued').order_by('created_at', 'id').values_list('id', 'company_name')
+    for job_id, company_name in queued:
+        if company_name == ALL_COMPANIES and blocked:
+            return None
+        if company_name in blocked:
+            continue
+        if _claim(job_id, company_name):
+            return UploadJob.objects.get(id=job_id)
+        if company_name == ALL_COMPANIES:
+            return None
+        blocked.add(company_name)
+    return None
+
+
+def run_job(job_id):
+    """Process one claimed job; meant to run on a worker thread"""
+    close_old_connections()
+    job = UploadJob.objects.select_related('uploaded_by').get(id=job_id)
+    try:
+        narrow_company(job)
+        if job.kind == 'attendance':
+            _run_attendance_job(job)
+        elif job.kind == 'purge':
+            _run_purge_job(job)
+        elif job.kind == 'validation':
+            _run_validation_job(job)
+        else:
+            _run_users_job(job)
+        job.status = 'completed'
+        if job.file:
+            job.file.delete(save=False)
+    except Exception as e:
+        logger.exception('Upload job %s failed', job.id)
+        job.status = 'failed'
+        job.error = str(e)
+        if job.session_id:
+            set_progress(job.session_id, total=0, processed=0, success=0, errors=0,
+                         status='failed', error=str(e), job_id=job.id)
+        Notification.objects.create(
+            user=job.uploaded_by,
+            title=f'{job.get_kind_display()} failed',
+            message=f'{job.filename} could not be processed: {e}'
+        )
+    finally:
+        job.finished_at = timezone.now()
+        job.save()
+        connections.close_all()
+    return job
+
+
+def _run_attendance_job(job):
+    with job.file.open('rb'):
+        file_hash = file_sha256(job.file)
+        duplicate = find_duplicate_upload(job.uploaded_by, file_hash)
+        validation = None if duplicate else take_validation(job.uploaded_by, file_hash)
+        if duplicate:
+            progress = ProgressTracker(job.session_id, total=duplicate.total_rows) if job.session_id else None
+            importer = AttendanceImporter([], progress=progress)
+            importer.replay(duplicate)
+        elif validation:
+            # Validated earlier: reuse its parse instead of reading the file again
+            total_rows = validation['summary']['total']
+            progress = ProgressTracker(job.session_id, total=total_rows) if job.session_id else None
+            importer = AttendanceImporter(validation['fieldnames'], progress=progress)
+            importer.run_parsed(validated_chunks(validation))
+        else:
+            reader, total_rows = open_upload(job.file, job.filename)
+            progress = ProgressTracker(job.session_id, total=total_rows) if job.session_id else None
+            importer = AttendanceImporter(reader.fieldnames, progress=progress)
+            importer.run(reader)
+
+    job.upload_history = importer.save_history(job.uploaded_by, job.filename, file_hash=file_hash)
+    job.result = {
+        'created': importer.created_count,
+        'updated': importer.updated_count,
+        'unchanged': importer.unchanged_count,
+        'errors': importer.error_count,
+        'total': importer.total_count,
+    }
+    if duplicate:
+        job.result['duplicate_of'] = duplicate.id
+    Notification.objects.create(
+        user=job.uploaded_by,
+        title='Attendance upload completed',
+        message=attendance_summary(job.filename, job.result)
+    )
+    if progress:
+        progress.finish(
+            total=importer.total_count,
+            processed=importer.total_count,
+            success=importer.accepted_count,
+            errors=importer.error_count,
+            job_id=job.id
+        )
+
+
+def _run_validation_job(job):
+    with job.file.open('rb'):
+        job.result = validate_upload(job.file, job.uploaded_by, filename=job.filename, session_id=job.session_id)
+
+    Notification.objects.create(
+        user=job.uploaded_by,
+        title='Attendance validation completed',
+        message=validation_summary(job.filename, job.result)
+    )
+
+
+def _run_users_job(job):
+    with job.file.open('rb'):
+        created_count, errors = import_users(open_csv(job.file))
+
+    job.result = {
+        'created': created_count,
+        'errors': len(errors),
+        # Keep the first few messages, like the upload page used to show
+        'error_messages': errors[:10],
+    }
+    Notification.objects.create(
+        user=job.uploaded_by,
+        title='User upload completed',
+        message=users_summary(job.filename, created_count, errors)
+    )
+
+
+def _run_purge_job(job):
+    def save_state(state):
+        # Saved with each batch, so a restarted worker resumes from the last one
+        job.result = state
+        UploadJob.objects.filter(pk=job.pk).update(result=state)
+
+    # Carries on from the state saved by an interrupted run, if any
+    Purge(job.params, state=job.result, keep_user_ids=[job.uploaded_by_id], on_batch=save_state).run()
+    Notification.objects.create(
+        user=job.uploaded_by,
+        title='Data purge completed',
+        message=purge_summary(job.filename, job.result)
+    )
+
+
+def attendance_summary(filename, result):
+    unchanged = result.get('unchanged', 0)
+    total_processed = result['created'] + result['updated'] + unchanged
+    if result.get('duplicate_of'):
+        return (f"{filename}: Identical to a file already uploaded, no records changed "
+                f"({total_processed} unchanged, {result['errors']} failed).")
+    if result['errors'] == 0:
+        return (f"{filename}: Successfully processed all {result['total']} records "
+                f"({result['created']} new, {result['updated']} updated, {unchanged} unchanged).")
+    if total_processed > 0:
+        return (f"{filename}: {total_processed} out of {result['total']} records processed successfully "
+                f"({result['created']} new, {result['updated']} updated, {unchanged} unchanged, "
+                f"{result['errors']} failed). "
+                f"Download the error file from Upload History to fix and re-upload.")
+    return (f"{filename}: All {result['errors']} records could not be processed. "
+            f"Download the error file from Upload History to fix issues and try again.")
+
+
+def validation_summary(filename, result):
+    if result['errors']:
+        return (f"{filename}: Validation found {result['errors']} of {result['total']} rows with errors. "
+                f"Nothing was saved.")
+    return (f"{filename} is valid: {result['total']} rows ({result['created']} new, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged). Nothing was saved yet.")
+
+
+def users_summary(filename, created_count, errors):
+    if not errors:
+        return f'{filename}: Created {created_count} user accounts.'
+    message = f'{filename}: Created {created_count} user accounts, {len(errors)} could not be created. '
+    message += ' '.join(errors[:5])
+    if len(errors) > 5:
+        message += f' ... and {len(errors) - 5} more errors.'
+    return message
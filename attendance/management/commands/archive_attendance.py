@@ -0,0 +1,63 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from attendance.archive import ARCHIVE_BATCH_SIZE, archive_before, archive_horizon, default_cutoff, restore_from
+from attendance.models import ArchivedAttendanceRecord, AttendanceRecord
+from labour_management.shards import on_shard, record_aliases, shards_configured, use_shard
+
+
+def count_everywhere(records):
+    """records counted in every database holding attendance"""
+    return sum(on_shard(records, alias).count() for alias in record_aliases())
+
+
+def parse_month(value, option):
+    try:
+        return date.fromisoformat(f'{value}-01')
+    except ValueError:
+        raise CommandError(f'{option} must look like YYYY-MM')
+
+
+class Command(BaseCommand):
+    help = ("Move attendance older than ATTENDANCE_ARCHIVE_MONTHS whole months to the archive table, "
+            "or move archived attendance back with --restore")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive records before this month, YYYY-MM '
+                                             '(default ATTENDANCE_ARCHIVE_MONTHS months ago)')
+        parser.add_argument('--restore', action='store_true', help='Move archived records back instead')
+        parser.add_argument('--since', help='With --restore, only records from this month on, YYYY-MM (default all)')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Records moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the records that would move')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        if options['restore']:
+            since = parse_month(options['since'], '--since') if options['since'] else None
+            records = ArchivedAttendanceRecord.objects.all()
+            if since:
+                records = records.filter(date__gte=since)
+            if options['dry_run']:
+                self.stdout.write(f'{count_everywhere(records)} archived records would be restored.')
+                return
+            moved = restore_from(since, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Restored {moved} records in {time.time() - started:.1f}s'))
+        else:
+            cutoff = parse_month(options['before'], '--before') if options['before'] else default_cutoff()
+            if options['dry_run']:
+                count = count_everywhere(AttendanceRecord.objects.filter(date__lt=cutoff))
+                self.stdout.write(f'{count} records before {cutoff} would be archived.')
+                return
+            moved = archive_before(cutoff, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {moved} records before {cutoff} in {time.time() - started:.1f}s'
+            ))
+
+        for alias in record_aliases():
+            with use_shard(alias):
+                horizon = archive_horizon()
+            where = f' in {alias}' if shards_configured() else ''
+            if horizon:
+                self.stdout.write(f'Records before {horizon} are archived{where}.')
+            else:
+                self.stdout.write(f'The archive is empty{where}.')
@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import datetime
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from attendance.converters import AttendanceRowConverter, convert_date, convert_hours, convert_time
+from attendance.ingestion import CHUNK_SIZE
+from attendance.readers import open_csv
+
+HEADERS = ['EP Number', 'Name', 'Company Name', 'Plant', 'Department', 'Trade', 'Skill', 'Shift', 'Date',
+           'IN1', 'OUT1', 'IN2', 'OUT2', 'IN3', 'OUT3', 'Hours Worked', 'Overtime', 'Status']
+
+
+def legacy_parse_row(row):
+    """The per-row parsing upload_attendance used to do, closures and all"""
+    date_str = row.get('Date')
+    try:
+        date = datetime.strptime(date_str, '%d-%m-%Y').date()
+    except ValueError:
+        raise ValueError(f"Invalid date format: {date_str}. Expected DD-MM-YYYY")
+
+    def parse_time(time_str):
+        if not time_str or time_str.strip() == '':
+            return None
+        time_str = time_str.strip()
+        if '(N)' in time_str or '(n)' in time_str:
+            time_str = time_str.replace('(N)', '').replace('(n)', '').strip()
+        try:
+            return datetime.strptime(time_str, '%H:%M').time()
+        except ValueError:
+            raise ValueError(f"Invalid time format: {time_str}. Expected HH:MM or HH:MM (N)")
+
+    def parse_hours(hours_str):
+        if not hours_str or str(hours_str).strip() == '':
+            return 0
+        hours_str = str(hours_str).strip()
+        if ':' in hours_str:
+            try:
+                parts = hours_str.split(':')
+                hours = int(parts[0])
+                minutes = int(parts[1]) if len(parts) > 1 else 0
+                return hours + (minutes / 60.0)
+            except (ValueError, IndexError):
+                return 0
+        else:
+            try:
+                return float(hours_str)
+            except (ValueError, TypeError):
+                return 0
+
+    return {
+        'date': date,
+        'in1': parse_time(row.get('IN1')),
+        'out1': parse_time(row.get('OUT1')),
+        'in2': parse_time(row.get('IN2')),
+        'out2': parse_time(row.get('OUT2')),
+        'in3': parse_time(row.get('IN3')),
+        'out3': parse_time(row.get('OUT3')),
+        'hours_worked': parse_hours(row.get('Hours Worked')),
+        'overtime': parse_hours(row.get('Overtime')),
+        'status': row.get('Status', 'P'),
+        'shift': row.get('Shift')
+    }
+
+
+def synthetic_rows(count, seed=0):
+    """A month of punches for count/30 employees with realistic repetition"""
+    rng = random.Random(seed)
+    day_in = [f'{h:02d}:{m:02d}' for h in (6, 7, 8) for m in range(0, 60, 5)]
+    day_out = [f'{h:02d}:{m:02d}' for h in (16, 17, 18) for m in range(0, 60, 5)]
+    night_out = [f'{h:02d}:{m:02d} (N)' for h in (5, 6, 7) for m in range(0, 60, 15)]
+    rows = []
+    for i in range(count):
+        night = rng.random() < 0.2
+        rows.append({
+            'EP Number': f'EMP{i // 30:05d}',
+            'Name': 'John Doe',
+            'Company Name': 'ABC Company',
+            'Plant': 'Plant 1',
+            'Department': 'Production',
+            'Trade': 'Welder',
+            'Skill': 'Skilled',
+            'Shift': 'Night' if night else 'Day',
+            'Date': f'{i % 30 + 1:02d}-01-2024',
+            'IN1': '22:00' if night else rng.choice(day_in),
+            'OUT1': rng.choice(night_out if night else day_out),
+            'IN2': '', 'OUT2': '', 'IN3': '', 'OUT3': '',
+            'Hours Worked': rng.choice(['8:00', '8:30', '9:00', '7:45']),
+            'Overtime': rng.choice(['0:00', '0:00', '1:00', '2:30']),
+            'Status': rng.choice(['P', 'P', 'P', 'A', '-0.5']),
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Compare attendance row parsing throughput of the column converters against the old per-row code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of synthetic rows')
+        parser.add_argument('--file', type=str, help='Benchmark an attendance CSV instead of synthetic rows')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation; the best is reported')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], 'rb') as f:
+                reader = open_csv(File(f))
+                rows = list(reader)
+                fieldnames = reader.fieldnames
+        else:
+            rows = synthetic_rows(options['rows'])
+            fieldnames = HEADERS
+
+        def run_legacy():
+            values = []
+            for row in rows:
+                try:
+                    values.append(legacy_parse_row(row))
+                except Exception:
+                    values.append(None)
+            return values
+
+        def run_converters():
+            for convert in (convert_date, convert_time, convert_hours):
+                convert.cache_clear()
+            converter = AttendanceRowConverter(fieldnames)
+            values = []
+            for start in range(0, len(rows), CHUNK_SIZE):
+                chunk_values, errors = converter.convert(rows[start:start + CHUNK_SIZE])
+                values.extend(None if index in errors else value for index, value in enumerate(chunk_values))
+            return values
+
+        results = {}
+        for name, run in (('per-row (old)', run_legacy), ('column converters', run_converters)):
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                output = run()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (best, output)
+            self.stdout.write(f'{name:>20}: {best:.3f}s  {len(rows) / best:,.0f} rows/s')
+
+        (old_time, old_output), (new_time, new_output) = results.values()
+        if old_output != new_output:
+            self.stdout.write(self.style.ERROR('Outputs differ between implementations'))
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {old_time / new_time:.1f}x on {len(rows):,} rows'))
+        self.stdout.write(
+            f'Memo hits: date {convert_date.cache_info().hits:,}, '
+            f'time {convert_time.cache_info().hits:,}, hours {convert_hours.cache_info().hits:,}'
+        )
@@ -0,0 +1,227 @@
+import random
+import re
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from attendance.exports import export_scope
+from attendance.summaries import rebuild_summaries
+from attendance.models import ArchivedAttendanceRecord, AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary, UploadHistory, UploadJob
+from users.models import Company, Notification, SupervisorAssignment, User
+from users.scope import forget_assignments, scope_for
+from users.search import index_users, matching_user_ids
+
+# Plan lines that read a whole table, per database vendor
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT)(\w+)(?!.*USING (?:COVERING |INTEGER PRIMARY )?(?:INDEX|KEY))'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'mysql': re.compile(r'"table_name": "(\w+)",\s+"access_type": "ALL"'),
+}
+
+# Plan lines that sort the rows themselves instead of reading them in index order
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)'),
+    'postgresql': re.compile(r'\bSort\b'),
+    'mysql': re.compile(r'"using_filesort": true'),
+}
+
+STATUSES = ['P', 'P', 'P', 'A', '-0.5', '-1']
+
+# Employee search explained for the list views, matching some synthetic EP numbers
+SEARCH_TERM = 'xp1-12'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the main queries of each view and flag full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', action='store_true',
+                            help='Explain against generated data, rolled back afterwards')
+        parser.add_argument('--companies', type=int, default=20, help='Synthetic companies')
+        parser.add_argument('--employees', type=int, default=500, help='Synthetic employees per company')
+        parser.add_argument('--days', type=int, default=90, help='Synthetic attendance days per employee')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only flagged ones')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN_PATTERNS:
+            raise CommandError(f'No plan checks for {connection.vendor} databases')
+
+        if not options['synthetic']:
+            self.report(options)
+            return
+
+        try:
+            with transaction.atomic():
+                started = time.time()
+                self.seed(options['companies'], options['employees'], options['days'])
+                self.stdout.write(f'Seeded synthetic data in {time.time() - started:.1f}s')
+                # Fresh statistics, or the planner judges the new tables as empty
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                self.report(options)
+                raise Rollback
+        except Rollback:
+            # Cached assignments would outlive the rolled back supervisors
+            for supervisor_id in self.supervisor_ids:
+                forget_assignments(supervisor_id)
+            self.stdout.write('Synthetic data rolled back.')
+
+    def seed(self, companies, employees, days):
+        rng = random.Random(0)
+        master = User.objects.create(username='explain_master', role='master', password='!')
+        company_list = [Company.objects.for_name(f'Explain Company {index}') for index in range(companies)]
+        User.objects.bulk_create([
+            User(username=f'explain_admin_{index}', role='user1', company_name=company.name, company=company,
+                 password='!')
+            for index, company in enumerate(company_list)
+        ] + [
+            User(username=f'explain_supervisor_{index}', role='user2', company_name=company.name, company=company,
+                 password='!')
+            for index, company in enumerate(company_list)
+        ] + [
+            User(username=f'explain_ep_{index}_{number}', ep_number=f'EXP{index}-{number}', role='user3',
+                 company_name=company.name, company=company, password='!')
+            for index, company in enumerate(company_list) for number in range(employees)
+        ], batch_size=2000)
+
+        index_users(User.objects.filter(username__startswith='explain_').values_list('id', flat=True))
+
+        supervisors = {user.company_id: user for user in User.objects.filter(username__startswith='explain_supervisor_')}
+        self.supervisor_ids = [user.pk for user in supervisors.values()]
+        employee_ids = list(User.objects.filter(username__startswith='explain_ep_').values_list('id', 'company_id'))
+        SupervisorAssignment.objects.bulk_create([
+            SupervisorAssignment(supervisor=supervisors[company_id], employee_id=user_id,
+                                 start_date=date.today(), assigned_by=master)
+            for user_id, company_id in employee_ids[::10]
+        ], batch_size=2000)
+
+        first_day = date.today() - timedelta(days=days)
+        batch = []
+        for user_id, company_id in employee_ids:
+            for offset in range(days):
+                batch.append(AttendanceRecord(
+                    user_id=user_id, company_id=company_id, date=first_day + timedelta(days=offset), status=rng.choice(STATUSES),
+                    hours_worked=Decimal('8.00'), overtime=Decimal(rng.choice(['0', '1.50'])),
+                ))
+            if len(batch) >= 10000:
+                AttendanceRecord.objects.bulk_create(batch, batch_size=2000)
+                batch = []
+        AttendanceRecord.objects.bulk_create(batch, batch_size=2000)
+        rebuild_summaries()
+
+    def sample_users(self):
+        """A user of each role, preferring the company with the most employees"""
+        company = (User.objects.filter(role='user3').exclude(company__isnull=True)
+                   .values('company').annotate(count=Count('id')).order_by('-count')
+                   .values_list('company', flat=True).first())
+        supervisor_id = (SupervisorAssignment.objects.values('supervisor')
+                         .annotate(count=Count('id')).order_by('-count')
+                         .values_list('supervisor', flat=True).first())
+        return {
+            'master': User.objects.filter(role='master').first(),
+            'user1': User.objects.filter(role='user1', company=company).first(),
+            'user2': User.objects.filter(id=supervisor_id).first(),
+            'user3': User.objects.filter(role='user3', company=company).first(),
+        }
+
+    def view_queries(self, users):
+        """(label, queryset) for the main queries of the list, dashboard, export and upload views"""
+        queries = []
+        month_ago = date.today() - timedelta(days=30)
+        newest = AttendanceRecord.objects.order_by('-date', '-id').first()
+
+        master = users['master']
+        if master:
+            queries += [
+                ('dashboard: master recent uploads', AttendanceRecord.objects.select_related('user').order_by('-created_at')[:10]),
+                ('dashboard: master company count', User.objects.filter(role='user1').values('company_id').distinct()),
+                ('upload history: master', UploadHistory.objects.order_by('-upload_date')[:20]),
+            ]
+
+        for role, user in users.items():
+            if user is None or role == 'user3':
+                continue
+            _, records = export_scope(user)
+            queries += [
+                (f'attendance list: {role} first page', records.select_related('user').order_by('-date', '-id')[:26]),
+                (f'attendance list: {role} date range', records.filter(date__gte=month_ago).order_by('-date', '-id')[:26]),
+                (f'attendance list: {role} status filter', records.filter(status='A').order_by('-date', '-id')[:26]),
+                (f'export: {role} month', records.filter(date__gte=month_ago).select_related('user')),
+                (f'attendance list: {role} employee search',
+                 records.filter(user__in=matching_user_ids(SEARCH_TERM)).order_by('-date', '-id')[:26]),
+            ]
+            archived = scope_for(user).records(ArchivedAttendanceRecord)
+            queries.append((f'attendance list: {role} archived range',
+                            archived.filter(date__gte=month_ago).order_by('-date', '-id')[:26]))
+            if newest:
+                queries.append((
+                    f'attendance list: {role} next page',
+                    records.filter(Q(date__lt=newest.date) | Q(date=newest.date, id__lt=newest.id)).order_by('-date', '-id')[:26]
+                ))
+
+        admin = users['user1']
+        if admin:
+            queries += [
+                ('dashboard: company employees', User.objects.filter(company_id=admin.company_id, role='user3')),
+                ('dashboard: company recent attendance',
+                 AttendanceRecord.objects.filter(company_id=admin.company_id).order_by('-date')[:10]),
+                ('user list: company', User.objects.filter(company_id=admin.company_id).order_by('id')[:26]),
+                ('user list: company search',
+                 User.objects.filter(company_id=admin.company_id, id__in=matching_user_ids(SEARCH_TERM)).order_by('id')[:26]),
+                ('dashboard: company month summary',
+                 DailyAttendanceSummary.objects.filter(company_id=admin.company_id, date__gte=month_ago)
+                 .values('status').annotate(count=Sum('record_count'))),
+                ('upload history: company admin', UploadHistory.objects.filter(uploaded_by=admin).order_by('-upload_date')[:5]),
+                ('upload jobs: company admin', UploadJob.objects.filter(uploaded_by=admin, kind='attendance')[:5]),
+            ]
+
+        supervisor = users['user2']
+        if supervisor:
+            queries.append(('dashboard: supervisor assignments',
+                            SupervisorAssignment.objects.filter(supervisor=supervisor).values_list('employee_id', flat=True)))
+
+        employee = users['user3']
+        if employee:
+            queries += [
+                ('dashboard: employee summary',
+                 MonthlyAttendanceSummary.objects.filter(user=employee).values('status').annotate(count=Sum('record_count'))),
+                ('navigation: unread notifications', Notification.objects.unread().filter(user=employee).order_by()),
+            ]
+        return queries
+
+    def explain(self, queryset):
+        if connection.vendor == 'mysql':
+            return queryset.explain(format='json')
+        return queryset.explain()
+
+    def report(self, options):
+        full_scan = FULL_SCAN_PATTERNS[connection.vendor]
+        sort = SORT_PATTERNS[connection.vendor]
+        users = self.sample_users()
+        flagged = 0
+
+        for label, queryset in self.view_queries(users):
+            plan = self.explain(queryset)
+            scans = sorted(set(full_scan.findall(plan)))
+            sorts = bool(sort.search(plan))
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}: {", ".join(scans)}'))
+            elif sorts:
+                self.stdout.write(self.style.WARNING(f'SORT       {label}'))
+            else:
+                self.stdout.write(f'ok         {label}')
+            if scans or sorts or options['verbose_plans']:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if flagged:
+            self.stdout.write(self.style.ERROR(f'{flagged} queries read a whole table.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full table scans.'))
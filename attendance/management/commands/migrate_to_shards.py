@@ -0,0 +1,153 @@
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F, Max
+from django.db.models.constants import OnConflict
+from attendance.archive import archive_before, archive_horizon
+from attendance.export_cache import touch_employee_data
+from attendance.models import ArchivedAttendanceRecord, AttendanceRecord
+from attendance.purge import PURGE_BATCH_SIZE, delete_where_in
+from attendance.summaries import rebuild_summaries
+from labour_management.shards import (
+    SHARD_ID_SPAN, company_filter, record_aliases, shard_aliases, shards_configured, sync_mirrors, use_shard,
+)
+from users.dashboard import bump_all_dashboards
+
+RECORD_MODELS = [AttendanceRecord, ArchivedAttendanceRecord]
+
+
+def highest_id(alias):
+    return max(model.objects.using(alias).aggregate(top=Max('id'))['top'] or 0 for model in RECORD_MODELS)
+
+
+def reserve_ids(alias, start):
+    """Make the next attendance record created in alias get id start"""
+    connection = connections[alias]
+    table = AttendanceRecord._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start - 1])
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {int(start)}')
+        else:
+            raise CommandError(f'Reserving attendance ids is not supported on {connection.vendor}')
+
+
+def copy_rows(model, rows, alias):
+    """
+    INSERT rows, read with values_list() of every concrete field, into
+    alias as they are, ids and timestamps included; ids it has are skipped.
+    """
+    connection = connections[alias]
+    fields = model._meta.concrete_fields
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    suffix = connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'{insert} {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders}) {suffix}',
+            [[field.get_db_prep_save(value, connection) for field, value in zip(fields, row)] for row in rows],
+        )
+
+
+class Command(BaseCommand):
+    help = ("Set up the COMPANY_SHARDS databases and move each company's attendance into the database "
+            "that holds it, e.g. after adding a company to COMPANY_SHARDS or moving an employee to a "
+            "company in another database. Safe to run again after an interruption.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Records moved per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the records that would move, in the databases already set up')
+
+    def handle(self, *args, **options):
+        if not shards_configured():
+            raise CommandError('COMPANY_SHARDS is empty: all attendance is in the default database')
+        started = time.time()
+        batch_size = options['batch_size']
+
+        if options['dry_run']:
+            for source in self.migrated(record_aliases()):
+                for target in record_aliases():
+                    if target != source:
+                        count = sum(self.leaving(model, source, target).count() for model in RECORD_MODELS)
+                        self.stdout.write(f'{count} records would move from {source} to {target}.')
+            return
+
+        for alias in shard_aliases():
+            call_command('migrate', database=alias, interactive=False, verbosity=0)
+            sync_mirrors(alias, batch_size=batch_size)
+            self.stdout.write(f'{alias}: schema migrated, companies, users and assignments copied')
+        self.reserve_id_ranges()
+
+        moved = 0
+        for source in record_aliases():
+            for target in record_aliases():
+                if target != source:
+                    moved += self.move(source, target, batch_size)
+        for alias in record_aliases():
+            with use_shard(alias):
+                horizon = archive_horizon()
+            if horizon:
+                # Live records that moved in for months this database has archived
+                archive_before(horizon, batch_size=batch_size, aliases=[alias])
+        daily, monthly = rebuild_summaries()
+        bump_all_dashboards()
+        touch_employee_data()
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} records and rebuilt {daily} daily and {monthly} monthly summary rows '
+            f'in {time.time() - started:.1f}s'
+        ))
+
+    def migrated(self, aliases):
+        return [alias for alias in aliases
+                if AttendanceRecord._meta.db_table in connections[alias].introspection.table_names()]
+
+    def reserve_id_ranges(self):
+        """
+        Give each shard that hasn't created records yet its own range of
+        ids, above every id in use, so ids stay unique across databases.
+        """
+        next_start = (max(highest_id(alias) for alias in record_aliases()) // SHARD_ID_SPAN + 1) * SHARD_ID_SPAN
+        for alias in shard_aliases():
+            if highest_id(alias) < SHARD_ID_SPAN:
+                reserve_ids(alias, next_start)
+                self.stdout.write(f'{alias}: new attendance ids start at {next_start}')
+                next_start += SHARD_ID_SPAN
+
+    def leaving(self, model, source, target):
+        """Records in source whose employee's company keeps its attendance in target"""
+        return model.objects.using(source).filter(company_filter(target, prefix='user__'))
+
+    def move(self, source, target, batch_size):
+        """
+        Copy the records leaving source into target, keeping their ids, with
+        the employee's current company, then delete them from source. A
+        record target already has for the same employee and day is kept
+        instead of the one moving in.
+        """
+        moved = 0
+        for model in RECORD_MODELS:
+            fields = [F('user__company_id') if field.attname == 'company_id' else field.attname
+                      for field in model._meta.concrete_fields]
+            id_index = [field.primary_key for field in model._meta.concrete_fields].index(True)
+            records = self.leaving(model, source, target).order_by('id')
+            last_id = 0
+            while True:
+                rows = list(records.filter(id__gt=last_id).values_list(*fields)[:batch_size])
+                if not rows:
+                    break
+                ids = [row[id_index] for row in rows]
+                # Copied before the source commits its delete: a batch retried after a
+                # failure between the two is skipped in target and deleted again
+                with transaction.atomic(using=source), transaction.atomic(using=target):
+                    copy_rows(model, rows, target)
+                    delete_where_in(model, 'id', ids, using=source)
+                last_id = ids[-1]
+                moved += len(rows)
+                self.stdout.write(f'{source} -> {target}: {moved} records moved')
+        return moved
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from attendance.jobs import HEARTBEAT_SECONDS, claim_next_job, renew_leases, requeue_interrupted_jobs, run_job
+
+class Command(BaseCommand):
+    help = 'Process queued attendance and user uploads in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of uploads (from different companies) processed at once')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between queue checks')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        
+        self.stdout.write(f'Upload worker started with {concurrency} slots')
+        running = {}  # future -> job
+        heartbeat = 0
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                if time.monotonic() - heartbeat >= HEARTBEAT_SECONDS:
+                    # Keep our jobs' leases, and take back those of workers that stopped
+                    renew_leases([job.id for job in running.values()])
+                    requeued = requeue_interrupted_jobs()
+                    if requeued:
+                        self.stdout.write(self.style.WARNING(f'Re-queued {requeued} interrupted upload jobs'))
+                    heartbeat = time.monotonic()
+                
+                for future in [f for f in running if f.done()]:
+                    running.pop(future)
+                    try:
+                        job = future.result()
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(f'Upload job crashed: {e}'))
+                        continue
+                    style = self.style.SUCCESS if job.status == 'completed' else self.style.ERROR
+                    self.stdout.write(style(f'Finished {job}'))
+                
+                while len(running) < concurrency:
+                    # Running jobs' companies are read from the database, where narrow_company() updates them
+                    job = claim_next_job()
+                    if job is None:
+                        break
+                    self.stdout.write(f'Started {job}')
+                    running[pool.submit(run_job, job.id)] = job
+                
+                if options['once'] and not running:
+                    break
+                time.sleep(min(options['poll_interval'], 0.5) if running else options['poll_interval'])
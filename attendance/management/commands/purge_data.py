@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from attendance.purge import PURGE_BATCH_SIZE, Purge, date_range_params, purge_description, purge_summary
+from users.models import Company
+
+
+class Command(BaseCommand):
+    help = ("Delete a company's data, the blank company's data or a date range of attendance in batches. "
+            "The delete pages queue the same purge for the upload worker.")
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--company', help='Name of the company to delete with all its users')
+        target.add_argument('--blank', action='store_true', help='Delete users and attendance without a company')
+        target.add_argument('--start-date', help='First day of attendance to delete (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last day of attendance to delete (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        if options['company']:
+            company = Company.objects.filter(name=options['company']).first()
+            if company is None:
+                raise CommandError(f"Company {options['company']} not found")
+            params = {'company_id': company.pk, 'company_name': company.name}
+        elif options['blank']:
+            params = {'blank': True}
+        else:
+            params = date_range_params(options['start_date'], options['end_date'])
+            if params is None:
+                raise CommandError('--start-date and --end-date must both be dates (YYYY-MM-DD)')
+
+        def report(state):
+            self.stdout.write(f"{state['phase']}: {state['attendance']} attendance records, {state['users']} users deleted")
+
+        # Safe to run again after an interruption: whatever is left is deleted
+        purge = Purge(params, batch_size=options['batch_size'], on_batch=report)
+        state = purge.run()
+        self.stdout.write(self.style.SUCCESS(purge_summary(purge_description(params), state)))
@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from attendance.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and monthly attendance summaries from the attendance records"
+
+    def handle(self, *args, **options):
+        started = time.time()
+        daily, monthly = rebuild_summaries()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {daily} daily and {monthly} monthly summary rows in {time.time() - started:.1f}s'
+        ))
@@ -0,0 +1,30 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from attendance.error_files import ERROR_DIR, sweep_error_files
+from attendance.purge import report_storage
+from attendance.validation import VALIDATION_DIR, VALIDATION_TIMEOUT, sweep_parsed_files
+
+
+class Command(BaseCommand):
+    help = 'Delete upload error reports, validation files and cleanup reports past their retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.UPLOAD_FILE_RETENTION_DAYS,
+                            help='Keep files modified within this many days')
+        parser.add_argument('--dry-run', action='store_true', help='List the files without deleting them')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = sweep_error_files(cutoff, directories=(ERROR_DIR, VALIDATION_DIR), dry_run=options['dry_run'])
+        deleted += sweep_error_files(cutoff, directories=('',), dry_run=options['dry_run'], storage=report_storage())
+        # Parsed rows of validations are useless once the validation has expired
+        deleted += sweep_parsed_files(timezone.now() - timedelta(seconds=VALIDATION_TIMEOUT), dry_run=options['dry_run'])
+
+        for name in deleted:
+            self.stdout.write(f'  {name}')
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {len(deleted)} files older than {options["days"]} days.')
+        )
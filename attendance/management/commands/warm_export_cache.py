@@ -0,0 +1,53 @@
+import calendar
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from attendance.export_cache import EXPORT_EXTENSIONS, CachedExport
+from attendance.exports import export_queryset, export_scope
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Pre-build this month's attendance exports for every company and supervisor"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', action='append', choices=list(EXPORT_EXTENSIONS), dest='formats',
+                            help='Export format to build; repeat for several (default xlsx)')
+        parser.add_argument('--month', help='Month to export as YYYY-MM (default current month)')
+
+    def handle(self, *args, **options):
+        formats = options['formats'] or ['xlsx']
+        try:
+            month = date.fromisoformat(f"{options['month']}-01") if options['month'] else date.today().replace(day=1)
+        except ValueError:
+            raise CommandError('--month must look like YYYY-MM')
+        last_day = month.replace(day=calendar.monthrange(month.year, month.month)[1])
+        # Same strings the export form posts, so the requests hit these artifacts
+        start_date, end_date = month.isoformat(), last_day.isoformat()
+
+        # One user per distinct scope: masters share one, company admins one per company
+        users = list(User.objects.filter(role='master', is_active=True).order_by('id')[:1])
+        users += list(User.objects.filter(role='user1', is_active=True).order_by('company_name', 'id'))
+        users += list(User.objects.filter(role='user2', is_active=True).order_by('id'))
+
+        built = cached = 0
+        seen = set()
+        for user in users:
+            scope, _ = export_scope(user)
+            if scope is None or scope in seen:
+                continue
+            seen.add(scope)
+            attendance_records = export_queryset(user, start_date, end_date)
+            for export_format in formats:
+                export = CachedExport(scope, attendance_records, export_format, start_date, end_date)
+                artifact = export.open_cached()
+                if artifact is None:
+                    artifact = export.build()
+                    built += 1
+                else:
+                    cached += 1
+                artifact.close()
+            self.stdout.write(f'  {scope[:60]}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {built} exports for {start_date} to {end_date}, {cached} were already cached.'
+        ))
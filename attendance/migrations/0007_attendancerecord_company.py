@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_user_companies(apps, schema_editor):
+    AttendanceRecord = apps.get_model('attendance', 'AttendanceRecord')
+    User = apps.get_model('users', 'User')
+    AttendanceRecord.objects.using(schema_editor.connection.alias).update(
+        company=models.Subquery(User.objects.filter(pk=models.OuterRef('user_id')).values('company')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_company'),
+        ('attendance', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancerecord',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attendance_records', to='users.company'),
+        ),
+        migrations.RunPython(copy_user_companies, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['company', 'date', 'id'], name='attendance_company_date_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+
+
+def build_summaries(apps, schema_editor):
+    AttendanceRecord = apps.get_model('attendance', 'AttendanceRecord')
+    DailyAttendanceSummary = apps.get_model('attendance', 'DailyAttendanceSummary')
+    MonthlyAttendanceSummary = apps.get_model('attendance', 'MonthlyAttendanceSummary')
+    db = schema_editor.connection.alias
+    totals = {
+        'total_count': models.Count('id'),
+        'total_hours': models.Sum('hours_worked'),
+        'total_overtime': models.Sum('overtime'),
+    }
+
+    daily = AttendanceRecord.objects.using(db).order_by().annotate(
+        summary_department=Coalesce('user__department', models.Value('')),
+        summary_shift=Coalesce(NullIf('shift', models.Value('')), 'user__shift', models.Value('')),
+    ).values('company_id', 'date', 'summary_department', 'summary_shift', 'status').annotate(**totals)
+    DailyAttendanceSummary.objects.using(db).bulk_create([
+        DailyAttendanceSummary(
+            company_id=row['company_id'], date=row['date'], department=row['summary_department'],
+            shift=row['summary_shift'], status=row['status'], record_count=row['total_count'],
+            hours_worked=row['total_hours'] or 0, overtime=row['total_overtime'] or 0,
+        )
+        for row in daily
+    ], batch_size=1000)
+
+    monthly = AttendanceRecord.objects.using(db).order_by().annotate(summary_month=TruncMonth('date')).values(
+        'user_id', 'summary_month', 'status'
+    ).annotate(**totals)
+    MonthlyAttendanceSummary.objects.using(db).bulk_create([
+        MonthlyAttendanceSummary(
+            user_id=row['user_id'], month=row['summary_month'], status=row['status'],
+            record_count=row['total_count'], hours_worked=row['total_hours'] or 0,
+            overtime=row['total_overtime'] or 0,
+        )
+        for row in monthly
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_company'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('attendance', '0007_attendancerecord_company'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('status', models.CharField(choices=[('P', 'Present'), ('A', 'Absent'), ('-0.5', 'Half Day'), ('-1', 'Full Day Deduction')], max_length=5)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('hours_worked', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overtime', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='monthly_summary_month_idx')],
+                'unique_together': {('user', 'month', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('department', models.CharField(blank=True, default='', max_length=100)),
+                ('shift', models.CharField(blank=True, default='', max_length=50)),
+                ('status', models.CharField(choices=[('P', 'Present'), ('A', 'Absent'), ('-0.5', 'Half Day'), ('-1', 'Full Day Deduction')], max_length=5)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('hours_worked', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overtime', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to='users.company')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='daily_summary_date_idx')],
+                'unique_together': {('company', 'date', 'department', 'shift', 'status')},
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0008_attendance_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='kind',
+            field=models.CharField(choices=[('attendance', 'Attendance Upload'), ('users', 'User Upload'), ('purge', 'Data Purge')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0005_company'),
+        ('attendance', '0009_purge_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAttendanceRecord',
+            fields=[
+                ('date', models.DateField()),
+                ('shift', models.CharField(blank=True, max_length=50, null=True)),
+                ('in1', models.TimeField(blank=True, null=True)),
+                ('out1', models.TimeField(blank=True, null=True)),
+                ('in2', models.TimeField(blank=True, null=True)),
+                ('out2', models.TimeField(blank=True, null=True)),
+                ('in3', models.TimeField(blank=True, null=True)),
+                ('out3', models.TimeField(blank=True, null=True)),
+                ('hours_worked', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('overtime', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('status', models.CharField(choices=[('P', 'Present'), ('A', 'Absent'), ('-0.5', 'Half Day'), ('-1', 'Full Day Deduction')], default='P', max_length=5)),
+                ('supervisor_remarks', models.TextField(blank=True, null=True)),
+                ('employee_remarks', models.TextField(blank=True, null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('company', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_attendance_records', to='users.company')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_attendance_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'id'], name='attendance_archive_date_idx'), models.Index(fields=['company', 'date', 'id'], name='attendance_archive_company_idx'), models.Index(fields=['archived_at'], name='attendance_archive_moved_idx')],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
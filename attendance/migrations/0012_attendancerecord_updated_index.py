@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0011_uploadjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['updated_at'], name='attendance_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0012_attendancerecord_updated_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='kind',
+            field=models.CharField(choices=[('attendance', 'Attendance Upload'), ('users', 'User Upload'), ('purge', 'Data Purge'), ('validation', 'Attendance Validation')], max_length=20),
+        ),
+    ]
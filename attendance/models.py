@@ -1,7 +1,30 @@
 from django.db import models
-from users.models import User
+from users.models import Company, User
 
-class AttendanceRecord(models.Model):
+def format_hours(value):
+    """Convert decimal hours to HH:MM format"""
+    if not value:
+        return "00:00"
+    
+    total_minutes = int(value * 60)
+    hours = total_minutes // 60
+    minutes = total_minutes % 60
+    return f"{hours:02d}:{minutes:02d}"
+
+class AttendanceQuerySet(models.QuerySet):
+    def delete(self):
+        # A delete leaves nothing for the duplicate upload check to see, see attendance.ingestion
+        deleted = super().delete()
+        if deleted[0]:
+            UploadHistory.objects.forget_file_hashes()
+        return deleted
+
+    def delete_moved(self):
+        """Delete records that live on elsewhere: moved to the archive and back, or replaced by a moved one"""
+        return super().delete()
+
+class AttendanceFields(models.Model):
+    """Columns shared by live and archived attendance records"""
     STATUS_CHOICES = [
         ('P', 'Present'),
         ('A', 'Absent'),
@@ -9,7 +32,6 @@ class AttendanceRecord(models.Model):
         ('-1', 'Full Day Deduction'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendance_records')
     date = models.DateField()
     shift = models.CharField(max_length=50, null=True, blank=True)
     in1 = models.TimeField(null=True, blank=True)
@@ -23,44 +45,198 @@ class AttendanceRecord(models.Model):
     status = models.CharField(max_length=5, choices=STATUS_CHOICES, default='P')
     supervisor_remarks = models.TextField(null=True, blank=True)
     employee_remarks = models.TextField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = AttendanceQuerySet.as_manager()
     
     class Meta:
-        unique_together = ['user', 'date']
-        ordering = ['-date']
+        abstract = True
+    
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        UploadHistory.objects.forget_file_hashes()
+        return deleted
     
     def get_hours_formatted(self):
         """Convert decimal hours to HH:MM format"""
-        if not self.hours_worked:
-            return "00:00"
-        
-        total_minutes = int(self.hours_worked * 60)
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
-        return f"{hours:02d}:{minutes:02d}"
+        return format_hours(self.hours_worked)
     
     def get_overtime_formatted(self):
         """Convert decimal overtime to HH:MM format"""
-        if not self.overtime:
-            return "00:00"
-        
-        total_minutes = int(self.overtime * 60)
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
-        return f"{hours:02d}:{minutes:02d}"
+        return format_hours(self.overtime)
     
     def __str__(self):
         return f"{self.user.username} - {self.date} ({self.status})"
 
+class AttendanceRecord(AttendanceFields):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendance_records')
+    # Copy of user.company kept in sync by User.save() and the importer;
+    # indexed together with date below
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, blank=True, db_index=False,
+                                related_name='attendance_records')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+        indexes = [
+            # Date ranges and the (date, id) seek order of the attendance list
+            models.Index(fields=['date', 'id'], name='attendance_date_id_idx'),
+            models.Index(fields=['status', 'date'], name='attendance_status_date_idx'),
+            # Company-scoped lists, exports, counts and deletes
+            models.Index(fields=['company', 'date', 'id'], name='attendance_company_date_idx'),
+            # Latest records on the master dashboard
+            models.Index(fields=['created_at'], name='attendance_created_idx'),
+            # Duplicate upload checks
+            models.Index(fields=['updated_at'], name='attendance_updated_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.company_id is None and self.user_id:
+            self.company_id = User.objects.filter(pk=self.user_id).values_list('company_id', flat=True).first()
+        super().save(*args, **kwargs)
+
+class ArchivedAttendanceRecord(AttendanceFields):
+    """
+    An attendance record moved out of AttendanceRecord by attendance.archive,
+    keeping its id and timestamps. Every record dated before the archive
+    horizon is here and nowhere else.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_attendance_records')
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, blank=True, db_index=False,
+                                related_name='archived_attendance_records')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+    
+    # Read-only in the attendance list
+    archived = True
+    
+    class Meta:
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'id'], name='attendance_archive_date_idx'),
+            models.Index(fields=['company', 'date', 'id'], name='attendance_archive_company_idx'),
+            # Duplicate upload checks
+            models.Index(fields=['archived_at'], name='attendance_archive_moved_idx'),
+        ]
+
+class DailyAttendanceSummary(models.Model):
+    """
+    Attendance per company, day, department, shift and status, kept up to
+    date by attendance.summaries whenever records are written or deleted.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='daily_summaries')
+    date = models.DateField()
+    department = models.CharField(max_length=100, blank=True, default='')
+    shift = models.CharField(max_length=50, blank=True, default='')
+    status = models.CharField(max_length=5, choices=AttendanceRecord.STATUS_CHOICES)
+    record_count = models.PositiveIntegerField(default=0)
+    hours_worked = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['company', 'date', 'department', 'shift', 'status']
+        indexes = [
+            models.Index(fields=['date'], name='daily_summary_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id} - {self.date} {self.department}/{self.shift} ({self.status}): {self.record_count}"
+
+class MonthlyAttendanceSummary(models.Model):
+    """Attendance per employee, month and status, maintained like DailyAttendanceSummary"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_summaries')
+    # First day of the month
+    month = models.DateField()
+    status = models.CharField(max_length=5, choices=AttendanceRecord.STATUS_CHOICES)
+    record_count = models.PositiveIntegerField(default=0)
+    hours_worked = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['user', 'month', 'status']
+        indexes = [
+            models.Index(fields=['month'], name='monthly_summary_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.month:%Y-%m} ({self.status}): {self.record_count}"
+
+class UploadHistoryManager(models.Manager):
+    def forget_file_hashes(self):
+        """
+        Deleting attendance can't be seen by find_duplicate_upload, so
+        deletes clear the stored file hashes and the next upload of any file
+        is processed in full.
+        """
+        return self.exclude(file_hash='').update(file_hash='')
+
 class UploadHistory(models.Model):
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     filename = models.CharField(max_length=255)
     total_rows = models.IntegerField()
     accepted_rows = models.IntegerField()
     rejected_rows = models.IntegerField()
+    # Accepted rows identical to the stored record, which were not written
+    unchanged_rows = models.IntegerField(default=0)
+    # SHA-256 of the uploaded file, used to recognise an exact re-upload
+    file_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
     error_file = models.FileField(upload_to='upload_errors/', null=True, blank=True)
     upload_date = models.DateTimeField(auto_now_add=True)
     
+    objects = UploadHistoryManager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['uploaded_by', 'upload_date'], name='upload_history_user_date_idx'),
+            models.Index(fields=['upload_date'], name='upload_history_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} - {self.upload_date}"
+class UploadJob(models.Model):
+    KIND_CHOICES = [
+        ('attendance', 'Attendance Upload'),
+        ('users', 'User Upload'),
+        ('purge', 'Data Purge'),
+        ('validation', 'Attendance Validation'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_jobs')
+    # Jobs sharing a company key run one after another; '*' (every company) runs alone
+    company_name = models.CharField(max_length=200, blank=True, default='')
+    file = models.FileField(upload_to='upload_jobs/', null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    session_id = models.CharField(max_length=36, blank=True, default='')
+    upload_history = models.ForeignKey(UploadHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    # What a purge job deletes, see attendance.purge
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker running the job; a job whose lease ran out is re-queued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['uploaded_by', 'kind', 'created_at'], name='upload_job_user_kind_idx'),
+        ]
+    
     def __str__(self):
-        return f"{self.filename} - {self.upload_date}"
\ No newline at end of file
+        return f"{self.get_kind_display()} #{self.pk} - {self.filename} ({self.status})"
@@ -0,0 +1,168 @@
+import hashlib
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from labour_management.shards import CombinedQuerySet
+
+PER_PAGE = 25
+
+# Query parameters that carry the position; everything else is kept in page links
+CURSOR_PARAMS = ('after', 'before', 'page', 'count')
+
+# How long a list's total is reused before it is counted again
+COUNT_TIMEOUT = 5 * 60
+
+# Estimated totals stop counting here and show as "COUNT_LIMIT+"
+COUNT_LIMIT = 10000
+
+CURSOR_SEPARATOR = '_'
+
+
+def count_up_to(queryset, limit):
+    """queryset.count(), reading at most limit rows"""
+    if isinstance(queryset, CombinedQuerySet):
+        return queryset.count_up_to(limit)
+    return queryset.order_by().values('pk')[:limit].count()
+
+
+def estimated_count(queryset):
+    """
+    Total rows of the query, counted at most once per COUNT_TIMEOUT and
+    only up to COUNT_LIMIT + 1, so a new filter never scans every match
+    """
+    key = 'list_count_' + hashlib.sha1(str(queryset.query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = count_up_to(queryset, COUNT_LIMIT + 1)
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+class KeysetPage:
+    """
+    One page of a seek-paginated list. Positions are carried as cursors
+    built from the ordering fields of the first and last row, so each page
+    is a range scan on those fields instead of an OFFSET and a COUNT.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, query, count=None,
+                 exact_count=False, count_is_capped=False):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.exact_count = exact_count
+        # There are more than count rows
+        self.count_is_capped = count_is_capped
+        self._query = query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _url(self, param, cursor):
+        return f'?{self._query}&{param}={cursor}' if self._query else f'?{param}={cursor}'
+
+    @property
+    def next_url(self):
+        return self._url('after', self.next_cursor) if self.has_next else None
+
+    @property
+    def previous_url(self):
+        return self._url('before', self.previous_cursor) if self.has_previous else None
+
+
+def _cursor(obj, fields):
+    return CURSOR_SEPARATOR.join(str(getattr(obj, name)) for name, _ in fields)
+
+
+def _parse_cursor(model, fields, cursor):
+    """The field values encoded in cursor, or None if it doesn't decode"""
+    parts = cursor.split(CURSOR_SEPARATOR)
+    if len(parts) != len(fields):
+        return None
+    try:
+        return [model._meta.get_field(name).to_python(part) for (name, _), part in zip(fields, parts)]
+    except ValidationError:
+        return None
+
+
+def _seek(fields, values, forward):
+    """Rows strictly past values in the (possibly reversed) list order"""
+    condition = Q()
+    for index, ((name, descending), value) in enumerate(zip(fields, values)):
+        lookup = 'lt' if descending == forward else 'gt'
+        ties = {fields[i][0]: values[i] for i in range(index)}
+        condition |= Q(**ties, **{f'{name}__{lookup}': value})
+    return condition
+
+
+def keyset_page(request, queryset, fields, per_page=PER_PAGE):
+    """
+    Page queryset by the unique ordering fields, given as (name, descending)
+    pairs, using the after/before cursor in the request. The total is an
+    estimate cached for a few minutes, capped at COUNT_LIMIT, unless the
+    request asks for count=exact.
+    """
+    ordering = [f'-{name}' if descending else name for name, descending in fields]
+    reverse_ordering = [name if descending else f'-{name}' for name, descending in fields]
+
+    params = request.GET.copy()
+    for param in CURSOR_PARAMS:
+        params.pop(param, None)
+    exact_count = request.GET.get('count') == 'exact'
+    if exact_count:
+        params['count'] = 'exact'
+    count = queryset.count() if exact_count else estimated_count(queryset)
+    count_is_capped = not exact_count and count > COUNT_LIMIT
+    if count_is_capped:
+        count = COUNT_LIMIT
+
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    values = _parse_cursor(queryset.model, fields, before or after or '')
+
+    if values is not None and before:
+        rows = list(queryset.filter(_seek(fields, values, forward=False)).order_by(*reverse_ordering)[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if values is not None:
+            queryset = queryset.filter(_seek(fields, values, forward=True))
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = values is not None
+
+    return KeysetPage(
+        rows,
+        has_next=has_next and bool(rows),
+        has_previous=has_previous and bool(rows),
+        next_cursor=_cursor(rows[-1], fields) if rows else None,
+        previous_cursor=_cursor(rows[0], fields) if rows else None,
+        query=params.urlencode(),
+        count=count,
+        exact_count=exact_count,
+        count_is_capped=count_is_capped,
+    )
+
+
+def page_links(page):
+    """Cursor and count fields for a JSON response listing page"""
+    return {
+        'count': page.count,
+        'count_is_exact': page.exact_count,
+        'count_is_capped': page.count_is_capped,
+        'next_cursor': page.next_cursor if page.has_next else None,
+        'previous_cursor': page.previous_cursor if page.has_previous else None,
+        'next_url': page.next_url,
+        'previous_url': page.previous_url,
+    }
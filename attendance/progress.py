@@ -0,0 +1,99 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+PROGRESS_TIMEOUT = 60 * 60
+
+# Coalesce progress writes: at most one per interval unless this many rows went by
+WRITE_INTERVAL = 1.0
+WRITE_EVERY_ROWS = 5000
+
+FINAL_STATUSES = ('completed', 'failed')
+
+# Longest a progress request is held open. The web process runs sync workers
+# (see Procfile), each tied up by a waiting client, so clients ask again instead.
+MAX_WAIT = 2.0
+
+
+def progress_cache():
+    """Cache shared by web and worker processes, see CACHES['progress'] in settings"""
+    return caches['progress' if 'progress' in settings.CACHES else 'default']
+
+
+def progress_key(session_id):
+    return f'upload_progress_{session_id}'
+
+
+def get_progress(session_id):
+    return progress_cache().get(progress_key(session_id))
+
+
+def set_progress(session_id, **data):
+    data.setdefault('updated_at', time.time())
+    progress_cache().set(progress_key(session_id), data, PROGRESS_TIMEOUT)
+    return data
+
+
+def wait_for_progress(session_id, since_version, timeout=MAX_WAIT, poll_interval=0.5):
+    """
+    Long-poll helper: return progress once its version moves past
+    since_version, the upload finishes, or timeout seconds (at most
+    MAX_WAIT) pass.
+    """
+    deadline = time.monotonic() + min(timeout, MAX_WAIT)
+    while True:
+        progress_data = get_progress(session_id)
+        if progress_data is None:
+            return None
+        if progress_data.get('version', 0) > since_version or progress_data.get('status') in FINAL_STATUSES:
+            return progress_data
+        if time.monotonic() >= deadline:
+            return progress_data
+        time.sleep(poll_interval)
+
+
+class ProgressTracker:
+    """
+    Publishes upload progress to the shared progress cache. Calls to
+    update() are cheap; the store is only written when WRITE_INTERVAL
+    seconds or WRITE_EVERY_ROWS rows have passed since the last write.
+    """
+
+    def __init__(self, session_id, total=0, interval=WRITE_INTERVAL, every_rows=WRITE_EVERY_ROWS):
+        self.session_id = session_id
+        self.interval = interval
+        self.every_rows = every_rows
+        self.data = {
+            'total': total,
+            'processed': 0,
+            'success': 0,
+            'errors': 0,
+            'status': 'processing',
+            # Carry on from the "queued" marker so long-pollers see every write as new
+            'version': (get_progress(session_id) or {}).get('version', 0),
+        }
+        self._written_at = 0
+        self._written_rows = 0
+
+    def update(self, processed, success, errors, force=False):
+        self.data.update(processed=processed, success=success, errors=errors)
+        if self.data['total'] < processed:
+            # The pre-scan total is an estimate; never report more than 100%
+            self.data['total'] = processed
+        due = (
+            time.monotonic() - self._written_at >= self.interval
+            or processed - self._written_rows >= self.every_rows
+        )
+        if force or due:
+            self._write()
+
+    def finish(self, status='completed', **extra):
+        self.data['status'] = status
+        self.data.update(extra)
+        self._write()
+
+    def _write(self):
+        self.data['version'] += 1
+        set_progress(self.session_id, **self.data)
+        self._written_at = time.monotonic()
+        self._written_rows = self.data['processed']
@@ -0,0 +1,317 @@
+import copy
+import csv
+import logging
+import os
+from datetime import date, datetime
+from django.contrib.admin.models import LogEntry
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.urls import reverse
+from .export_cache import touch_employee_data
+from .ingestion import forget_file_hashes
+from .models import ArchivedAttendanceRecord, AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary, UploadHistory, UploadJob
+from .summaries import refresh_company, refresh_date_range
+from labour_management.shards import (
+    company_filter, current_shard, mirror, on_shard, record_aliases, shard_for_company, shards_configured, use_shard,
+)
+from users.dashboard import bump_all_dashboards, bump_dashboards
+from users.models import AuditLog, Company, Notification, SupervisorAssignment, User, UserSearchTrigram
+from users.scope import forget_assignments
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per statement and per transaction
+PURGE_BATCH_SIZE = 1000
+
+# Reports listing the accounts removed by purges and cleanups, kept in CLEANUP_REPORT_DIR
+REPORT_HEADERS = ['Username', 'EP Number', 'First Name', 'Last Name', 'Company Name', 'Role']
+REPORT_FIELDS = ['username', 'ep_number', 'first_name', 'last_name', 'company_name', 'role']
+
+# Everything that references a user, deleted before the user itself. Raw deletes
+# skip the on_delete handling, so a new foreign key to User must be added here.
+USER_DEPENDENTS = [
+    (AttendanceRecord, 'user'),
+    (ArchivedAttendanceRecord, 'user'),
+    (MonthlyAttendanceSummary, 'user'),
+    (UserSearchTrigram, 'user'),
+    (SupervisorAssignment, 'supervisor'),
+    (SupervisorAssignment, 'employee'),
+    (SupervisorAssignment, 'assigned_by'),
+    (AuditLog, 'user'),
+    (Notification, 'user'),
+    (UploadJob, 'uploaded_by'),
+    (UploadHistory, 'uploaded_by'),
+    (LogEntry, 'user'),
+    (User.groups.through, 'user'),
+    (User.user_permissions.through, 'user'),
+]
+
+
+def delete_where_in(model, field_name, values, using=None):
+    """DELETE FROM <table> WHERE <column> IN (values), bypassing the deletion collector"""
+    if not values:
+        return 0
+    connection = connections[using or router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field(field_name).column)
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', list(values))
+        return cursor.rowcount
+
+
+def orphaned_employees(company_id=None):
+    """
+    User3 accounts without any attendance, live or archived, optionally of
+    one company. With company shards each employee is looked up in the
+    database holding their company's attendance, once, when this is called.
+    """
+    users = User.objects.filter(role='user3')
+    if company_id is not None:
+        users = users.filter(company_id=company_id)
+    orphans = users.filter(
+        ~Exists(AttendanceRecord.objects.filter(user=OuterRef('pk'))),
+        ~Exists(ArchivedAttendanceRecord.objects.filter(user=OuterRef('pk'))),
+    )
+    if not shards_configured():
+        return orphans
+    ids = []
+    for alias in record_aliases():
+        # Shards have a copy of every user, for their joins
+        ids += orphans.using(alias).filter(company_filter(alias)).values_list('id', flat=True)
+    return users.filter(id__in=ids)
+
+
+def delete_users(ids):
+    """
+    Delete users and every row referencing them with raw deletes, inside
+    the caller's transaction. Returns (attendance records, users) deleted.
+    """
+    supervisor_ids = set(SupervisorAssignment.objects.filter(
+        Q(supervisor_id__in=ids) | Q(employee_id__in=ids)
+    ).values_list('supervisor_id', flat=True))
+    # Jobs of remaining users can't point at histories that are about to go
+    UploadJob.objects.filter(upload_history__uploaded_by__in=ids).update(upload_history=None)
+
+    attendance = 0
+    for model, field_name in USER_DEPENDENTS:
+        deleted = delete_where_in(model, field_name, ids)
+        if model in (AttendanceRecord, ArchivedAttendanceRecord):
+            attendance += deleted
+    users = delete_where_in(User, 'id', ids)
+
+    transaction.on_commit(lambda: [forget_assignments(supervisor_id) for supervisor_id in supervisor_ids])
+    # The shards' copies go through the collector, with whatever attendance is left there
+    transaction.on_commit(lambda: mirror(User, ids))
+    return attendance, users
+
+
+def report_storage():
+    """Removed-accounts reports, which are not served from MEDIA_ROOT"""
+    return FileSystemStorage(location=settings.CLEANUP_REPORT_DIR)
+
+
+def start_report(label):
+    """Create an empty removed-accounts report; returns its storage name"""
+    storage = report_storage()
+    os.makedirs(storage.location, exist_ok=True)
+    name = storage.get_available_name(f"removed_users_{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    with open(storage.path(name), 'w', newline='', encoding='utf-8') as report:
+        csv.writer(report).writerow(REPORT_HEADERS)
+    return name
+
+
+def append_report(name, rows):
+    """Add (REPORT_FIELDS) rows to a report, a batch at a time"""
+    with open(report_storage().path(name), 'a', newline='', encoding='utf-8') as report:
+        csv.writer(report).writerows(rows)
+
+
+def report_url(name):
+    """Where masters download a report"""
+    return reverse('cleanup_report', args=[os.path.basename(name)])
+
+
+def purge_description(params):
+    """What a purge deletes, in words"""
+    if 'company_id' in params:
+        return f"Company {params.get('company_name') or params['company_id']}"
+    if params.get('blank'):
+        return 'Blank company'
+    return f"Attendance {params['start_date']} to {params['end_date']}"
+
+
+class Purge:
+    """
+    Deletes the attendance, live then archived, and employees of a company,
+    of the blank company, or the attendance of a date range (then the
+    employees it leaves without attendance), in primary key order, one batch
+    per transaction. With company shards the attendance and summaries are
+    deleted in each database holding them in turn.
+
+    Rows go with plain DELETE ... WHERE id IN (...) statements instead of
+    the deletion collector, so nothing is loaded into memory and no lock is
+    held for longer than a batch. The position is kept in state, which is
+    handed to on_batch inside each batch's transaction; running again with
+    the saved state carries on where an interrupted purge stopped.
+
+    params is {'company_id': id}, {'blank': True} or
+    {'start_date': 'YYYY-MM-DD', 'end_date': 'YYYY-MM-DD'}.
+    """
+
+    def __init__(self, params, state=None, batch_size=PURGE_BATCH_SIZE, keep_user_ids=(), on_batch=None):
+        self.params = params
+        self.batch_size = batch_size
+        # The user running the purge, whose job row must survive it
+        self.keep_user_ids = list(keep_user_ids)
+        self.on_batch = on_batch
+        self.state = dict(state or {})
+        self.state.setdefault('phase', 'attendance')
+        # Index into aliases() of the database being purged
+        self.state.setdefault('shard', 0)
+        self.state.setdefault('last_id', 0)
+        self.state.setdefault('attendance', 0)
+        self.state.setdefault('users', 0)
+
+    def aliases(self):
+        """The databases holding the attendance to delete"""
+        if 'company_id' in self.params:
+            return [shard_for_company(self.params['company_id'])]
+        if self.params.get('blank'):
+            return [shard_for_company(None)]
+        return record_aliases()
+
+    def records(self, model=AttendanceRecord):
+        if 'company_id' in self.params:
+            return model.objects.filter(company_id=self.params['company_id'])
+        if self.params.get('blank'):
+            return model.objects.filter(company__isnull=True)
+        return model.objects.filter(
+            date__gte=self.params['start_date'], date__lte=self.params['end_date']
+        )
+
+    def users(self):
+        if 'company_id' in self.params:
+            users = User.objects.filter(company_id=self.params['company_id'])
+        elif self.params.get('blank'):
+            users = User.objects.filter(company__isnull=True)
+        else:
+            # Employees left without any attendance
+            users = orphaned_employees()
+        return users.exclude(id__in=self.keep_user_ids)
+
+    def run(self):
+        if self.state['phase'] == 'attendance':
+            self.state.setdefault('total_attendance', sum(
+                on_shard(self.records(model), alias).count()
+                for alias in self.aliases() for model in (AttendanceRecord, ArchivedAttendanceRecord)
+            ))
+            self._purge_shards(self.records(), self._delete_records)
+            self._next_phase('archive')
+        if self.state['phase'] == 'archive':
+            self._purge_shards(self.records(ArchivedAttendanceRecord), self._delete_archived)
+            self._next_phase('users')
+        if self.state['phase'] == 'users':
+            self._purge(self.users(), self._delete_users)
+            self._next_phase('summaries' if 'company_id' in self.params else 'finish')
+        if self.state['phase'] == 'summaries':
+            self._purge_shards(DailyAttendanceSummary.objects.filter(company_id=self.params['company_id']),
+                               self._delete_summaries)
+            self._next_phase('finish')
+        if self.state['phase'] == 'finish':
+            self._finish()
+            self._next_phase('done')
+        return self.state
+
+    def _purge_shards(self, queryset, delete):
+        """_purge() queryset in each of aliases(), from the one the saved state is at"""
+        aliases = self.aliases()
+        while self.state['shard'] < len(aliases):
+            with use_shard(aliases[self.state['shard']]):
+                self._purge(queryset, delete)
+            self.state.update(shard=self.state['shard'] + 1, last_id=0)
+            self._save()
+
+    def _purge(self, queryset, delete):
+        while True:
+            ids = list(queryset.filter(id__gt=self.state['last_id']).order_by('id').values_list('id', flat=True)
+                       [:self.batch_size])
+            if not ids:
+                return
+            before = copy.deepcopy(self.state)
+            try:
+                # The state is saved on the default database, committed after a shard's
+                # deletes: a batch retried after a failure between the two finds nothing left
+                with transaction.atomic(), transaction.atomic(using=current_shard()):
+                    delete(ids)
+                    self.state['last_id'] = ids[-1]
+                    self._save()
+            except BaseException:
+                # The batch was rolled back, and so must its counts be
+                self.state.clear()
+                self.state.update(before)
+                raise
+            logger.info('Purge %s: %s attendance records and %s users deleted',
+                        purge_description(self.params), self.state['attendance'], self.state['users'])
+
+    def _next_phase(self, phase):
+        self.state.update(phase=phase, shard=0, last_id=0)
+        self._save()
+
+    def _save(self):
+        if self.on_batch:
+            self.on_batch(self.state)
+
+    def _delete_records(self, ids):
+        self.state['attendance'] += delete_where_in(AttendanceRecord, 'id', ids)
+
+    def _delete_archived(self, ids):
+        self.state['attendance'] += delete_where_in(ArchivedAttendanceRecord, 'id', ids)
+
+    def _delete_users(self, ids):
+        if not self.state.get('report'):
+            self.state['report'] = start_report('purge')
+        rows = list(User.objects.filter(id__in=ids).order_by('id').values_list(*REPORT_FIELDS))
+        attendance, users = delete_users(ids)
+        self.state['attendance'] += attendance
+        self.state['users'] += users
+        # Listed once the batch is committed, so a retried batch isn't listed twice
+        report = self.state['report']
+        transaction.on_commit(lambda: append_report(report, rows))
+
+    def _delete_summaries(self, ids):
+        delete_where_in(DailyAttendanceSummary, 'id', ids)
+
+    def _finish(self):
+        """What the collector and the model signals would have done once all rows are gone"""
+        if 'company_id' in self.params:
+            # Only rows the purge kept, like its own user, are left to set to NULL
+            Company.objects.filter(pk=self.params['company_id']).delete()
+            bump_dashboards([self.params['company_id']])
+        elif self.params.get('blank'):
+            refresh_company(None)
+            bump_dashboards([None])
+        else:
+            refresh_date_range(self.params['start_date'], self.params['end_date'])
+            bump_all_dashboards()
+        forget_file_hashes()
+        touch_employee_data()
+
+
+def purge_summary(description, result):
+    message = (f"{description}: Deleted {result.get('attendance', 0)} attendance records "
+               f"and {result.get('users', 0)} users.")
+    if result.get('users') and result.get('report'):
+        message += f" The removed accounts are listed in {report_url(result['report'])}"
+    return message
+
+
+def date_range_params(start_date, end_date):
+    """Purge params for a date range, or None if the dates don't parse"""
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except (TypeError, ValueError):
+        return None
+    return {'start_date': start.isoformat(), 'end_date': end.isoformat()}
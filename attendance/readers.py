@@ -0,0 +1,165 @@
+import codecs
+import csv
+import datetime
+import hashlib
+import itertools
+
+# Bytes read from the upload per step; memory use stays around this size regardless of file size
+READ_CHUNK_SIZE = 64 * 1024
+
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Excel on Windows saves "CSV" in the ANSI code page when not asked for UTF-8
+FALLBACK_ENCODING = 'cp1252'
+
+
+def detect_encoding(sample):
+    """Guess the encoding of a file from its first bytes"""
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
+
+def iter_lines(uploaded_file, chunk_size=READ_CHUNK_SIZE):
+    """
+    Decode an uploaded file chunk by chunk and yield its lines with line
+    endings kept, as the csv module expects.
+    """
+    chunks = uploaded_file.chunks(chunk_size)
+    first = next(chunks, b'')
+    encoding = detect_encoding(first)
+    decoder = codecs.getincrementaldecoder(encoding)(
+        errors='replace' if encoding == FALLBACK_ENCODING else 'strict'
+    )
+
+    pending = ''
+    for chunk in itertools.chain([first], chunks):
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def open_csv(uploaded_file):
+    """DictReader over an uploaded CSV that never holds the whole file in memory"""
+    return csv.DictReader(iter_lines(uploaded_file))
+
+
+def estimate_row_count(uploaded_file, chunk_size=READ_CHUNK_SIZE):
+    """
+    Cheap pre-scan counting data lines for progress reporting. Quoted fields
+    spanning several lines make this an over-estimate, so the importer's own
+    counts remain the source of truth.
+    """
+    newlines = 0
+    last = b''
+    for chunk in uploaded_file.chunks(chunk_size):
+        newlines += chunk.count(b'\n')
+        last = chunk
+    lines = newlines + (1 if last and not last.endswith(b'\n') else 0)
+    return max(lines - 1, 0)
+
+
+def file_sha256(uploaded_file, chunk_size=READ_CHUNK_SIZE):
+    """Hash an uploaded file without reading it into memory"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks(chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cell_to_text(value):
+    """Render an Excel cell the way it would appear in the equivalent CSV export"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time(0, 0):
+            return value.strftime('%d-%m-%Y')
+        return value.strftime('%d-%m-%Y %H:%M')
+    if isinstance(value, datetime.date):
+        return value.strftime('%d-%m-%Y')
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M')
+    if isinstance(value, datetime.timedelta):
+        # Durations such as [h]:mm hours worked
+        minutes = int(value.total_seconds() // 60)
+        return f'{minutes // 60}:{minutes % 60:02d}'
+    if isinstance(value, float) and value.is_integer():
+        # Numeric EP numbers and statuses like -1 come back as floats
+        return str(int(value))
+    return str(value)
+
+
+class XlsxDictReader:
+    """
+    Reads the first sheet of an .xlsx upload as DictReader-style rows using
+    openpyxl's read-only, values-only mode, so rows are streamed from the
+    file rather than loaded into a workbook.
+    """
+
+    def __init__(self, uploaded_file):
+        from openpyxl import load_workbook
+
+        self.workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+        self.sheet = self.workbook.worksheets[0]
+        self._rows = self.sheet.iter_rows(values_only=True)
+
+        header = [cell_to_text(value) for value in next(self._rows, ())]
+        # Formatting often pads the header with empty trailing cells
+        while header and header[-1] == '':
+            header.pop()
+        self.fieldnames = header or None
+
+    def estimate_row_count(self):
+        return max((self.sheet.max_row or 1) - 1, 0)
+
+    def __iter__(self):
+        if self.fieldnames is None:
+            self.workbook.close()
+            return
+        width = len(self.fieldnames)
+        try:
+            for values in self._rows:
+                # Blank spreadsheet rows are skipped like blank CSV lines
+                if all(value is None for value in values):
+                    continue
+                cells = [cell_to_text(value) for value in values]
+                row = dict(zip(self.fieldnames, cells))
+                if len(cells) < width:
+                    row.update((name, None) for name in self.fieldnames[len(cells):])
+                elif any(cells[width:]):
+                    row[None] = cells[width:]
+                yield row
+        finally:
+            self.workbook.close()
+
+
+def is_xlsx(filename):
+    return filename.lower().endswith('.xlsx')
+
+
+def open_upload(uploaded_file, filename):
+    """
+    Open a CSV or XLSX upload for streaming. Returns the DictReader-style
+    reader and an estimated row count for progress reporting.
+    """
+    if is_xlsx(filename):
+        reader = XlsxDictReader(uploaded_file)
+        return reader, reader.estimate_row_count()
+    # Pre-scan before the reader starts, both share the file position
+    total_rows = estimate_row_count(uploaded_file)
+    return open_csv(uploaded_file), total_rows
@@ -0,0 +1,76 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .export_cache import touch_employee_data
+from .models import ArchivedAttendanceRecord, AttendanceRecord, UploadHistory
+from .summaries import refresh_daily
+from labour_management.shards import shards_for_companies, use_shard
+from users.dashboard import bump_dashboards
+from users.models import User
+
+# Saves that don't change anything shown in a report
+REPORT_NEUTRAL_FIELDS = {'last_login', 'password'}
+
+# Employee fields the daily attendance summary is grouped by
+SUMMARY_FIELDS = ('company_id', 'department', 'shift')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def employee_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= REPORT_NEUTRAL_FIELDS:
+        return
+    touch_employee_data()
+
+
+def _summary_keys(user_id, company_ids):
+    dates = set()
+    for alias in set(shards_for_companies(company_ids).values()):
+        with use_shard(alias):
+            for model in (AttendanceRecord, ArchivedAttendanceRecord):
+                dates.update(model.objects.filter(user_id=user_id).values_list('date', flat=True).distinct())
+    return {(company_id, day) for day in dates for company_id in company_ids}
+
+
+@receiver(pre_save, sender=User)
+def employee_regrouping(sender, instance, update_fields=None, **kwargs):
+    instance._summary_before = None
+    if instance.pk is None or (update_fields and not set(update_fields) & {'company', 'department', 'shift'}):
+        return
+    instance._summary_before = User.objects.filter(pk=instance.pk).values(*SUMMARY_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def employee_regrouped(sender, instance, **kwargs):
+    # Moving an employee to another company, department or shift moves their days in the daily summary
+    before = getattr(instance, '_summary_before', None)
+    if before and any(before[field] != getattr(instance, field) for field in SUMMARY_FIELDS):
+        refresh_daily(_summary_keys(instance.pk, {before['company_id'], instance.company_id}))
+
+
+@receiver(pre_delete, sender=User)
+def employee_leaving(sender, instance, **kwargs):
+    instance._summary_keys = set(instance.attendance_records.values_list('company_id', 'date'))
+    instance._summary_keys.update(instance.archived_attendance_records.values_list('company_id', 'date'))
+
+
+@receiver(post_delete, sender=User)
+def employee_left(sender, instance, **kwargs):
+    # Monthly rows go with the employee through the foreign key; daily rows are shared
+    keys = getattr(instance, '_summary_keys', None)
+    if keys:
+        refresh_daily(keys)
+        # Their attendance went with them, past the duplicate upload check
+        UploadHistory.objects.forget_file_hashes()
+
+
+# Bulk writes and deletes of attendance send no signals (and a post_delete receiver
+# would cost queryset deletes their fast path); those call bump_dashboards() themselves
+@receiver(post_save, sender=AttendanceRecord)
+def attendance_saved(sender, instance, **kwargs):
+    bump_dashboards([instance.company_id])
+
+
+@receiver(post_save, sender=UploadHistory)
+@receiver(post_delete, sender=UploadHistory)
+def upload_history_changed(sender, instance, **kwargs):
+    bump_dashboards(User.objects.filter(pk=instance.uploaded_by_id).values_list('company_id', flat=True))
@@ -0,0 +1,191 @@
+import itertools
+from collections import defaultdict
+from datetime import date
+from django.db import transaction
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+from .models import ArchivedAttendanceRecord, AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary
+from labour_management.shards import current_shard, record_aliases, shard_for_company, shards_for_companies, use_shard
+
+# Dates or employees recomputed per delete and insert
+REFRESH_BATCH_SIZE = 500
+
+INSERT_BATCH_SIZE = 1000
+
+TOTALS = {
+    'total_count': Count('id'),
+    'total_hours': Sum('hours_worked'),
+    'total_overtime': Sum('overtime'),
+}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _records(**filters):
+    """
+    Live and archived records matching filters. The archive holds whole
+    months, so a day or month is summarized from one table or the other.
+    """
+    return [model.objects.filter(**filters) for model in (AttendanceRecord, ArchivedAttendanceRecord)]
+
+
+def _daily_rows(sources):
+    for records in sources:
+        yield from _daily_group(records)
+
+
+def _daily_group(records):
+    """Summary rows for records, grouped by company, date, department, shift and status"""
+    rows = records.order_by().annotate(
+        summary_department=Coalesce('user__department', Value('')),
+        # The record's own shift, else the employee's, as in the export
+        summary_shift=Coalesce(NullIf('shift', Value('')), 'user__shift', Value('')),
+    ).values('company_id', 'date', 'summary_department', 'summary_shift', 'status').annotate(**TOTALS)
+    for row in rows.iterator(chunk_size=INSERT_BATCH_SIZE):
+        yield DailyAttendanceSummary(
+            company_id=row['company_id'], date=row['date'], department=row['summary_department'],
+            shift=row['summary_shift'], status=row['status'], record_count=row['total_count'],
+            hours_worked=row['total_hours'] or 0, overtime=row['total_overtime'] or 0,
+        )
+
+
+def _monthly_rows(sources):
+    for records in sources:
+        yield from _monthly_group(records)
+
+
+def _monthly_group(records):
+    """Summary rows for records, grouped by employee, month and status"""
+    rows = records.order_by().annotate(summary_month=TruncMonth('date')).values(
+        'user_id', 'summary_month', 'status'
+    ).annotate(**TOTALS)
+    for row in rows.iterator(chunk_size=INSERT_BATCH_SIZE):
+        yield MonthlyAttendanceSummary(
+            user_id=row['user_id'], month=row['summary_month'], status=row['status'],
+            record_count=row['total_count'], hours_worked=row['total_hours'] or 0,
+            overtime=row['total_overtime'] or 0,
+        )
+
+
+def _insert(model, objs):
+    created = 0
+    while True:
+        batch = list(itertools.islice(objs, INSERT_BATCH_SIZE))
+        if not batch:
+            return created
+        model.objects.bulk_create(batch)
+        created += len(batch)
+
+
+def _batches(values):
+    values = sorted(values)
+    for start in range(0, len(values), REFRESH_BATCH_SIZE):
+        yield values[start:start + REFRESH_BATCH_SIZE]
+
+
+def refresh_daily(keys):
+    """Recompute the daily summary of each (company_id, date) in keys from the records"""
+    dates_by_company = defaultdict(set)
+    for company_id, day in keys:
+        dates_by_company[company_id].add(day)
+    aliases = shards_for_companies(dates_by_company)
+
+    # One transaction per batch: a large upload's refresh doesn't hold the write lock throughout
+    for company_id, dates in dates_by_company.items():
+        with use_shard(aliases[company_id]) as alias:
+            for batch in _batches(dates):
+                with transaction.atomic(using=alias):
+                    DailyAttendanceSummary.objects.filter(company_id=company_id, date__in=batch).delete()
+                    _insert(DailyAttendanceSummary, _daily_rows(_records(company_id=company_id, date__in=batch)))
+
+
+def refresh_monthly(keys):
+    """Recompute the monthly summary of each (user_id, month start) in keys from the current database's records"""
+    users_by_month = defaultdict(set)
+    for user_id, month in keys:
+        users_by_month[month].add(user_id)
+
+    for month, user_ids in users_by_month.items():
+        for batch in _batches(user_ids):
+            with transaction.atomic(using=current_shard()):
+                MonthlyAttendanceSummary.objects.filter(month=month, user_id__in=batch).delete()
+                _insert(MonthlyAttendanceSummary, _monthly_rows(_records(
+                    user_id__in=batch, date__gte=month, date__lt=next_month(month)
+                )))
+
+
+def refresh_records(keys):
+    """Recompute the summaries covering each written (user_id, company_id, date) in keys"""
+    keys = list(keys)
+    refresh_daily({(company_id, day) for _, company_id, day in keys})
+    aliases = shards_for_companies({company_id for _, company_id, _ in keys})
+    months_by_alias = defaultdict(set)
+    for user_id, company_id, day in keys:
+        months_by_alias[aliases[company_id]].add((user_id, month_start(day)))
+    for alias, months in months_by_alias.items():
+        with use_shard(alias):
+            refresh_monthly(months)
+
+
+def refresh_date_range(start_date, end_date):
+    """Recompute the summaries after records between the two dates were deleted in bulk"""
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    first_month, last_month = month_start(start_date), month_start(end_date)
+
+    for alias in record_aliases():
+        with use_shard(alias), transaction.atomic(using=alias):
+            DailyAttendanceSummary.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+            _insert(DailyAttendanceSummary, _daily_rows(_records(date__gte=start_date, date__lte=end_date)))
+            # Months only partly inside the range still have records outside it
+            MonthlyAttendanceSummary.objects.filter(month__gte=first_month, month__lte=last_month).delete()
+            _insert(MonthlyAttendanceSummary, _monthly_rows(
+                _records(date__gte=first_month, date__lt=next_month(last_month))
+            ))
+
+
+def refresh_company(company_id):
+    """Recompute a company's daily summary; the monthly one doesn't depend on the company"""
+    alias = shard_for_company(company_id)
+    with use_shard(alias), transaction.atomic(using=alias):
+        DailyAttendanceSummary.objects.filter(company_id=company_id).delete()
+        _insert(DailyAttendanceSummary, _daily_rows(_records(company_id=company_id)))
+
+
+def rebuild_summaries():
+    """Recompute both summaries from scratch in every database; returns the (daily, monthly) row counts"""
+    daily = monthly = 0
+    for alias in record_aliases():
+        with use_shard(alias), transaction.atomic(using=alias):
+            DailyAttendanceSummary.objects.all().delete()
+            MonthlyAttendanceSummary.objects.all().delete()
+            daily += _insert(DailyAttendanceSummary, _daily_rows(_records()))
+            monthly += _insert(MonthlyAttendanceSummary, _monthly_rows(_records()))
+    return daily, monthly
+
+
+def employee_status_counts(user_id):
+    """{status: records} over all of an employee's attendance, in the current database"""
+    return dict(
+        MonthlyAttendanceSummary.objects.filter(user_id=user_id).order_by().values('status')
+        .annotate(count=Sum('record_count')).values_list('status', 'count')
+    )
+
+
+def company_status_counts(company_id, start_date, end_date=None):
+    """{status: records} for a company's attendance from start_date on, in the current database"""
+    summaries = DailyAttendanceSummary.objects.filter(company_id=company_id, date__gte=start_date)
+    if end_date:
+        summaries = summaries.filter(date__lte=end_date)
+    return dict(
+        summaries.order_by().values('status').annotate(count=Sum('record_count')).values_list('status', 'count')
+    )
@@ -0,0 +1,129 @@
+import datetime
+import json
+from django.test import TestCase
+from django.urls import reverse
+from attendance.archive import archive_before, archive_horizon, reaches_archive, restore_from
+from attendance.exports import csv_stream, export_queryset
+from attendance.ingestion import AttendanceImporter
+from attendance.models import (
+    ArchivedAttendanceRecord, AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary,
+)
+from attendance.purge import Purge, orphaned_employees
+from attendance.readers import open_csv
+from attendance.validation import AttendanceValidator
+from users.models import Company, User
+from .utils import IsolatedFilesMixin, attendance_file
+
+ROWS = [
+    'A1,Al,ACME,Prod,A,01-01-2023,08:00,16:00,P,08:00,01:30',
+    'A2,Bo,ACME,Prod,B,15-01-2023,08:00,16:00,P,08:00,00:00',
+    'A1,Al,ACME,Prod,A,28-02-2023,,,A,00:00,00:00',
+    'C1,Cy,Gamma,,,10-02-2023,08:00,16:00,P,08:00,00:00',
+    'A1,Al,ACME,Prod,A,02-03-2024,08:00,12:00,-0.5,04:00,00:00',
+    'A2,Bo,ACME,Prod,B,05-03-2024,08:00,16:00,P,08:00,00:00',
+]
+
+
+def import_rows(*rows, importer_class=AttendanceImporter):
+    uploaded = attendance_file(*rows)
+    reader = open_csv(uploaded)
+    importer = importer_class(reader.fieldnames, chunk_size=2)
+    importer.run(reader)
+    return importer
+
+
+def summaries():
+    daily = DailyAttendanceSummary.objects.values_list(
+        'company_id', 'date', 'department', 'shift', 'status', 'record_count', 'hours_worked', 'overtime')
+    monthly = MonthlyAttendanceSummary.objects.values_list(
+        'user_id', 'month', 'status', 'record_count', 'hours_worked', 'overtime')
+    return sorted(daily, key=str), sorted(monthly, key=str)
+
+
+class ArchiveTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        import_rows(*ROWS)
+        self.master = User.objects.create_user('master', password='x', role='master')
+        self.admin = User.objects.create_user('admin', password='x', role='user1', company_name='ACME')
+
+    def test_archive_and_restore_keep_records_as_they_were(self):
+        before = {record.id: (record.created_at, record.updated_at) for record in AttendanceRecord.objects.all()}
+        before_summaries = summaries()
+
+        self.assertEqual(archive_before(datetime.date(2024, 1, 15), batch_size=2), 4)
+
+        self.assertEqual(AttendanceRecord.objects.count(), 2)
+        self.assertEqual(archive_horizon(), datetime.date(2023, 3, 1))
+        self.assertTrue(reaches_archive('2023-02-28'))
+        self.assertFalse(reaches_archive('2023-03-01'))
+        for record in ArchivedAttendanceRecord.objects.all():
+            self.assertEqual(before[record.id], (record.created_at, record.updated_at))
+        self.assertEqual(summaries(), before_summaries)
+
+        restore_from()
+        self.assertIsNone(archive_horizon())
+        for record in AttendanceRecord.objects.all():
+            self.assertEqual(before[record.id], (record.created_at, record.updated_at))
+        self.assertEqual(summaries(), before_summaries)
+
+    def test_exports_read_through_the_archive(self):
+        archive_before(datetime.date(2024, 1, 1))
+
+        records = export_queryset(self.master, '2023-01-01', '2024-12-31')
+        self.assertEqual(records.count(), 6)
+        lines = b''.join(csv_stream(records)).decode().strip().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(export_queryset(self.admin, '2023-01-01', '2023-01-31').count(), 2)
+        # Ranges after the horizon stay on the live table
+        self.assertIsInstance(export_queryset(self.admin, '2024-01-01', '2024-12-31'), type(AttendanceRecord.objects.all()))
+
+    def test_the_list_reads_the_archive_for_ranges_without_a_start(self):
+        archive_before(datetime.date(2024, 1, 1))
+        self.client.force_login(self.master)
+
+        response = self.client.get(reverse('attendance_list'), {'format': 'json', 'end_date': '2023-01-31'})
+        results = json.loads(response.content)['results']
+        self.assertEqual([(row['ep_number'], row['archived']) for row in results], [('A2', True), ('A1', True)])
+
+        response = self.client.get(reverse('attendance_list'), {'format': 'json'})
+        self.assertEqual(len(json.loads(response.content)['results']), 6)
+
+    def test_reuploading_an_archived_day(self):
+        archive_before(datetime.date(2024, 1, 1))
+        original = ArchivedAttendanceRecord.objects.get(user__ep_number='A1', date='2023-01-01')
+
+        validator = import_rows(ROWS[0], importer_class=AttendanceValidator)
+        self.assertEqual((validator.created_count, validator.unchanged_count), (0, 1))
+        importer = import_rows(ROWS[0])
+        self.assertEqual((importer.created_count, importer.updated_count, importer.unchanged_count), (0, 0, 1))
+
+        before_summaries = summaries()
+        importer = import_rows('A1,Al,ACME,Prod,A,01-01-2023,,,A,00:00,00:00')
+        self.assertEqual((importer.created_count, importer.updated_count), (0, 1))
+        record = ArchivedAttendanceRecord.objects.get(user__ep_number='A1', date='2023-01-01')
+        self.assertEqual((record.id, record.created_at), (original.id, original.created_at))
+        self.assertGreater(record.updated_at, original.updated_at)
+        self.assertGreater(record.archived_at, original.archived_at)
+        self.assertEqual(record.status, 'A')
+        self.assertFalse(AttendanceRecord.objects.filter(date__lt='2023-03-01').exists())
+        self.assertNotEqual(summaries(), before_summaries)
+
+        # A new record for an archived day joins its month in the archive
+        importer = import_rows('A2,Bo,ACME,Prod,B,20-02-2023,08:00,16:00,P,08:00,00:00')
+        self.assertEqual(importer.created_count, 1)
+        self.assertTrue(ArchivedAttendanceRecord.objects.filter(user__ep_number='A2', date='2023-02-20').exists())
+        self.assertFalse(AttendanceRecord.objects.filter(date__lt='2023-03-01').exists())
+
+    def test_purges_and_orphans_see_the_archive(self):
+        archive_before(datetime.date(2024, 1, 1))
+
+        # C1 only has archived attendance
+        self.assertFalse(orphaned_employees().filter(ep_number='C1').exists())
+
+        Purge({'start_date': '2023-01-01', 'end_date': '2023-01-31'}).run()
+        self.assertFalse(ArchivedAttendanceRecord.objects.filter(date__lt='2023-02-01').exists())
+        acme = Company.objects.get(name='ACME')
+        Purge({'company_id': acme.pk}, keep_user_ids=[self.admin.pk]).run()
+        self.assertFalse(ArchivedAttendanceRecord.objects.filter(company=acme).exists())
+        self.assertTrue(ArchivedAttendanceRecord.objects.filter(user__ep_number='C1').exists())
@@ -0,0 +1,92 @@
+import datetime
+from django.test import TestCase
+from django.utils import timezone
+from attendance.jobs import claim_next_job, enqueue_upload, run_job
+from attendance.models import AttendanceRecord, UploadHistory
+from users.models import User
+from .test_archive import import_rows
+from .utils import IsolatedFilesMixin, attendance_file
+
+ROWS = [
+    'E1,Ann,ACME,Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00',
+    'E2,Bob,ACME,Prod,B,01-03-2024,,,A,00:00,00:00',
+    'E1,Ann,ACME,Prod,A,02-03-2024,08:00,16:00,P,08:00,00:00',
+]
+
+
+class FingerprintTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='x', role='user1', company_name='ACME')
+
+    def counts(self, importer):
+        return importer.created_count, importer.updated_count, importer.unchanged_count, importer.error_count
+
+    def test_only_new_and_changed_rows_are_written(self):
+        self.assertEqual(self.counts(import_rows(*ROWS)), (3, 0, 0, 0))
+        stamps = dict(AttendanceRecord.objects.values_list('id', 'updated_at'))
+
+        importer = import_rows(
+            ROWS[0],
+            'E2,Bob,ACME,Prod,B,01-03-2024,08:00,12:00,-0.5,04:00,00:00',
+            'E2,Bob,ACME,Prod,B,02-03-2024,08:00,16:00,P,08:00,00:00',
+        )
+
+        self.assertEqual(self.counts(importer), (1, 1, 1, 0))
+        unchanged = AttendanceRecord.objects.get(user__ep_number='E1', date=datetime.date(2024, 3, 1))
+        self.assertEqual(unchanged.updated_at, stamps[unchanged.id])
+        changed = AttendanceRecord.objects.get(user__ep_number='E2', date=datetime.date(2024, 3, 1))
+        self.assertEqual(changed.status, '-0.5')
+        self.assertGreater(changed.updated_at, stamps[changed.id])
+        self.assertEqual(AttendanceRecord.objects.count(), 4)
+
+    def test_a_later_row_for_the_same_day_wins(self):
+        importer = import_rows(ROWS[1], 'E2,Bob,ACME,Prod,B,01-03-2024,08:00,16:00,P,08:00,00:00')
+
+        self.assertEqual(self.counts(importer), (1, 1, 0, 0))
+        self.assertEqual(AttendanceRecord.objects.get().status, 'P')
+
+    def run_upload(self):
+        enqueue_upload('attendance', attendance_file(*ROWS), self.admin)
+        job = run_job(claim_next_job().id)
+        self.assertEqual(job.status, 'completed', job.error)
+        return job
+
+    def test_an_identical_file_is_not_read_again(self):
+        first = self.run_upload()
+        second = self.run_upload()
+
+        self.assertEqual(second.result['duplicate_of'], first.upload_history_id)
+        self.assertEqual((second.result['created'], second.result['unchanged']), (0, 3))
+        self.assertEqual(UploadHistory.objects.get(pk=second.upload_history_id).unchanged_rows, 3)
+
+    def test_the_file_is_read_again_once_attendance_changed(self):
+        self.run_upload()
+        # Edited after the upload was recorded
+        later = timezone.now() + datetime.timedelta(seconds=1)
+        AttendanceRecord.objects.filter(user__ep_number='E2').update(status='P', updated_at=later)
+
+        again = self.run_upload()
+
+        self.assertNotIn('duplicate_of', again.result)
+        self.assertEqual((again.result['updated'], again.result['unchanged']), (1, 2))
+        self.assertEqual(AttendanceRecord.objects.get(user__ep_number='E2').status, 'A')
+
+    def test_the_file_is_read_again_once_attendance_was_deleted(self):
+        self.run_upload()
+        AttendanceRecord.objects.filter(user__ep_number='E1').delete()
+
+        again = self.run_upload()
+
+        self.assertNotIn('duplicate_of', again.result)
+        self.assertEqual((again.result['created'], again.result['unchanged']), (2, 1))
+        self.assertEqual(AttendanceRecord.objects.count(), 3)
+
+    def test_the_file_is_read_again_once_an_employee_was_deleted(self):
+        self.run_upload()
+        User.objects.get(ep_number='E2').delete()
+
+        again = self.run_upload()
+
+        self.assertNotIn('duplicate_of', again.result)
+        self.assertEqual((again.result['created'], again.result['unchanged']), (1, 2))
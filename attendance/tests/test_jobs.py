@@ -0,0 +1,91 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from attendance.jobs import (
+    ALL_COMPANIES, JOB_LEASE_SECONDS, _claim, claim_next_job, enqueue_purge, enqueue_upload, narrow_company,
+    renew_leases, requeue_interrupted_jobs,
+)
+from attendance.models import UploadJob
+from users.models import User
+from .utils import IsolatedFilesMixin, attendance_file
+
+
+class JobQueueTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.master = User.objects.create_user('master', password='x', role='master', company_name='HQ')
+
+    def upload(self, *companies):
+        rows = [f'E{index},Name,{company},Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00'
+                for index, company in enumerate(companies)]
+        return enqueue_upload('attendance', attendance_file(*rows), self.master)
+
+    def test_uploads_are_keyed_on_the_company_in_the_file(self):
+        self.assertEqual(self.upload('ACME', 'ACME').company_name, 'ACME')
+        self.assertEqual(self.upload('ACME', 'Beta').company_name, ALL_COMPANIES)
+        self.assertEqual(self.upload('').company_name, '')
+        self.assertEqual(enqueue_purge({'start_date': '2024-01-01', 'end_date': '2024-01-31'}, self.master, 'x')
+                         .company_name, ALL_COMPANIES)
+
+    @mock.patch('attendance.jobs.TARGET_COMPANY_ROWS', 2)
+    def test_long_files_are_narrowed_down_by_the_worker(self):
+        long_file, beta = self.upload('ACME', 'ACME', 'ACME'), self.upload('Beta')
+        mixed = self.upload('ACME', 'ACME', 'Beta')
+        self.assertEqual((long_file.company_name, mixed.company_name), (ALL_COMPANIES, ALL_COMPANIES))
+
+        self.assertEqual(claim_next_job().id, long_file.id)
+        self.assertIsNone(claim_next_job())
+        narrow_company(long_file)
+        self.assertEqual(UploadJob.objects.get(id=long_file.id).company_name, 'ACME')
+        # Beta no longer waits for the ACME file
+        self.assertEqual(claim_next_job().id, beta.id)
+
+        narrow_company(mixed)
+        self.assertEqual(UploadJob.objects.get(id=mixed.id).company_name, ALL_COMPANIES)
+
+    def test_one_job_per_company_at_a_time(self):
+        acme, acme_again, beta = self.upload('ACME'), self.upload('ACME'), self.upload('Beta')
+
+        self.assertEqual(claim_next_job().id, acme.id)
+        self.assertEqual(claim_next_job().id, beta.id)
+        self.assertIsNone(claim_next_job())
+        UploadJob.objects.filter(id=acme.id).update(status='completed')
+        self.assertEqual(claim_next_job().id, acme_again.id)
+
+    def test_jobs_for_every_company_run_alone(self):
+        acme = self.upload('ACME')
+        everyone = self.upload('ACME', 'Beta')
+        beta = self.upload('Beta')
+
+        self.assertEqual(claim_next_job().id, acme.id)
+        # Waits for ACME, and Beta waits behind it
+        self.assertIsNone(claim_next_job())
+        UploadJob.objects.filter(id=acme.id).update(status='completed')
+        self.assertEqual(claim_next_job().id, everyone.id)
+        self.assertIsNone(claim_next_job())
+        UploadJob.objects.filter(id=everyone.id).update(status='completed')
+        self.assertEqual(claim_next_job().id, beta.id)
+
+    def test_a_claim_rechecks_the_company(self):
+        first, second = self.upload('ACME'), self.upload('ACME')
+        self.assertEqual(claim_next_job().id, first.id)
+
+        # A worker that saw ACME idle before the first claim still can't take the second job
+        self.assertFalse(_claim(second.id, 'ACME'))
+        self.assertFalse(_claim(first.id, 'ACME'))
+        self.assertEqual(UploadJob.objects.get(id=second.id).status, 'queued')
+
+    def test_only_jobs_with_an_expired_lease_are_requeued(self):
+        alive, stopped = self.upload('ACME'), self.upload('Beta')
+        claim_next_job()
+        claim_next_job()
+        expired = timezone.now() - timedelta(seconds=JOB_LEASE_SECONDS + 1)
+        UploadJob.objects.filter(id=stopped.id).update(heartbeat_at=expired)
+        UploadJob.objects.filter(id=alive.id).update(heartbeat_at=expired)
+        renew_leases([alive.id])
+
+        self.assertEqual(requeue_interrupted_jobs(), 1)
+        self.assertEqual(UploadJob.objects.get(id=alive.id).status, 'running')
+        self.assertEqual(UploadJob.objects.get(id=stopped.id).status, 'queued')
+        self.assertEqual(claim_next_job().id, stopped.id)
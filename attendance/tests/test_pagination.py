@@ -0,0 +1,38 @@
+import datetime
+import json
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from attendance.archive import archive_before
+from users.models import User
+from .test_archive import import_rows
+from .utils import IsolatedFilesMixin
+
+ROWS = [
+    'A1,Al,ACME,Prod,A,01-01-2023,08:00,16:00,P,08:00,00:00',
+    'A1,Al,ACME,Prod,A,02-01-2023,08:00,16:00,P,08:00,00:00',
+    'A1,Al,ACME,Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00',
+]
+
+
+@mock.patch('attendance.pagination.COUNT_LIMIT', 2)
+class CountTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        import_rows(*ROWS)
+        self.client.force_login(User.objects.create_user('master', password='x', role='master'))
+
+    def counts(self, **params):
+        data = json.loads(self.client.get(reverse('attendance_list'), {'format': 'json', **params}).content)
+        return data['count'], data['count_is_exact'], data['count_is_capped']
+
+    def test_estimated_counts_stop_at_the_limit(self):
+        self.assertEqual(self.counts(), (2, False, True))
+        self.assertEqual(self.counts(count='exact'), (3, True, False))
+        self.assertEqual(self.counts(start_date='2024-01-01'), (1, False, False))
+
+    def test_counts_across_the_archive_stop_at_the_limit(self):
+        archive_before(datetime.date(2024, 1, 1))
+
+        self.assertEqual(self.counts(), (2, False, True))
+        self.assertEqual(self.counts(count='exact'), (3, True, False))
@@ -0,0 +1,34 @@
+import time
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from attendance.progress import set_progress, wait_for_progress
+from users.models import User
+from .utils import IsolatedFilesMixin
+
+
+class ProgressWaitTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        set_progress('session', total=10, processed=2, success=2, errors=0, status='processing', version=3)
+
+    @mock.patch('attendance.progress.MAX_WAIT', 0.2)
+    def test_waits_are_capped(self):
+        started = time.monotonic()
+        progress = wait_for_progress('session', 3, timeout=25, poll_interval=0.05)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(progress['version'], 3)
+
+    def test_newer_progress_returns_at_once(self):
+        started = time.monotonic()
+        self.assertEqual(wait_for_progress('session', 2)['processed'], 2)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    @mock.patch('attendance.views.PROGRESS_STREAM_SECONDS', 0.2)
+    def test_event_stream_closes_for_the_client_to_reconnect(self):
+        user = User.objects.create_user('admin', password='x', role='user1')
+        self.client.force_login(user)
+        response = self.client.get(reverse('upload_progress', args=['session']), {'stream': 1})
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: 1000'))
+        self.assertEqual(body.count('data: '), 1)
@@ -0,0 +1,95 @@
+import copy
+import csv
+import datetime
+from django.test import TestCase
+from attendance.models import AttendanceRecord, DailyAttendanceSummary
+from attendance.purge import Purge, date_range_params, report_storage
+from users.models import Company, User
+from .test_archive import import_rows
+from .utils import IsolatedFilesMixin
+
+ROWS = [
+    'A1,Al,ACME,Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00',
+    'A1,Al,ACME,Prod,A,02-03-2024,08:00,16:00,P,08:00,00:00',
+    'A1,Al,ACME,Prod,A,03-03-2024,08:00,16:00,P,08:00,00:00',
+    'A2,Bo,ACME,Prod,B,01-03-2024,08:00,16:00,P,08:00,00:00',
+    'A2,Bo,ACME,Prod,B,02-03-2024,,,A,00:00,00:00',
+    'C1,Cy,Gamma,Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00',
+]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class PurgeTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        import_rows(*ROWS)
+        self.acme = Company.objects.get(name='ACME')
+
+    def ep_numbers(self):
+        return sorted(AttendanceRecord.objects.values_list('user__ep_number', flat=True))
+
+    def report_rows(self, state):
+        with open(report_storage().path(state['report']), newline='', encoding='utf-8') as report:
+            return [row[1] for row in csv.reader(report)][1:]
+
+    def test_company_purge_deletes_in_batches(self):
+        saved = []
+        with self.captureOnCommitCallbacks(execute=True):
+            state = Purge({'company_id': self.acme.pk}, batch_size=2, on_batch=lambda state: saved.append(
+                copy.deepcopy(state))).run()
+
+        # One call per batch of two records, with the position and counts so far
+        batches = [(entry['attendance'], entry['last_id']) for entry in saved
+                   if entry['phase'] == 'attendance' and entry['last_id']]
+        self.assertEqual([attendance for attendance, _ in batches], [2, 4, 5])
+        self.assertEqual([last_id for _, last_id in batches], sorted(last_id for _, last_id in batches))
+        self.assertEqual(saved[-1]['phase'], 'done')
+
+        self.assertEqual((state['attendance'], state['users'], state['total_attendance']), (5, 2, 5))
+        self.assertEqual(self.ep_numbers(), ['C1'])
+        self.assertFalse(Company.objects.filter(name='ACME').exists())
+        self.assertFalse(DailyAttendanceSummary.objects.filter(company=self.acme.pk).exists())
+        self.assertEqual(sorted(self.report_rows(state)), ['A1', 'A2'])
+
+    def test_an_interrupted_purge_resumes_from_its_saved_state(self):
+        params = {'company_id': self.acme.pk}
+        saved = {}
+
+        def save(state):
+            if state['phase'] == 'attendance' and state['attendance'] == 4:
+                raise Interrupted
+            saved.clear()
+            saved.update(copy.deepcopy(state))
+
+        purge = Purge(params, batch_size=2, on_batch=save)
+        with self.assertRaises(Interrupted):
+            purge.run()
+
+        # The failed batch was rolled back, with its counts
+        self.assertEqual(purge.state['attendance'], 2)
+        self.assertEqual(saved['attendance'], 2)
+        self.assertEqual(AttendanceRecord.objects.filter(company=self.acme).count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            state = Purge(params, state=saved, batch_size=2).run()
+
+        self.assertEqual(state['phase'], 'done')
+        self.assertEqual((state['attendance'], state['users'], state['total_attendance']), (5, 2, 5))
+        self.assertEqual(self.ep_numbers(), ['C1'])
+        self.assertEqual(sorted(self.report_rows(state)), ['A1', 'A2'])
+
+    def test_date_range_purge_deletes_the_employees_it_leaves_without_attendance(self):
+        kept = User.objects.get(ep_number='C1')
+        with self.captureOnCommitCallbacks(execute=True):
+            state = Purge(date_range_params('2024-03-01', '2024-03-02'), batch_size=2,
+                          keep_user_ids=[kept.pk]).run()
+
+        self.assertEqual((state['attendance'], state['users']), (5, 1))
+        self.assertEqual(self.ep_numbers(), ['A1'])
+        self.assertEqual(self.report_rows(state), ['A2'])
+        self.assertTrue(User.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(list(DailyAttendanceSummary.objects.values_list('date', flat=True)),
+                         [datetime.date(2024, 3, 3)])
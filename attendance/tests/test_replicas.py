@@ -0,0 +1,107 @@
+import datetime
+import json
+import time
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from attendance.models import AttendanceRecord
+from labour_management.replicas import PRIMARY_COOKIE, REPLICA_ALIAS, ReplicaRouter, RequestRouting, _routing
+from users.models import User
+from .utils import IsolatedFilesMixin
+
+
+class ReplicaRoutingTests(IsolatedFilesMixin, TransactionTestCase):
+    """
+    Runs against a second SQLite database standing in for the replica: a
+    copy of the primary taken in setUp, so it lacks what is written after.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.add_replica()
+        self.master = User.objects.create_user('master', password='x', role='master')
+        self.employee = User.objects.create_user('E1', password='x', role='user3', ep_number='E1', company_name='ACME')
+        AttendanceRecord.objects.create(user=self.employee, date=datetime.date(2024, 1, 1))
+        self.sync_replica()
+        # Only on the primary: the replica lags behind
+        AttendanceRecord.objects.create(user=self.employee, date=datetime.date(2024, 1, 2))
+        self.client.force_login(self.master)
+
+    def add_replica(self):
+        primary = connections.settings['default']
+        replica = dict(primary, NAME=f'{self.files_dir}/replica.sqlite3', TEST=dict(primary['TEST'], NAME=None))
+        connections.settings[REPLICA_ALIAS] = replica
+        self.addCleanup(self.remove_replica)
+
+    def remove_replica(self):
+        if REPLICA_ALIAS in connections.settings:
+            connections[REPLICA_ALIAS].close()
+            del connections[REPLICA_ALIAS]
+            del connections.settings[REPLICA_ALIAS]
+
+    def sync_replica(self):
+        for alias in ('default', REPLICA_ALIAS):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections[REPLICA_ALIAS].connection)
+
+    def record_count(self):
+        response = self.client.get(reverse('attendance_list'), {'format': 'json', 'count': 'exact'})
+        return json.loads(response.content)['count'], response
+
+    def test_reports_read_the_replica(self):
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            count, response = self.record_count()
+
+        self.assertEqual(count, 1)
+        self.assertTrue(replica_queries.captured_queries)
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_a_write_keeps_the_user_on_the_primary(self):
+        record = AttendanceRecord.objects.get(date=datetime.date(2024, 1, 1))
+        response = self.client.post(reverse('edit_attendance', args=[record.pk]),
+                                    {'status': 'A', 'hours_worked': '0', 'overtime': '0'})
+
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            count, _ = self.record_count()
+        self.assertEqual(count, 2)
+        self.assertEqual(replica_queries.captured_queries, [])
+
+    def test_an_expired_cookie_reads_the_replica_again(self):
+        self.client.cookies[PRIMARY_COOKIE] = str(time.time() - 5)
+        self.assertEqual(self.record_count()[0], 1)
+        self.client.cookies[PRIMARY_COOKIE] = str(time.time() + 5)
+        self.assertEqual(self.record_count()[0], 2)
+
+    def test_streamed_export_reads_the_replica(self):
+        with CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica_queries:
+            response = self.client.post(reverse('export_attendance'),
+                                        {'format': 'csv', 'start_date': '2024-01-01', 'end_date': '2024-01-31'})
+            body = b''.join(response.streaming_content).decode()
+
+        # Header and the one record the replica has
+        self.assertEqual(len(body.strip().splitlines()), 2)
+        self.assertTrue(replica_queries.captured_queries)
+
+    def test_only_app_writes_make_users_sticky(self):
+        router = ReplicaRouter()
+        routing = RequestRouting()
+        token = _routing.set(routing)
+        try:
+            router.db_for_write(Session)
+            self.assertFalse(routing.wrote)
+            router.db_for_write(AttendanceRecord)
+            self.assertTrue(routing.wrote)
+        finally:
+            _routing.reset(token)
+
+    def test_without_a_replica_everything_reads_the_primary(self):
+        self.remove_replica()
+
+        self.assertEqual(self.record_count()[0], 2)
+        record = AttendanceRecord.objects.get(date=datetime.date(2024, 1, 1))
+        response = self.client.post(reverse('edit_attendance', args=[record.pk]),
+                                    {'status': 'A', 'hours_worked': '0', 'overtime': '0'})
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from attendance.models import AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary
+from attendance.purge import Purge, orphaned_employees
+from labour_management.shards import SHARD_ID_SPAN
+from users.dashboard import build_dashboard
+from users.models import Company, User
+from .test_archive import import_rows
+from .utils import IsolatedFilesMixin
+
+SHARDS = {'ACME': 'shard_a', 'Beta': 'shard_b'}
+
+ROWS = [
+    'A1,Al,ACME,Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00',
+    'A2,Bo,ACME,Prod,B,03-03-2024,08:00,16:00,P,08:00,00:00',
+    'B1,Bea,Beta,Prod,A,02-03-2024,08:00,16:00,P,08:00,00:00',
+    'G1,Gus,Gamma,Prod,A,04-03-2024,08:00,16:00,A,00:00,00:00',
+]
+
+
+@override_settings(COMPANY_SHARDS=SHARDS)
+class CompanyShardTests(IsolatedFilesMixin, TransactionTestCase):
+    """
+    ACME and Beta keep their attendance in two more SQLite databases,
+    Gamma in the default one. The attendance is imported before the
+    companies get their shards, then moved by migrate_to_shards.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for alias in set(SHARDS.values()):
+            self.add_shard(alias)
+        with self.settings(COMPANY_SHARDS={}):
+            import_rows(*ROWS)
+            self.master = User.objects.create_user('master', password='x', role='master')
+            self.admin = User.objects.create_user('admin', password='x', role='user1', company_name='ACME')
+        self.ids = dict(AttendanceRecord.objects.values_list('user__ep_number', 'id').order_by('date'))
+        call_command('migrate_to_shards', stdout=io.StringIO())
+
+    def add_shard(self, alias):
+        primary = connections.settings['default']
+        connections.settings[alias] = dict(primary, NAME=f'{self.files_dir}/{alias}.sqlite3',
+                                           TEST=dict(primary['TEST'], NAME=None))
+        self.addCleanup(self.remove_shard, alias)
+
+    def remove_shard(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def ep_numbers(self, alias, model=AttendanceRecord):
+        return sorted(model.objects.using(alias).values_list('user__ep_number', flat=True))
+
+    def test_migrate_moves_each_company_into_its_database(self):
+        self.assertEqual(self.ep_numbers('default'), ['G1'])
+        self.assertEqual(self.ep_numbers('shard_a'), ['A1', 'A2'])
+        self.assertEqual(self.ep_numbers('shard_b'), ['B1'])
+        # Ids are kept, and the summaries follow the records
+        self.assertEqual(AttendanceRecord.objects.using('shard_a').get(user__ep_number='A1').id, self.ids['A1'])
+        acme = Company.objects.get(name='ACME')
+        self.assertFalse(DailyAttendanceSummary.objects.filter(company=acme).exists())
+        self.assertEqual(DailyAttendanceSummary.objects.using('shard_a').filter(company=acme).count(), 2)
+        self.assertEqual(self.ep_numbers('shard_b', MonthlyAttendanceSummary), ['B1'])
+        # Every shard has the users for its joins
+        self.assertEqual(User.objects.using('shard_b').count(), User.objects.count())
+
+        # Nothing left to move
+        output = io.StringIO()
+        call_command('migrate_to_shards', dry_run=True, stdout=output)
+        self.assertEqual({line.split()[0] for line in output.getvalue().splitlines()}, {'0'})
+
+    def test_uploads_write_to_each_company_database(self):
+        importer = import_rows(
+            'A1,Al,ACME,Prod,A,01-03-2024,08:00,16:00,P,08:00,00:00',
+            'A3,Cy,ACME,Prod,A,05-03-2024,08:00,16:00,P,08:00,00:00',
+            'B1,Bea,Beta,Prod,A,02-03-2024,08:00,16:00,A,00:00,00:00',
+        )
+
+        self.assertEqual((importer.created_count, importer.updated_count, importer.unchanged_count), (1, 1, 1))
+        self.assertEqual(self.ep_numbers('shard_a'), ['A1', 'A2', 'A3'])
+        self.assertGreaterEqual(AttendanceRecord.objects.using('shard_a').get(user__ep_number='A3').id, SHARD_ID_SPAN)
+        self.assertEqual(AttendanceRecord.objects.using('shard_b').get().status, 'A')
+        self.assertEqual(self.ep_numbers('default'), ['G1'])
+        self.assertTrue(User.objects.using('shard_b').filter(ep_number='A3').exists())
+        self.assertEqual(MonthlyAttendanceSummary.objects.using('shard_a').filter(status='P').get(
+            user__ep_number='A3').record_count, 1)
+
+    def test_master_reads_every_database(self):
+        self.client.force_login(self.master)
+        response = self.client.get(reverse('attendance_list'), {'format': 'json', 'count': 'exact'})
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([row['ep_number'] for row in data['results']], ['G1', 'A2', 'B1', 'A1'])
+
+        response = self.client.get(reverse('attendance_list'), {'format': 'json', 'employee': 'bea'})
+        self.assertEqual([row['ep_number'] for row in json.loads(response.content)['results']], ['B1'])
+
+        response = self.client.post(reverse('export_attendance'),
+                                    {'format': 'csv', 'start_date': '2024-01-01', 'end_date': '2024-12-31'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))[1:]
+        self.assertEqual([row[0] for row in rows], ['G1', 'A2', 'B1', 'A1'])
+
+        recent = build_dashboard(self.master)['recent_uploads']
+        self.assertEqual(len(recent), 4)
+
+    def test_company_admin_reads_their_database(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('attendance_list'), {'format': 'json', 'count': 'exact'})
+        self.assertEqual([row['ep_number'] for row in json.loads(response.content)['results']], ['A2', 'A1'])
+        self.assertEqual(build_dashboard(User.objects.get(ep_number='A1'))['attendance_summary'], {'P': 1})
+
+    def test_edits_save_in_the_record_database(self):
+        self.client.force_login(self.master)
+        response = self.client.post(reverse('edit_attendance', args=[self.ids['B1']]),
+                                    {'status': 'A', 'hours_worked': '0', 'overtime': '0'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(AttendanceRecord.objects.using('shard_b').get(id=self.ids['B1']).status, 'A')
+        self.assertEqual(DailyAttendanceSummary.objects.using('shard_b').get().status, 'A')
+
+    def test_company_purge_empties_its_database(self):
+        acme = Company.objects.get(name='ACME')
+        state = Purge({'company_id': acme.pk}, batch_size=1, keep_user_ids=[self.master.pk]).run()
+
+        self.assertEqual((state['attendance'], state['users']), (2, 3))
+        self.assertEqual(self.ep_numbers('shard_a'), [])
+        self.assertFalse(DailyAttendanceSummary.objects.using('shard_a').exists())
+        self.assertFalse(User.objects.using('shard_a').filter(ep_number='A1').exists())
+        self.assertFalse(Company.objects.using('shard_b').filter(name='ACME').exists())
+        self.assertEqual(self.ep_numbers('shard_b'), ['B1'])
+
+    def test_date_range_purge_covers_every_database(self):
+        state = Purge({'start_date': '2024-03-02', 'end_date': '2024-03-04'}, batch_size=1).run()
+
+        self.assertEqual(self.ep_numbers('default') + self.ep_numbers('shard_a') + self.ep_numbers('shard_b'), ['A1'])
+        # Employees left without attendance, wherever it was kept
+        self.assertEqual(state['users'], 3)
+        self.assertEqual(list(orphaned_employees()), [])
+        self.assertEqual(list(User.objects.filter(role='user3').values_list('ep_number', flat=True)), ['A1'])
@@ -0,0 +1,83 @@
+import datetime
+import json
+import os
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from attendance.converters import AttendanceRowConverter
+from attendance.jobs import claim_next_job, enqueue_upload, run_job
+from attendance.models import AttendanceRecord
+from attendance.validation import validate_upload
+from users.models import User
+from .utils import IsolatedFilesMixin, attendance_file
+
+ROWS = [
+    'E1,Ann Lee,ACME,Prod,A,01-03-2024,08:00,17:00 (N),P,08:30,01:00',
+    'E2,Bob,ACME,Prod,B,01-03-2024,,,A,00:00,00:00',
+    'E3,Cy,ACME,Prod,A,31-02-2024,08:00,17:00,P,08:00,00:00',
+]
+
+
+class ValidationCacheTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', password='x', role='user1', company_name='ACME')
+
+    def parsed_files(self):
+        directory = f'{self.files_dir}/validations'
+        return [os.path.join(directory, name) for name in os.listdir(directory)] if os.path.isdir(directory) else []
+
+    def media_files(self):
+        return [name for _, _, files in os.walk(f'{self.files_dir}/media') for name in files]
+
+    def test_parsed_rows_stay_out_of_media(self):
+        summary = validate_upload(attendance_file(*ROWS), self.admin)
+
+        self.assertEqual((summary['created'], summary['errors']), (2, 1))
+        [parsed] = self.parsed_files()
+        with open(parsed, encoding='utf-8') as parsed_file:
+            chunks = [json.loads(line) for line in parsed_file]
+        self.assertEqual(sum(len(chunk['rows']) for chunk in chunks), 3)
+        # Only the error report is downloadable
+        [error_file] = self.media_files()
+        self.assertTrue(error_file.startswith('errors_'))
+        self.assertTrue(summary['error_file_url'].endswith('.csv.gz'))
+
+    def test_import_reuses_the_parse(self):
+        summary = validate_upload(attendance_file(*ROWS), self.admin)
+        enqueue_upload('attendance', attendance_file(*ROWS), self.admin)
+
+        with mock.patch.object(AttendanceRowConverter, 'convert', side_effect=AssertionError('parsed again')):
+            job = run_job(claim_next_job().id)
+
+        self.assertEqual(job.status, 'completed', job.error)
+        self.assertEqual(job.result['created'], summary['created'])
+        self.assertEqual(job.result['errors'], summary['errors'])
+        self.assertEqual(self.parsed_files(), [])
+        record = AttendanceRecord.objects.get(user__ep_number='E1')
+        self.assertEqual(record.date, datetime.date(2024, 3, 1))
+        self.assertEqual((record.in1, record.out1), (datetime.time(8, 0), datetime.time(17, 0)))
+        self.assertEqual(float(record.hours_worked), 8.5)
+
+    def test_validate_only_uploads_are_checked_by_the_worker(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('upload_attendance'),
+                                    {'csv_file': attendance_file(*ROWS), 'validate_only': 'on'},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.parsed_files(), [])
+
+        job = run_job(claim_next_job().id)
+
+        self.assertEqual((job.kind, job.status), ('validation', 'completed'), job.error)
+        self.assertEqual((job.result['filename'], job.result['created'], job.result['errors']),
+                         ('attendance.csv', 2, 1))
+        self.assertFalse(AttendanceRecord.objects.exists())
+        status = self.client.get(json.loads(response.content)['status_url']).json()
+        self.assertTrue(status['error_file'].endswith('.csv.gz'))
+        self.assertEqual(self.client.get(reverse('upload_attendance')).context['last_validation'], job.result)
+
+        # The upload that follows reuses the worker's parse
+        enqueue_upload('attendance', attendance_file(*ROWS), self.admin)
+        with mock.patch.object(AttendanceRowConverter, 'convert', side_effect=AssertionError('parsed again')):
+            self.assertEqual(run_job(claim_next_job().id).result['created'], 2)
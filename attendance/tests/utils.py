@@ -0,0 +1,39 @@
+import shutil
+import tempfile
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+
+ATTENDANCE_HEADER = 'EP Number,Name,Company Name,Department,Shift,Date,IN1,OUT1,Status,Hours Worked,Overtime'
+
+
+def attendance_file(*rows, name='attendance.csv', header=ATTENDANCE_HEADER):
+    """An uploaded CSV with the given data rows"""
+    return SimpleUploadedFile(name, '\n'.join([header, *rows, '']).encode())
+
+
+class IsolatedFilesMixin:
+    """
+    Media, export, validation and cleanup report files in a temporary directory, local
+    memory caches and a fast password hasher for each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.files_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.files_dir, ignore_errors=True)
+        override = override_settings(
+            MEDIA_ROOT=f'{self.files_dir}/media',
+            EXPORT_CACHE_DIR=f'{self.files_dir}/exports',
+            VALIDATION_CACHE_DIR=f'{self.files_dir}/validations',
+            CLEANUP_REPORT_DIR=f'{self.files_dir}/cleanup_reports',
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+                'progress': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-progress'},
+            },
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        for cache in caches.all():
+            cache.clear()
@@ -10,4 +10,6 @@ urlpatterns = [
     path('empty-template/', views.download_empty_attendance_template, name='download_empty_attendance_template'),
     path('upload-history/', views.upload_history, name='upload_history'),
     path('upload-progress/<str:session_id>/', views.upload_progress, name='upload_progress'),
+    path('upload-jobs/<int:pk>/', views.upload_job_status, name='upload_job_status'),
+    path('cleanup-reports/<str:name>/', views.cleanup_report, name='cleanup_report'),
 ]
\ No newline at end of file
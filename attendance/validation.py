@@ -0,0 +1,232 @@
+import json
+import os
+import uuid
+from datetime import date, time
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from .converters import TIME_COLUMNS
+from .ingestion import ATTENDANCE_VALUE_FIELDS, AttendanceImporter
+from .models import AttendanceRecord
+from .progress import ProgressTracker, progress_cache
+from .readers import file_sha256, open_upload
+from labour_management.shards import use_shard
+from users.models import User
+
+# How long a validated file can be imported without being parsed again
+VALIDATION_TIMEOUT = 60 * 60
+
+# Error reports of validations, in MEDIA_ROOT for download; the parsed rows are kept in VALIDATION_CACHE_DIR
+VALIDATION_DIR = 'upload_validations/'
+
+TIME_FIELDS = [field for _, field in TIME_COLUMNS]
+
+
+def validation_cache_dir():
+    return settings.VALIDATION_CACHE_DIR
+
+
+def dump_chunk(chunk, parsed_file):
+    """Write a parsed chunk to parsed_file as one line of JSON"""
+    rows, errors, employees, pending = chunk
+    line = json.dumps({
+        'rows': rows,
+        'errors': list(errors.items()),
+        'employees': employees,
+        'pending': pending,
+    }, cls=DjangoJSONEncoder)
+    parsed_file.write(line + '\n')
+
+
+def load_chunk(line):
+    """The chunk written by dump_chunk(), with its dates and times converted back"""
+    data = json.loads(line)
+    pending = []
+    for row_num, ep_number, values, error in data['pending']:
+        if values.get('date'):
+            values['date'] = date.fromisoformat(values['date'])
+        for field in TIME_FIELDS:
+            if values.get(field):
+                values[field] = time.fromisoformat(values[field])
+        pending.append((row_num, ep_number, values, error))
+    rows = [(row_num, row) for row_num, row in data['rows']]
+    return rows, dict(data['errors']), data['employees'], pending
+
+
+
+class AttendanceValidator(AttendanceImporter):
+    """
+    Runs an attendance file through the importer's checks without writing
+    anything. Existing employees are looked up in bulk, new ones are only
+    checked for a free username, and rows are classified as new, updated or
+    unchanged against the stored records.
+
+    The parsed chunks are written to parsed_file as JSON lines as they go by
+    so the real import can skip parsing.
+    """
+
+    error_dir = VALIDATION_DIR
+
+    def __init__(self, fieldnames, parsed_file=None, **kwargs):
+        super().__init__(fieldnames, **kwargs)
+        self.parsed_file = parsed_file
+        # Fingerprints of what earlier chunks would have written
+        self._written = {}
+
+    def run(self, rows):
+        for chunk in self.parsed_chunks(rows):
+            if self.parsed_file:
+                dump_chunk(chunk, self.parsed_file)
+            self._apply_chunk(*chunk)
+
+    def _resolve_users(self, new_employees):
+        if not new_employees:
+            return {}
+
+        ep_numbers = list(new_employees)
+        self._remember_users(User.objects.filter(ep_number__in=ep_numbers))
+        missing = [ep for ep in ep_numbers if ep not in self._user_ids]
+        taken = set(User.objects.filter(
+            username__in=[new_employees[ep]['username'] for ep in missing]
+        ).values_list('username', flat=True))
+
+        errors = {}
+        for ep_number in missing:
+            if new_employees[ep_number]['username'] in taken:
+                errors[ep_number] = f"Username {ep_number} is already taken by another user"
+            else:
+                # Stands in for the id the employee would be created with
+                self._user_ids[ep_number] = ('new', ep_number)
+        return errors
+
+    def _write(self, records, errors):
+        storable = []
+        for record in records:
+            try:
+                self._prepare(record[2])
+            except Exception as e:
+                errors[record[0]] = str(e)
+            else:
+                storable.append(record)
+
+        existing = [record for record in storable if not isinstance(record[1], tuple)]
+        fingerprints = {}
+        for alias, shard_records in self._by_database(existing):
+            with use_shard(alias):
+                fingerprints.update(self._stored_fingerprints(shard_records))
+        fingerprints.update(
+            (key, self._written[key]) for key in
+            {(user_id, values['date']) for _, user_id, values in storable} & self._written.keys()
+        )
+        (created, updated, unchanged), _ = self._changes(storable, fingerprints)
+        self._written.update(fingerprints)
+        self.created_count += created
+        self.updated_count += updated
+        self.unchanged_count += unchanged
+
+    def _prepare(self, values):
+        """Convert values for the database as a save would, e.g. hours too large for the column"""
+        for name in ['date'] + ATTENDANCE_VALUE_FIELDS:
+            AttendanceRecord._meta.get_field(name).get_db_prep_save(values[name], connection)
+
+
+def validation_key(file_hash):
+    return f'upload_validation_{file_hash}'
+
+
+def validate_upload(uploaded_file, uploaded_by, filename=None, session_id=''):
+    """
+    Dry-run an attendance upload, e.g. a validation job's stored file
+    under its original filename. Returns a summary with the would-be
+    counts and, if rows were rejected, the URL of the error CSV.
+    """
+    filename = filename or uploaded_file.name
+    file_hash = file_sha256(uploaded_file)
+    reader, total_rows = open_upload(uploaded_file, filename)
+    progress = ProgressTracker(session_id, total=total_rows) if session_id else None
+
+    # Outside MEDIA_ROOT: the parsed rows are only ever read back by the import
+    os.makedirs(validation_cache_dir(), exist_ok=True)
+    parsed_path = os.path.join(validation_cache_dir(), f'{uuid.uuid4().hex}.jsonl')
+    try:
+        with open(parsed_path, 'w', encoding='utf-8') as parsed_file:
+            validator = AttendanceValidator(reader.fieldnames, parsed_file=parsed_file, progress=progress)
+            validator.run(reader)
+    except Exception:
+        os.remove(parsed_path)
+        raise
+
+    error_path = validator.error_writer.save(filename)
+    error_file_url = default_storage.url(error_path) if error_path else ''
+
+    summary = {
+        'filename': filename,
+        'file_hash': file_hash,
+        'created': validator.created_count,
+        'updated': validator.updated_count,
+        'unchanged': validator.unchanged_count,
+        'errors': validator.error_count,
+        'total': validator.total_count,
+        'error_file_url': error_file_url,
+    }
+
+    previous = progress_cache().get(validation_key(file_hash))
+    if previous:
+        remove_parsed_file(previous['parsed_file'])
+    progress_cache().set(validation_key(file_hash), {
+        'summary': summary,
+        'company_name': uploaded_by.company_name,
+        'fieldnames': validator.fieldnames,
+        'parsed_file': parsed_path,
+    }, VALIDATION_TIMEOUT)
+    if progress:
+        progress.finish(total=validator.total_count, processed=validator.total_count,
+                        success=validator.accepted_count, errors=validator.error_count)
+    return summary
+
+
+def take_validation(uploaded_by, file_hash):
+    """
+    Claim the cached validation of a file for its import. Only user
+    resolution and writes are redone; the parse is read back as is.
+    """
+    validation = progress_cache().get(validation_key(file_hash))
+    if not validation or validation['company_name'] != uploaded_by.company_name:
+        return None
+    progress_cache().delete(validation_key(file_hash))
+    if not os.path.exists(validation['parsed_file']):
+        return None
+    return validation
+
+
+def validated_chunks(validation):
+    """Yield the parsed chunks saved by validate_upload, then remove them"""
+    try:
+        with open(validation['parsed_file'], encoding='utf-8') as parsed_file:
+            for line in parsed_file:
+                yield load_chunk(line)
+    finally:
+        remove_parsed_file(validation['parsed_file'])
+
+
+def remove_parsed_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_parsed_files(cutoff, dry_run=False):
+    """Delete parsed files of validations never imported, last modified before cutoff"""
+    directory = validation_cache_dir()
+    if not os.path.isdir(directory):
+        return []
+    deleted = [
+        entry.path for entry in os.scandir(directory)
+        if entry.is_file() and entry.stat().st_mtime < cutoff.timestamp()
+    ]
+    if not dry_run:
+        for path in deleted:
+            remove_parsed_file(path)
+    return deleted
@@ -1,39 +1,45 @@
 import csv
-import io
 import json
+import time
 import uuid
 from datetime import datetime
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse, StreamingHttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.core.cache import cache
-from .models import AttendanceRecord, UploadHistory
+from .archive import reaches_archive, read_through
+from .models import AttendanceRecord, UploadHistory, UploadJob
 from .forms import AttendanceUploadForm, AttendanceEditForm, AttendanceFilterForm
-from users.models import User, SupervisorAssignment
+from .export_cache import EXPORT_EXTENSIONS, CachedExport
+from .exports import build_xlsx_export, csv_stream, export_queryset, export_scope
+from .jobs import enqueue_purge, enqueue_upload
+from .pagination import keyset_page, page_links
+from .progress import FINAL_STATUSES, MAX_WAIT, get_progress, set_progress, wait_for_progress
+from .purge import date_range_params, purge_description, report_storage, report_url
+from .summaries import refresh_records
+from labour_management.replicas import reporting_iterator, reporting_view
+from labour_management.shards import CombinedQuerySet, on_shard, record_aliases, shards_configured
+from users.scope import scope_for
+from users.search import matching_user_ids
+
+ATTENDANCE_PAGE_FIELDS = [('date', True), ('id', True)]
 
 @login_required
+@reporting_view
 def attendance_list(request):
     user = request.user
     form = AttendanceFilterForm(request.GET)
     
-    # Base queryset based on user role
-    if user.role == 'master':
-        attendance_records = AttendanceRecord.objects.all()
-    elif user.role == 'user1':
-        attendance_records = AttendanceRecord.objects.filter(user__company_name=user.company_name)
-    elif user.role == 'user2':
-        assigned_employees = SupervisorAssignment.objects.filter(supervisor=user).values_list('employee', flat=True)
-        attendance_records = AttendanceRecord.objects.filter(user__id__in=assigned_employees)
-    elif user.role == 'user3':
-        attendance_records = AttendanceRecord.objects.filter(user=user)
-    else:
-        attendance_records = AttendanceRecord.objects.none()
+    # Base queryset based on user role: live records only, unless the date filter reaches the archive
+    attendance_records = scope_for(user).records()
     
     # Apply filters
     if form.is_valid():
+        # Without a start date the range reaches back into the archive, whatever its end
+        if reaches_archive(form.cleaned_data['start_date']):
+            attendance_records = read_through(scope_for(user))
         if form.cleaned_data['start_date']:
             attendance_records = attendance_records.filter(date__gte=form.cleaned_data['start_date'])
         if form.cleaned_data['end_date']:
@@ -41,18 +47,30 @@ def attendance_list(request):
         if form.cleaned_data['status']:
             attendance_records = attendance_records.filter(status=form.cleaned_data['status'])
         if form.cleaned_data['employee']:
-            attendance_records = attendance_records.filter(
-                Q(user__username__icontains=form.cleaned_data['employee']) |
-                Q(user__ep_number__icontains=form.cleaned_data['employee']) |
-                Q(user__first_name__icontains=form.cleaned_data['employee']) |
-                Q(user__last_name__icontains=form.cleaned_data['employee'])
-            )
+            # Matching employees come from the search index, their records from the (user, date) index
+            employees = matching_user_ids(form.cleaned_data['employee'])
+            if shards_configured():
+                # The index is on the default database only
+                employees = [row['id'] for row in employees]
+            attendance_records = attendance_records.filter(user__in=employees)
     
-    attendance_records = attendance_records.select_related('user').order_by('-date')
+    # Seek pagination on (date, id): no OFFSET scan however deep the user pages
+    attendance_records = keyset_page(request, attendance_records.select_related('user'), ATTENDANCE_PAGE_FIELDS)
     
-    paginator = Paginator(attendance_records, 25)
-    page = request.GET.get('page')
-    attendance_records = paginator.get_page(page)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [{
+                'id': record.pk,
+                'ep_number': record.user.ep_number,
+                'name': record.user.get_full_name(),
+                'date': record.date.isoformat(),
+                'status': record.status,
+                'hours_worked': record.get_hours_formatted(),
+                'overtime': record.get_overtime_formatted(),
+                'archived': getattr(record, 'archived', False),
+            } for record in attendance_records],
+            **page_links(attendance_records),
+        })
     
     return render(request, 'attendance/attendance_list.html', {
         'attendance_records': attendance_records,
@@ -69,216 +87,29 @@ def upload_attendance(request):
         form = AttendanceUploadForm(request.POST, request.FILES)
         if form.is_valid():
             csv_file = request.FILES['csv_file']
-            decoded_file = csv_file.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
             
             # Generate session ID for progress tracking
             session_id = str(uuid.uuid4())
             request.session['upload_session_id'] = session_id
             
-            created_count = 0
-            updated_count = 0
-            error_count = 0
-            errors = []
-            failed_rows = []
-            
-            # Store original headers for error file
-            original_headers = reader.fieldnames
-            
-            # Count total rows for progress
-            rows_list = list(reader)
-            total_rows = len(rows_list)
-            
-            # Initialize progress
-            progress_data = {
-                'total': total_rows,
-                'processed': 0,
-                'success': 0,
-                'errors': 0,
-                'status': 'processing'
-            }
-            cache.set(f'upload_progress_{session_id}', progress_data, 300)  # 5 minutes
+            # Hand the file to the upload worker and return straight away; a dry run
+            # is queued the same way, as it reads every row too, but writes nothing
+            kind = 'validation' if form.cleaned_data['validate_only'] else 'attendance'
+            job = enqueue_upload(kind, csv_file, request.user, session_id=session_id)
+            set_progress(session_id, total=0, processed=0, success=0, errors=0, status='queued', version=1, job_id=job.id)
             
-            for row_num, row in enumerate(rows_list, start=2):
-                # Update progress
-                progress_data['processed'] = row_num - 1
-                cache.set(f'upload_progress_{session_id}', progress_data, 300)
-                try:
-                    ep_number = row.get('EP Number')
-                    if not ep_number:
-                        raise ValueError("EP Number is required")
-                    
-                    # Get or create user
-                    user, created = User.objects.get_or_create(
-                        ep_number=ep_number,
-                        defaults={
-                            'username': ep_number,
-                            'first_name': row.get('Name', '').split()[0] if row.get('Name') else '',
-                            'last_name': ' '.join(row.get('Name', '').split()[1:]) if row.get('Name') else '',
-                            'company_name': row.get('Company Name'),
-                            'plant': row.get('Plant'),
-                            'department': row.get('Department'),
-                            'trade': row.get('Trade'),
-                            'skill': row.get('Skill'),
-                            'shift': row.get('Shift'),
-                            'role': 'user3'
-                        }
-                    )
-                    
-                    # Set password properly if user was just created
-                    if created:
-                        user.set_password(ep_number)
-                        user.save()
-                    
-                    # Parse date
-                    date_str = row.get('Date')
-                    try:
-                        date = datetime.strptime(date_str, '%d-%m-%Y').date()
-                    except ValueError:
-                        raise ValueError(f"Invalid date format: {date_str}. Expected DD-MM-YYYY")
-                    
-                    # Parse times (supports HH:MM and HH:MM (N) for next day)
-                    def parse_time(time_str):
-                        if not time_str or time_str.strip() == '':
-                            return None
-                        
-                        time_str = time_str.strip()
-                        
-                        # Handle HH:MM (N) format - remove (N) indicator
-                        if '(N)' in time_str or '(n)' in time_str:
-                            time_str = time_str.replace('(N)', '').replace('(n)', '').strip()
-                        
-                        try:
-                            return datetime.strptime(time_str, '%H:%M').time()
-                        except ValueError:
-                            raise ValueError(f"Invalid time format: {time_str}. Expected HH:MM or HH:MM (N)")
-                    
-                    # Parse hours and overtime (can be decimal or HH:MM format)
-                    def parse_hours(hours_str):
-                        if not hours_str or str(hours_str).strip() == '':
-                            return 0
-                        hours_str = str(hours_str).strip()
-                        
-                        # Check if it's in HH:MM format
-                        if ':' in hours_str:
-                            try:
-                                parts = hours_str.split(':')
-                                hours = int(parts[0])
-                                minutes = int(parts[1]) if len(parts) > 1 else 0
-                                return hours + (minutes / 60.0)
-                            except (ValueError, IndexError):
-                                return 0
-                        else:
-                            # Assume it's decimal format
-                            try:
-                                return float(hours_str)
-                            except (ValueError, TypeError):
-                                return 0
-                    
-                    # Create or update attendance record
-                    attendance, created_record = AttendanceRecord.objects.update_or_create(
-                        user=user,
-                        date=date,
-                        defaults={
-                            'in1': parse_time(row.get('IN1')),
-                            'out1': parse_time(row.get('OUT1')),
-                            'in2': parse_time(row.get('IN2')),
-                            'out2': parse_time(row.get('OUT2')),
-                            'in3': parse_time(row.get('IN3')),
-                            'out3': parse_time(row.get('OUT3')),
-                            'hours_worked': parse_hours(row.get('Hours Worked')),
-                            'overtime': parse_hours(row.get('Overtime')),
-                            'status': row.get('Status', 'P'),
-                            'shift': row.get('Shift')
-                        }
-                    )
-                    
-                    if created_record:
-                        created_count += 1
-                    else:
-                        updated_count += 1
-                    
-                    # Update progress success count
-                    progress_data['success'] = created_count + updated_count
-                    cache.set(f'upload_progress_{session_id}', progress_data, 300)
-                        
-                except Exception as e:
-                    error_count += 1
-                    error_msg = str(e)
-                    errors.append(f"Row {row_num}: {error_msg}")
-                    
-                    # Add failed row with error message for download
-                    failed_row = dict(row)
-                    failed_row['Error_Message'] = error_msg
-                    failed_row['Row_Number'] = row_num
-                    failed_rows.append(failed_row)
-                    
-                    # Update progress error count
-                    progress_data['errors'] = error_count
-                    cache.set(f'upload_progress_{session_id}', progress_data, 300)
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'job_id': job.id,
+                    'session_id': session_id,
+                    'status_url': reverse('upload_job_status', args=[job.id])
+                }, status=202)
             
-            # Create error file if there are errors
-            error_file_path = None
-            if failed_rows:
-                from django.core.files.base import ContentFile
-                import tempfile
-                import os
-                
-                # Create error CSV content
-                error_output = io.StringIO()
-                error_headers = ['Row_Number', 'Error_Message'] + original_headers
-                error_writer = csv.DictWriter(error_output, fieldnames=error_headers)
-                error_writer.writeheader()
-                
-                for failed_row in failed_rows:
-                    error_writer.writerow(failed_row)
-                
-                # Save error file
-                error_filename = f"errors_{csv_file.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                error_content = ContentFile(error_output.getvalue().encode('utf-8'))
-                
-                # Create upload history with error file
-                upload_history = UploadHistory.objects.create(
-                    uploaded_by=request.user,
-                    filename=csv_file.name,
-                    total_rows=created_count + updated_count + error_count,
-                    accepted_rows=created_count + updated_count,
-                    rejected_rows=error_count
-                )
-                upload_history.error_file.save(error_filename, error_content)
-                error_file_path = upload_history.error_file.url
+            if kind == 'validation':
+                messages.info(request, f'🔎 Validation queued! {csv_file.name} is being checked as job #{job.id}. Nothing will be saved.')
             else:
-                # Save upload history without error file
-                UploadHistory.objects.create(
-                    uploaded_by=request.user,
-                    filename=csv_file.name,
-                    total_rows=created_count + updated_count + error_count,
-                    accepted_rows=created_count + updated_count,
-                    rejected_rows=error_count
-                )
-            
-            # Provide detailed feedback with statistics
-            total_processed = created_count + updated_count
-            total_rows = created_count + updated_count + error_count
-            
-            if error_count == 0:
-                # All data uploaded successfully
-                messages.success(request, f'✅ Upload Complete! Successfully processed all {total_rows} records')
-                messages.info(request, f'📊 Statistics: {created_count} new records created, {updated_count} existing records updated')
-            elif total_processed > 0:
-                # Partial success
-                messages.success(request, f'✅ Partial Success! {total_processed} out of {total_rows} records processed successfully')
-                messages.info(request, f'📊 Statistics: {created_count} new, {updated_count} updated, {error_count} failed')
-                messages.warning(request, f'⚠️ {error_count} records failed - Download error file to fix and re-upload')
-                if error_file_path:
-                    messages.error(request, f'📥 <a href="{error_file_path}" class="alert-link">Download Error File</a> to see failed records')
-            else:
-                # Complete failure
-                messages.error(request, f'❌ Upload Failed! All {error_count} records could not be processed')
-                messages.info(request, f'📊 Statistics: 0 successful, {error_count} failed out of {total_rows} total rows')
-                if error_file_path:
-                    messages.error(request, f'📥 <a href="{error_file_path}" class="alert-link">Download Error File</a> to fix issues and try again')
+                messages.success(request, f'✅ Upload queued! {csv_file.name} is being processed as job #{job.id}')
+                messages.info(request, '📊 Results will appear in Recent Uploads and your notifications when processing finishes')
             
             return redirect('upload_attendance')
     else:
@@ -289,32 +120,41 @@ def upload_attendance(request):
         uploaded_by=request.user
     ).order_by('-upload_date')[:5]
     
+    recent_jobs = list(UploadJob.objects.filter(
+        uploaded_by=request.user, kind__in=['attendance', 'validation']
+    ).select_related('upload_history')[:5])
+    # The outcome of a dry run, until the user queues something else
+    last_validation = None
+    if recent_jobs and recent_jobs[0].kind == 'validation' and recent_jobs[0].status == 'completed':
+        last_validation = recent_jobs[0].result
+    
     return render(request, 'attendance/upload_attendance.html', {
         'form': form,
-        'recent_uploads': recent_uploads
+        'last_validation': last_validation,
+        'recent_uploads': recent_uploads,
+        'recent_jobs': recent_jobs,
+        # Shown once, right after the redirect from a new upload
+        'upload_session_id': request.session.pop('upload_session_id', None)
     })
 
 @login_required
 def edit_attendance(request, pk):
-    attendance = get_object_or_404(AttendanceRecord, pk=pk)
+    records = AttendanceRecord.objects.select_related('user')
+    if shards_configured():
+        # Ids are unique across the databases, see migrate_to_shards
+        records = CombinedQuerySet([on_shard(records, alias) for alias in record_aliases()])
+    attendance = get_object_or_404(records, pk=pk)
     
     # Check permissions
-    if request.user.role == 'user3' and attendance.user != request.user:
-        messages.error(request, 'Permission denied.')
-        return redirect('attendance_list')
-    elif request.user.role == 'user2':
-        assigned_employees = SupervisorAssignment.objects.filter(supervisor=request.user).values_list('employee', flat=True)
-        if attendance.user.id not in assigned_employees:
-            messages.error(request, 'Permission denied.')
-            return redirect('attendance_list')
-    elif request.user.role == 'user1' and attendance.user.company_name != request.user.company_name:
+    if not scope_for(request.user).can_see(attendance.user):
         messages.error(request, 'Permission denied.')
         return redirect('attendance_list')
     
     if request.method == 'POST':
         form = AttendanceEditForm(request.POST, instance=attendance)
         if form.is_valid():
-            form.save()
+            record = form.save()
+            refresh_records([(record.user_id, record.company_id, record.date)])
             messages.success(request, 'Attendance record updated successfully.')
             return redirect('attendance_list')
     else:
@@ -323,6 +163,7 @@ def edit_attendance(request, pk):
     return render(request, 'attendance/edit_attendance.html', {'form': form, 'attendance': attendance})
 
 @login_required
+@reporting_view
 def export_attendance(request):
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -332,113 +173,46 @@ def export_attendance(request):
             start_date = request.POST.get('start_date')
             end_date = request.POST.get('end_date')
             
-            if start_date and end_date:
-                deleted_count = AttendanceRecord.objects.filter(date__gte=start_date, date__lte=end_date).count()
-                AttendanceRecord.objects.filter(date__gte=start_date, date__lte=end_date).delete()
-                
-                # Clean up orphaned User3 accounts
-                from users.utils import cleanup_orphaned_user3_accounts
-                deleted_users_count, deleted_usernames = cleanup_orphaned_user3_accounts()
-                
-                message = f'Deleted {deleted_count} attendance records from {start_date} to {end_date}'
-                if deleted_users_count > 0:
-                    message += f' and removed {deleted_users_count} User3 accounts with no remaining attendance: {", ".join(deleted_usernames)}'
-                
-                messages.success(request, message)
+            params = date_range_params(start_date, end_date)
+            if params:
+                enqueue_purge(params, request.user, purge_description(params))
+                messages.success(request, f'Deleting attendance records from {start_date} to {end_date} in the background, then User3 accounts left without attendance. You will get a notification when it is done.')
                 return redirect('export_attendance')
             else:
                 messages.error(request, 'Both start date and end date are required for deletion.')
                 return redirect('export_attendance')
         
         # Handle export functionality
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill
-        
-        user = request.user
         start_date = request.POST.get('start_date')
         end_date = request.POST.get('end_date')
+        scope, _ = export_scope(request.user)
+        attendance_records = export_queryset(request.user, start_date, end_date)
         
-        # Get filtered queryset
-        if user.role == 'master':
-            attendance_records = AttendanceRecord.objects.all()
-        elif user.role == 'user1':
-            attendance_records = AttendanceRecord.objects.filter(user__company_name=user.company_name)
-        elif user.role == 'user2':
-            assigned_employees = SupervisorAssignment.objects.filter(supervisor=user).values_list('employee', flat=True)
-            attendance_records = AttendanceRecord.objects.filter(user__id__in=assigned_employees)
-        else:
-            attendance_records = AttendanceRecord.objects.none()
-        
-        # Apply date filters
-        if start_date:
-            attendance_records = attendance_records.filter(date__gte=start_date)
-        if end_date:
-            attendance_records = attendance_records.filter(date__lte=end_date)
-        
-        # Create Excel workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Attendance Report"
-        
-        # Header styling
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        export_format = request.POST.get('format', 'xlsx')
+        if export_format not in EXPORT_EXTENSIONS:
+            export_format = 'xlsx'
+        filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXPORT_EXTENSIONS[export_format]}"
+        content_type = {
+            'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            'csv': 'text/csv',
+            'csv.gz': 'application/gzip',
+        }[export_format]
         
-        # Headers
-        headers = [
-            'EP Number', 'Name', 'Company Name', 'Plant', 'Department', 'Trade', 'Skill', 'Shift',
-            'Date', 'IN1', 'OUT1', 'IN2', 'OUT2', 'IN3', 'OUT3', 'Hours Worked', 'Overtime', 'Status',
-            'Supervisor Remarks', 'Employee Remarks'
-        ]
+        # Identical reports (same scope, range, format and data) are served from disk
+        cached_export = CachedExport(scope, attendance_records, export_format, start_date, end_date) if scope else None
+        artifact = cached_export.open_cached() if cached_export else None
+        if artifact is None and export_format in ('csv', 'csv.gz'):
+            # Generated row batch by row batch while the client downloads
+            compress = export_format == 'csv.gz'
+            content = cached_export.stream() if cached_export else csv_stream(attendance_records, compress=compress)
+            response = StreamingHttpResponse(reporting_iterator(content), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+        if artifact is None:
+            # Built in a temp file and streamed from there, never held in memory
+            artifact = cached_export.build() if cached_export else build_xlsx_export(attendance_records)
         
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-        
-        # Data rows
-        for row, record in enumerate(attendance_records.select_related('user'), 2):
-            ws.cell(row=row, column=1, value=record.user.ep_number)
-            ws.cell(row=row, column=2, value=f"{record.user.first_name} {record.user.last_name}".strip())
-            ws.cell(row=row, column=3, value=record.user.company_name)
-            ws.cell(row=row, column=4, value=record.user.plant)
-            ws.cell(row=row, column=5, value=record.user.department)
-            ws.cell(row=row, column=6, value=record.user.trade)
-            ws.cell(row=row, column=7, value=record.user.skill)
-            ws.cell(row=row, column=8, value=record.shift or record.user.shift)
-            ws.cell(row=row, column=9, value=record.date.strftime('%d-%m-%Y'))
-            ws.cell(row=row, column=10, value=record.in1.strftime('%H:%M') if record.in1 else '')
-            ws.cell(row=row, column=11, value=record.out1.strftime('%H:%M') if record.out1 else '')
-            ws.cell(row=row, column=12, value=record.in2.strftime('%H:%M') if record.in2 else '')
-            ws.cell(row=row, column=13, value=record.out2.strftime('%H:%M') if record.out2 else '')
-            ws.cell(row=row, column=14, value=record.in3.strftime('%H:%M') if record.in3 else '')
-            ws.cell(row=row, column=15, value=record.out3.strftime('%H:%M') if record.out3 else '')
-            ws.cell(row=row, column=16, value=record.get_hours_formatted())
-            ws.cell(row=row, column=17, value=record.get_overtime_formatted())
-            ws.cell(row=row, column=18, value=record.status)
-            ws.cell(row=row, column=19, value=record.supervisor_remarks or '')
-            ws.cell(row=row, column=20, value=record.employee_remarks or '')
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Create response
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        wb.save(response)
-        return response
+        return FileResponse(artifact, as_attachment=True, filename=filename, content_type=content_type)
     
     # Show export form with record count for date range
     context = {}
@@ -446,15 +220,7 @@ def export_attendance(request):
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
         
-        if request.user.role == 'master':
-            record_count = AttendanceRecord.objects.filter(date__gte=start_date, date__lte=end_date).count()
-        elif request.user.role == 'user1':
-            record_count = AttendanceRecord.objects.filter(user__company_name=request.user.company_name, date__gte=start_date, date__lte=end_date).count()
-        elif request.user.role == 'user2':
-            assigned_employees = SupervisorAssignment.objects.filter(supervisor=request.user).values_list('employee', flat=True)
-            record_count = AttendanceRecord.objects.filter(user__id__in=assigned_employees, date__gte=start_date, date__lte=end_date).count()
-        else:
-            record_count = 0
+        record_count = export_queryset(request.user, start_date, end_date).count()
         
         context['record_count'] = record_count
         context['start_date'] = start_date
@@ -519,18 +285,112 @@ def upload_history(request):
     
     return render(request, 'attendance/upload_history.html', {'uploads': uploads})
 
-@login_required
-def upload_progress(request, session_id):
-    """Return upload progress as JSON for real-time updates"""
-    progress_data = cache.get(f'upload_progress_{session_id}', {
+# Longest a single server-sent-events response stays open; browsers reconnect after it closes
+PROGRESS_STREAM_SECONDS = MAX_WAIT
+
+def _job_progress(user, session_id):
+    """Progress for an upload whose cached progress is missing or expired"""
+    progress_data = {
         'total': 0,
         'processed': 0,
         'success': 0,
         'errors': 0,
         'status': 'not_found'
-    })
+    }
+    job = UploadJob.objects.filter(session_id=session_id, uploaded_by=user).first()
+    if job:
+        result = job.result
+        accepted = result.get('created', 0) + result.get('updated', 0) + result.get('unchanged', 0)
+        progress_data.update({
+            'total': result.get('total', accepted + result.get('errors', 0)),
+            'processed': accepted + result.get('errors', 0),
+            'success': accepted,
+            'errors': result.get('errors', 0),
+            'status': job.status,
+            'job_id': job.id
+        })
+    return progress_data
+
+def _progress_events(user, session_id):
+    deadline = time.monotonic() + PROGRESS_STREAM_SECONDS
+    version = -1
+    yield 'retry: 1000\n\n'
+    while time.monotonic() < deadline:
+        progress_data = wait_for_progress(session_id, version, timeout=max(deadline - time.monotonic(), 0))
+        if progress_data is None:
+            progress_data = _job_progress(user, session_id)
+        if progress_data.get('version', 0) != version or progress_data['status'] in FINAL_STATUSES:
+            yield f'data: {json.dumps(progress_data)}\n\n'
+        if progress_data['status'] in FINAL_STATUSES or progress_data['status'] == 'not_found':
+            return
+        version = progress_data.get('version', 0)
+
+@login_required
+def upload_progress(request, session_id):
+    """
+    Return upload progress as JSON for real-time updates.
+    ?wait=<version> waits up to MAX_WAIT seconds for progress to move past
+    that version, ?stream=1 (or Accept: text/event-stream) sends server-sent
+    events for as long. Clients ask again after either.
+    """
+    if request.GET.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        response = StreamingHttpResponse(_progress_events(request.user, session_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    if request.GET.get('wait') is not None:
+        try:
+            since_version = int(request.GET['wait'])
+        except ValueError:
+            since_version = 0
+        progress_data = wait_for_progress(session_id, since_version)
+    else:
+        progress_data = get_progress(session_id)
+    
+    if progress_data is None:
+        progress_data = _job_progress(request.user, session_id)
     
     return HttpResponse(
         json.dumps(progress_data),
         content_type='application/json'
-    )
\ No newline at end of file
+    )
+
+@login_required
+def upload_job_status(request, pk):
+    """Return the state of a queued upload as JSON"""
+    job = get_object_or_404(UploadJob, pk=pk)
+    if request.user.role != 'master' and job.uploaded_by != request.user:
+        return JsonResponse({'error': 'Permission denied.'}, status=403)
+    
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'filename': job.filename,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.upload_history and job.upload_history.error_file:
+        data['error_file'] = job.upload_history.error_file.url
+    if job.kind == 'validation' and job.result.get('error_file_url'):
+        data['error_file'] = job.result['error_file_url']
+    if job.kind == 'purge' and job.result.get('report'):
+        data['report'] = report_url(job.result['report'])
+    return JsonResponse(data)
+
+
+@login_required
+def cleanup_report(request, name):
+    """Download a list of removed accounts; they hold personal details, so only masters can"""
+    if request.user.role != 'master':
+        messages.error(request, 'Permission denied.')
+        return redirect('attendance_list')
+
+    storage = report_storage()
+    if not name.endswith('.csv') or not storage.exists(name):
+        raise Http404('Report not found')
+    return FileResponse(storage.open(name, 'rb'), as_attachment=True, filename=name, content_type='text/csv')
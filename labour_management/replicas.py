@@ -0,0 +1,148 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+# Only these apps' tables are read from the replica; sessions and auth stay on the primary
+REPLICA_APPS = {'attendance', 'users'}
+
+# Set on a user's browser after a request that wrote; until it expires they read the primary
+PRIMARY_COOKIE = 'read_primary_until'
+
+
+class RequestRouting:
+    """Where the current request may read from, and whether it has written"""
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky
+        self.reporting = False
+        self.wrote = False
+
+    @property
+    def use_replica(self):
+        return self.reporting and not self.sticky and not self.wrote
+
+
+_routing = ContextVar('request_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of reporting views (see reporting_view) to the
+    'replica' database when one is configured; everything else, all writes
+    and every read inside a transaction use the primary. A user who has
+    just written reads the primary for REPLICA_STICKY_SECONDS, so they see
+    their own changes whatever the replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (routing is not None and routing.use_replica and replica_configured()
+                and model._meta.app_label in REPLICA_APPS
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None and model._meta.app_label in REPLICA_APPS:
+            # Later reads of this request, and of the user's next few, see the write
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica's schema comes from the primary with its data
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Tracks each request's routing and keeps users who wrote on the primary for a while"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            sticky = float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            sticky = False
+        routing = RequestRouting(sticky=sticky)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if routing.wrote and replica_configured():
+            response.set_cookie(PRIMARY_COOKIE, f'{time.time() + settings.REPLICA_STICKY_SECONDS:.0f}',
+                                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+
+def reporting_view(view):
+    """Let a read-heavy view read from the replica; put it under @login_required so auth reads the primary"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        routing = _routing.get()
+        if routing is None:
+            return view(request, *args, **kwargs)
+        previous, routing.reporting = routing.reporting, True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            routing.reporting = previous
+    return wrapped
+
+
+def reporting_iterator(iterable):
+    """
+    Iterate iterable with the current view's routing, for content a
+    streaming response generates after the view has returned.
+    """
+    routing = _routing.get()
+    if routing is None:
+        return iterable
+
+    def iterate():
+        iterator = iter(iterable)
+        while True:
+            token = _routing.set(routing)
+            previous, routing.reporting = routing.reporting, True
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                routing.reporting = previous
+                _routing.reset(token)
+            yield item
+    return iterate()
+
+
+@contextmanager
+def read_primary():
+    """Read from the primary inside this block, e.g. right after the data changed"""
+    routing = _routing.get()
+    if routing is None:
+        yield
+        return
+    previous, routing.sticky = routing.sticky, True
+    try:
+        yield
+    finally:
+        routing.sticky = previous
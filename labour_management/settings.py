@@ -1,4 +1,6 @@
+import json
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
@@ -37,6 +39,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'labour_management.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'labour_management.urls'
@@ -60,13 +63,66 @@ TEMPLATES = [
 WSGI_APPLICATION = 'labour_management.wsgi.application'
 
 # Database configuration
+# SQLite with WAL and immediate write locks (labour_management/sqlite), so uploads
+# and edits of different companies wait their turn for the single writer lock
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'labour_management.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a writer waits for the lock before "database is locked"
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 30)),
+        },
+    }
+}
+
+# Reporting views (lists, exports, dashboards) read from a 'replica' alias when one
+# is configured, e.g. a copy of the SQLite file kept current outside the app
+if os.environ.get('REPLICA_DATABASE_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['REPLICA_DATABASE_NAME'],
+        'TEST': {'MIRROR': 'default'},
     }
+
+# Companies whose attendance is kept in a database of their own, as JSON
+# {"company name": "alias"}; companies may share an alias. Each alias is a SQLite
+# file next to db.sqlite3. Run `manage.py migrate_to_shards` after changing it
+COMPANY_SHARDS = json.loads(os.environ.get('COMPANY_SHARDS', '{}'))
+for _alias in set(COMPANY_SHARDS.values()):
+    DATABASES[_alias] = {**DATABASES['default'], 'NAME': BASE_DIR / f'db_{_alias}.sqlite3'}
+
+# Threads reading the databases of a cross-company list, export or count at once
+SHARD_FAN_OUT_THREADS = int(os.environ.get('SHARD_FAN_OUT_THREADS', 8))
+
+DATABASE_ROUTERS = ['labour_management.shards.CompanyShardRouter', 'labour_management.replicas.ReplicaRouter']
+
+# Seconds a user who wrote keeps reading the primary; keep it above the replica's lag
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+# Upload progress is written by the upload worker and read by any web worker,
+# so it lives in a cache every process on the host can see
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'progress': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('PROGRESS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'labour_management_progress')),
+    },
 }
 
+# Employees created by uploads get a cheap provisional hash of their EP number,
+# upgraded to PBKDF2 on first login
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'users.hashers.ProvisionalPasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator', 'OPTIONS': {'min_length': 8}},
@@ -89,6 +145,23 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Error reports, validation files and cleanup reports older than this are removed by sweep_upload_files
+UPLOAD_FILE_RETENTION_DAYS = int(os.environ.get('UPLOAD_FILE_RETENTION_DAYS', 30))
+
+# Lists of the accounts removed by purges and cleanups, downloaded by masters
+# through the cleanup_report view; keep it outside MEDIA_ROOT, which is served
+CLEANUP_REPORT_DIR = os.environ.get('CLEANUP_REPORT_DIR', BASE_DIR / 'cleanup_reports')
+
+# Rows parsed while validating an upload, read back by its import; keep it outside MEDIA_ROOT
+VALIDATION_CACHE_DIR = os.environ.get('VALIDATION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'labour_management_validations'))
+
+# Generated attendance exports, reused until the underlying records change
+EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'labour_management_exports'))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_MB', 1024)) * 1024 * 1024
+
+# archive_attendance moves attendance older than this many whole months to the archive table
+ATTENDANCE_ARCHIVE_MONTHS = int(os.environ.get('ATTENDANCE_ARCHIVE_MONTHS', 24))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -21,6 +21,18 @@ DATABASES = {
     }
 }
 
+# Read replica for the reporting views, if the host has one
+if os.environ.get('REPLICA_DATABASE_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['REPLICA_DATABASE_HOST'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Company shards (COMPANY_SHARDS) are databases on the same server, named after the alias
+for _alias in set(COMPANY_SHARDS.values()):
+    DATABASES[_alias] = {**DATABASES['default'], 'NAME': f"{DATABASES['default']['NAME']}_{_alias}"}
+
 # Static files
 STATIC_ROOT = '/home/yourusername/mysite/static'
 MEDIA_ROOT = '/home/yourusername/mysite/media'
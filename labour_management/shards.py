@@ -0,0 +1,336 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import cmp_to_key
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+
+# Kept in the database of their company's shard. UploadHistory stays on the default
+# database: an upload belongs to whoever made it, not to one company, as a master's
+# file can name several; its jobs point at it, and the duplicate file check and
+# the upload lists read it for every company. It gets one row per upload, not per
+# attendance row, so it is not what keeps writers on the default database waiting.
+SHARDED_MODELS = {
+    'attendance.attendancerecord',
+    'attendance.archivedattendancerecord',
+    'attendance.dailyattendancesummary',
+    'attendance.monthlyattendancesummary',
+}
+
+# Copied into every shard for the foreign keys and joins of the sharded models. Written
+# on the default database only; mirror() brings the copies in line, parents first
+MIRRORED_MODELS = ['users.company', 'users.user', 'users.supervisorassignment']
+
+# The attendance ids a shard hands out start at a multiple of this (see migrate_to_shards),
+# so a record id is unique across the databases
+SHARD_ID_SPAN = 10 ** 12
+
+# Rows copied per statement by mirror()
+MIRROR_BATCH_SIZE = 500
+
+# How each aggregate of the parts combines into one
+COMBINE_AGGREGATES = {'Count': sum, 'Sum': sum, 'Max': max, 'Min': min}
+
+_shard = ContextVar('shard', default=DEFAULT_DB_ALIAS)
+
+
+def shards_configured():
+    return bool(settings.COMPANY_SHARDS)
+
+
+def shard_aliases():
+    return sorted(set(settings.COMPANY_SHARDS.values()))
+
+
+def record_aliases():
+    """Every database holding attendance: the default one, then the shards"""
+    return [DEFAULT_DB_ALIAS] + shard_aliases()
+
+
+def shards_for_companies(company_ids):
+    """{company_id: alias of the database holding its attendance}; None is the blank company"""
+    company_ids = set(company_ids)
+    aliases = dict.fromkeys(company_ids, DEFAULT_DB_ALIAS)
+    if shards_configured() and company_ids - {None}:
+        Company = apps.get_model('users', 'Company')
+        names = Company.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=company_ids - {None}).values_list('pk', 'name')
+        for pk, name in names:
+            aliases[pk] = settings.COMPANY_SHARDS.get(name, DEFAULT_DB_ALIAS)
+    return aliases
+
+
+def shard_for_company(company_id):
+    return shards_for_companies([company_id])[company_id]
+
+
+def company_filter(alias, prefix=''):
+    """Q for the rows, e.g. users with prefix='', of the companies whose attendance alias holds"""
+    if alias == DEFAULT_DB_ALIAS:
+        listed = list(settings.COMPANY_SHARDS)
+        return Q(**{f'{prefix}company__isnull': True}) | ~Q(**{f'{prefix}company__name__in': listed})
+    names = [name for name, shard in settings.COMPANY_SHARDS.items() if shard == alias]
+    return Q(**{f'{prefix}company__name__in': names})
+
+
+def current_shard():
+    """Where the sharded models are read and written when nothing else decides"""
+    return _shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    """Read and write the sharded models in alias inside this block"""
+    token = _shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+def on_shard(queryset, alias):
+    """queryset read from alias; the default database is left to the routers, e.g. for the replica"""
+    return queryset if alias == DEFAULT_DB_ALIAS else queryset.using(alias)
+
+
+class CompanyShardRouter:
+    """
+    Keeps the attendance, live, archived and summarized, of the companies
+    in COMPANY_SHARDS ({company name: database alias}) in databases of
+    their own, so one company's uploads and purges don't queue for another
+    company's write lock and a large company's tables don't slow everyone
+    else's queries. The default database holds the rest: the other
+    companies' attendance and every other table. Each shard has copies of
+    the companies, users and supervisor assignments for its joins.
+
+    An attendance instance stays in the database it was read from; one
+    reached through a user goes to the user's company's database; any
+    other query uses the shard chosen with use_shard(), by default the
+    default database. Code working across companies loops over
+    record_aliases() or reads a CombinedQuerySet.
+    """
+
+    def _shard_for(self, model, hints):
+        if not shards_configured() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            alias = current_shard()
+        elif instance._state.db in shard_aliases():
+            alias = instance._state.db
+        elif instance._state.db and instance._meta.label_lower in SHARDED_MODELS:
+            alias = DEFAULT_DB_ALIAS
+        elif hasattr(instance, 'company_id'):
+            alias = shard_for_company(instance.company_id)
+        else:
+            alias = current_shard()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Shards have copies of the users and companies the attendance points at
+        if shards_configured() and {obj1._state.db, obj2._state.db} <= set(record_aliases()):
+            return True
+        return None
+
+
+def fan_out(function, items):
+    """
+    function(item) for each item, e.g. each database alias, in parallel
+    threads; returns the results in order. Each thread runs in a copy of
+    the caller's context with connections of its own, so it only sees
+    committed data.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [function(item) for item in items]
+
+    def run(context, item):
+        try:
+            return context.run(function, item)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=min(len(items), settings.SHARD_FAN_OUT_THREADS)) as executor:
+        return list(executor.map(run, [copy_context() for _ in items], items))
+
+
+def _upsert(model, rows, alias):
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    options = {'update_conflicts': True, 'update_fields': fields}
+    if connections[alias].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = [model._meta.pk.name]
+    model.objects.using(alias).bulk_create(rows, **options)
+
+
+def mirror(model, ids):
+    """
+    Bring the shards' copies of these rows of a MIRRORED_MODELS model in
+    line with the default database: copied again, or deleted if they are
+    gone there, through the collector with whatever references them.
+    """
+    if not shards_configured():
+        return
+    ids = list(ids)
+    for start in range(0, len(ids), MIRROR_BATCH_SIZE):
+        batch = ids[start:start + MIRROR_BATCH_SIZE]
+        rows = list(model.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=batch))
+        gone = set(batch) - {row.pk for row in rows}
+        for alias in shard_aliases():
+            if rows:
+                _upsert(model, rows, alias)
+            if gone:
+                model.objects.using(alias).filter(pk__in=gone).delete()
+
+
+def sync_mirrors(alias, batch_size=MIRROR_BATCH_SIZE):
+    """Copy every row of MIRRORED_MODELS into a shard and drop the copies of rows gone since"""
+    models = [apps.get_model(label) for label in MIRRORED_MODELS]
+    for model in models:
+        rows = model.objects.using(DEFAULT_DB_ALIAS).order_by('pk').iterator(chunk_size=batch_size)
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            _upsert(model, batch, alias)
+    for model in reversed(models):
+        kept = set(model.objects.using(DEFAULT_DB_ALIAS).values_list('pk', flat=True))
+        gone = [pk for pk in model.objects.using(alias).values_list('pk', flat=True) if pk not in kept]
+        for start in range(0, len(gone), batch_size):
+            model.objects.using(alias).filter(pk__in=gone[start:start + batch_size]).delete()
+
+
+def _compare(row, other, positions):
+    for index, descending in positions:
+        value, other_value = row[index], other[index]
+        if value == other_value:
+            continue
+        # NULL sorts first, as on SQLite and MySQL
+        if value is None or (other_value is not None and value < other_value):
+            result = -1
+        else:
+            result = 1
+        return -result if descending else result
+    return 0
+
+
+class MergedRows:
+    """values_list() rows of several databases, each query already sorted, merged as they are read"""
+
+    def __init__(self, queries, fields, ordering):
+        self.queries = queries
+        positions = [(fields.index(name.lstrip('-')), name.startswith('-')) for name in ordering]
+        self.key = cmp_to_key(lambda row, other: _compare(row, other, positions))
+
+    def iterator(self, chunk_size=2000):
+        return heapq.merge(*(query.iterator(chunk_size=chunk_size) for query in self.queries), key=self.key)
+
+    def __iter__(self):
+        return self.iterator()
+
+
+class CombinedQuerySet:
+    """
+    Querysets of the same records in several tables or databases, e.g.
+    live and archived attendance, or a master's attendance across the
+    shards, read as one. Covers what the attendance list, the export and
+    its cache need: filtering, ordering, slicing, get(), counts,
+    aggregates and values_list(). Different databases are read in parallel.
+    """
+
+    def __init__(self, parts, ordering=None):
+        self.parts = list(parts)
+        self.model = self.parts[0].model
+        self.ordering = list(self.model._meta.ordering if ordering is None else ordering)
+
+    def _apply(self, method, *args, **kwargs):
+        return CombinedQuerySet([getattr(part, method)(*args, **kwargs) for part in self.parts], self.ordering)
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply('exclude', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._apply('select_related', *fields)
+
+    def order_by(self, *fields):
+        combined = self._apply('order_by', *fields)
+        combined.ordering = list(fields)
+        return combined
+
+    @property
+    def query(self):
+        """Identifies the query, e.g. for cached counts"""
+        return ' UNION ALL '.join(f'{part.db}: {part.query}' for part in self.parts)
+
+    def _by_database(self):
+        databases = {}
+        for part in self.parts:
+            databases.setdefault(part.db, []).append(part)
+        return list(databases.values())
+
+    def _each(self, function):
+        """function(part) of every part, the databases in parallel"""
+        results = fan_out(lambda parts: [function(part) for part in parts], self._by_database())
+        return [result for database in results for result in database]
+
+    def count(self):
+        return sum(self._each(lambda part: part.count()))
+
+    def count_up_to(self, limit):
+        """count(), reading at most limit rows of each part"""
+        return min(sum(self._each(lambda part: part.order_by().values('pk')[:limit].count())), limit)
+
+    def aggregate(self, **aggregates):
+        parts = self._each(lambda part: part.aggregate(**aggregates))
+        result = {}
+        for name, aggregate in aggregates.items():
+            values = [part[name] for part in parts if part[name] is not None]
+            result[name] = COMBINE_AGGREGATES[type(aggregate).__name__](values) if values else None
+        return result
+
+    def values_list(self, *fields):
+        """
+        Rows of every part, in this ordering where it is among the fields:
+        one UNION ALL query per database, merged as they are read.
+        """
+        ordering = [name for name in self.ordering if name.lstrip('-') in fields]
+        queries = []
+        for parts in self._by_database():
+            first, *rest = [part.order_by().values_list(*fields) for part in parts]
+            queries.append((first.union(*rest, all=True) if rest else first).order_by(*ordering))
+        return queries[0] if len(queries) == 1 else MergedRows(queries, fields, ordering)
+
+    def _merge(self, rows):
+        # Stable sorts from the last ordering field to the first
+        for name in reversed(self.ordering):
+            field = name.lstrip('-')
+            rows.sort(key=lambda row: getattr(row, field), reverse=name.startswith('-'))
+        return rows
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        stop = key.stop
+        parts = self._each(lambda part: list(part[:stop] if stop is not None else part))
+        return self._merge([row for part in parts for row in part])[key]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def get(self, **kwargs):
+        rows = self.filter(**kwargs)[:2]
+        if not rows:
+            raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+        if len(rows) > 1:
+            raise self.model.MultipleObjectsReturned(f'get() returned more than one {self.model._meta.object_name}')
+        return rows[0]
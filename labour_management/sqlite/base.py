@@ -0,0 +1,28 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite tuned for the upload worker writing while web requests read and
+    write the same file. SQLite allows one writer at a time, so the aim is
+    that writers queue for the lock instead of failing, and readers never
+    wait for them.
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        # Readers see the last commit while a write is in progress
+        conn.execute('PRAGMA journal_mode = WAL')
+        # WAL stays consistent without an fsync per commit. The trade-off is
+        # durability: a power loss or OS crash (not a process crash) can roll
+        # back the last commits before the next checkpoint, e.g. the final
+        # chunks of an upload, which re-uploading the file restores. Use
+        # FULL where losing acknowledged writes is not acceptable.
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # A deferred transaction that reads and then writes can't wait for the lock
+        # once another writer has committed; it fails with "database is locked".
+        # Taking the lock up front makes it wait out the busy timeout instead.
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -1,11 +1,16 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, SupervisorAssignment, AuditLog, Notification
+from .models import Company, User, SupervisorAssignment, AuditLog, Notification
+
+@admin.register(Company)
+class CompanyAdmin(admin.ModelAdmin):
+    list_display = ['name', 'created_at']
+    search_fields = ['name']
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ['username', 'email', 'role', 'ep_number', 'company_name', 'is_active']
-    list_filter = ['role', 'company_name', 'is_active']
+    list_filter = ['role', 'company', 'is_active']
     search_fields = ['username', 'email', 'ep_number', 'first_name', 'last_name']
     
     fieldsets = UserAdmin.fieldsets + (
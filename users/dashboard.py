@@ -0,0 +1,121 @@
+import hashlib
+import json
+import time
+import uuid
+from datetime import date
+from django.conf import settings
+from django.core.cache import cache
+from attendance.progress import progress_cache
+from attendance.summaries import company_status_counts, employee_status_counts
+from labour_management.replicas import read_primary
+from labour_management.shards import shard_for_company, use_shard
+from .models import User
+from .scope import scope_for
+
+# Cached dashboards are rebuilt at least this often, whatever happens to the versions
+DASHBOARD_TIMEOUT = 10 * 60
+
+# Moves on every change; the master dashboard covers all companies
+ANY_CHANGE_KEY = 'dashboard_version_any'
+# Moves on changes that may touch every company, e.g. deleting a date range
+ALL_COMPANIES_KEY = 'dashboard_version_all_companies'
+# When any version last moved
+CHANGED_AT_KEY = 'dashboard_changed_at'
+
+
+def company_version_key(company_id):
+    return f'dashboard_version_company_{company_id}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def data_versions(keys):
+    """
+    Current value of each version key. A version that was never set or
+    has been lost starts fresh, so it can't match any older dashboard.
+    """
+    versions = progress_cache().get_many(keys)
+    for key in keys:
+        if key not in versions:
+            progress_cache().add(key, _new_version(), None)
+            versions[key] = progress_cache().get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_dashboards(company_ids):
+    """Invalidate the dashboards of the given companies (None for employees without one)"""
+    progress_cache().set_many(
+        {company_version_key(company_id): _new_version() for company_id in set(company_ids)}, None
+    )
+    progress_cache().set(ANY_CHANGE_KEY, _new_version(), None)
+    progress_cache().set(CHANGED_AT_KEY, time.time(), None)
+
+
+def bump_all_dashboards():
+    progress_cache().set_many(
+        {ALL_COMPANIES_KEY: _new_version(), ANY_CHANGE_KEY: _new_version(), CHANGED_AT_KEY: time.time()}, None
+    )
+
+
+def dashboard_key(user):
+    """
+    Cache key of the user's dashboard: users who see the same records share
+    it, and it changes with the data version of every company they see.
+    """
+    scope = scope_for(user)
+    if user.role == 'master':
+        version_keys = [ANY_CHANGE_KEY]
+    else:
+        company_ids = {user.company_id}
+        if user.role == 'user2':
+            company_ids.update(scope.users().order_by().values_list('company_id', flat=True).distinct())
+        version_keys = [ALL_COMPANIES_KEY] + sorted(company_version_key(company_id) for company_id in company_ids)
+    # The company admin's monthly figures start over each month
+    parts = [user.role, scope.label, date.today().strftime('%Y-%m'), data_versions(version_keys)]
+    return 'dashboard_' + hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def build_dashboard(user):
+    """The role's dashboard figures, evaluated so they can be cached"""
+    if user.role == 'master':
+        return {
+            'total_companies': User.objects.filter(role='user1').values('company_id').distinct().count(),
+            'total_users': User.objects.count(),
+            'recent_uploads': list(scope_for(user).records().select_related('user').order_by('-created_at')[:10]),
+        }
+    if user.role == 'user1':
+        with use_shard(shard_for_company(user.company_id)):
+            return {
+                'company_employees': User.objects.filter(company_id=user.company_id, role='user3').count(),
+                'company_supervisors': User.objects.filter(company_id=user.company_id, role='user2').count(),
+                'recent_attendance': list(scope_for(user).records().select_related('user').order_by('-date')[:10]),
+                'month_attendance': company_status_counts(user.company_id, date.today().replace(day=1)),
+            }
+    if user.role == 'user2':
+        scope = scope_for(user)
+        return {
+            'assigned_employees': list(scope.users()),
+            'recent_attendance': list(scope.records().select_related('user').order_by('-date')[:10]),
+        }
+    if user.role == 'user3':
+        with use_shard(shard_for_company(user.company_id)):
+            return {'attendance_summary': employee_status_counts(user.pk)}
+    return {}
+
+
+def dashboard_context(user):
+    """The user's dashboard figures, from the cache until their data changes"""
+    key = dashboard_key(user)
+    context = cache.get(key)
+    if context is None:
+        if time.time() - (progress_cache().get(CHANGED_AT_KEY) or 0) < settings.REPLICA_STICKY_SECONDS:
+            # A read replica may not have the change behind the new version yet,
+            # and what is built now is cached under it
+            with read_primary():
+                context = build_dashboard(user)
+        else:
+            context = build_dashboard(user)
+        cache.set(key, context, DASHBOARD_TIMEOUT)
+    return context
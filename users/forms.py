@@ -34,5 +34,5 @@ class SupervisorAssignmentForm(forms.ModelForm):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         if user and user.role == 'user1':
-            self.fields['supervisor'].queryset = User.objects.filter(role='user2', company_name=user.company_name)
-            self.fields['employee'].queryset = User.objects.filter(role='user3', company_name=user.company_name)
\ No newline at end of file
+            self.fields['supervisor'].queryset = User.objects.filter(role='user2', company_id=user.company_id)
+            self.fields['employee'].queryset = User.objects.filter(role='user3', company_id=user.company_id)
\ No newline at end of file
@@ -1,19 +1,35 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from attendance.purge import PURGE_BATCH_SIZE, report_storage
+from users.models import Company
 from users.utils import cleanup_orphaned_user3_accounts
 
 class Command(BaseCommand):
     help = 'Remove User3 accounts that have no attendance records'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only remove employees of this company')
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Accounts deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Count and list the accounts without deleting them')
+
     def handle(self, *args, **options):
-        deleted_count, deleted_usernames = cleanup_orphaned_user3_accounts()
+        company = None
+        if options['company']:
+            company = Company.objects.filter(name=options['company']).first()
+            if company is None:
+                raise CommandError(f"Company {options['company']} not found")
+
+        deleted_count, report = cleanup_orphaned_user3_accounts(
+            company=company, batch_size=options['batch_size'], dry_run=options['dry_run']
+        )
         
         if deleted_count > 0:
+            verb = 'Would remove' if options['dry_run'] else 'Successfully removed'
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'Successfully removed {deleted_count} orphaned User3 accounts: {", ".join(deleted_usernames)}'
+                    f'{verb} {deleted_count} orphaned User3 accounts, listed in {report_storage().path(report)}'
                 )
             )
         else:
             self.stdout.write(
                 self.style.SUCCESS('No orphaned User3 accounts found.')
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the trigram index behind employee and user searches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Users indexed per batch')
+
+    def handle(self, *args, **options):
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} users.'))
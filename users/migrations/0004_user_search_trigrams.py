@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_existing_users(apps, schema_editor):
+    from users.search import SEARCH_FIELDS, user_trigrams
+
+    User = apps.get_model('users', 'User')
+    UserSearchTrigram = apps.get_model('users', 'UserSearchTrigram')
+    db = schema_editor.connection.alias
+    batch = []
+    for values in User.objects.using(db).values('id', *SEARCH_FIELDS).iterator(chunk_size=2000):
+        batch.extend(UserSearchTrigram(user_id=values['id'], trigram=gram) for gram in user_trigrams(values))
+        if len(batch) >= 10000:
+            UserSearchTrigram.objects.using(db).bulk_create(batch)
+            batch = []
+    UserSearchTrigram.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_trigrams', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('trigram', 'user')},
+            },
+        ),
+        migrations.RunPython(index_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_companies(apps, schema_editor):
+    Company = apps.get_model('users', 'Company')
+    User = apps.get_model('users', 'User')
+    db = schema_editor.connection.alias
+    names = User.objects.using(db).exclude(company_name__isnull=True).exclude(company_name='').values_list('company_name', flat=True).distinct()
+    for name in names:
+        company, _ = Company.objects.using(db).get_or_create(name=name)
+        User.objects.using(db).filter(company_name=name).update(company=company)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_search_trigrams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Company',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'companies',
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='company',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='users.company'),
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_company_role_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_role_company_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['company', 'role'], name='user_company_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'company'], name='user_role_company_idx'),
+        ),
+        migrations.RunPython(create_companies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def reindex_users(apps, schema_editor):
+    from users.search import SEARCH_FIELDS, user_trigrams
+
+    User = apps.get_model('users', 'User')
+    UserSearchTrigram = apps.get_model('users', 'UserSearchTrigram')
+    db = schema_editor.connection.alias
+    UserSearchTrigram.objects.using(db).all().delete()
+    batch = []
+    for values in User.objects.using(db).values('id', *SEARCH_FIELDS).iterator(chunk_size=2000):
+        batch.extend(UserSearchTrigram(user_id=values['id'], trigram=gram) for gram in user_trigrams(values))
+        if len(batch) >= 10000:
+            UserSearchTrigram.objects.using(db).bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    UserSearchTrigram.objects.using(db).bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    """Trigrams are now stored casefolded and without accents"""
+
+    dependencies = [
+        ('users', '0005_company'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_users, migrations.RunPython.noop),
+    ]
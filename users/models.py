@@ -1,5 +1,26 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from labour_management.shards import record_aliases
+
+class CompanyManager(models.Manager):
+    def for_name(self, name):
+        """The company called name, created on first use; None for a blank name"""
+        if not name:
+            return None
+        company, _ = self.get_or_create(name=name)
+        return company
+
+class Company(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = CompanyManager()
+    
+    class Meta:
+        verbose_name_plural = 'companies'
+    
+    def __str__(self):
+        return self.name
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -12,6 +33,8 @@ class User(AbstractUser):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='user3')
     ep_number = models.CharField(max_length=50, unique=True, null=True, blank=True)
     company_name = models.CharField(max_length=200, null=True, blank=True)
+    # Follows company_name on every save, see save()
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
     plant = models.CharField(max_length=100, null=True, blank=True)
     department = models.CharField(max_length=100, null=True, blank=True)
     trade = models.CharField(max_length=100, null=True, blank=True)
@@ -21,8 +44,32 @@ class User(AbstractUser):
     end_date = models.DateField(null=True, blank=True)
     force_password_change = models.BooleanField(default=True)
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Company pages filter by company and role, the master dashboard by role alone
+            models.Index(fields=['company', 'role'], name='user_company_role_idx'),
+            models.Index(fields=['role', 'company'], name='user_role_company_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        sync_company = update_fields is None or 'company_name' in update_fields
+        if sync_company:
+            self.company = Company.objects.for_name(self.company_name)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'company'}
+        if sync_company and self.pk:
+            # Attendance carries a copy of the company for company-scoped queries; copied
+            # before the save so post_save receivers already see the records moved. With
+            # company shards it is copied where the records are; migrate_to_shards moves
+            # them if the new company's attendance is kept in another database
+            for alias in record_aliases():
+                for records in (self.attendance_records, self.archived_attendance_records):
+                    records.db_manager(alias).exclude(company_id=self.company_id).update(company_id=self.company_id)
+        super().save(*args, **kwargs)
 
 class SupervisorAssignment(models.Model):
     supervisor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='supervised_employees')
@@ -69,4 +116,19 @@ class Notification(models.Model):
     objects = NotificationManager()
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Unread count in the navigation bar of every page
+            models.Index(fields=['user', 'is_read'], name='notification_unread_idx'),
+        ]
+
+class UserSearchTrigram(models.Model):
+    """
+    Three-character pieces of a user's searchable fields, maintained by
+    users.search, so substring searches can find users through an index.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_trigrams')
+    trigram = models.CharField(max_length=3)
+    
+    class Meta:
+        unique_together = ['trigram', 'user']
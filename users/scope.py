@@ -0,0 +1,140 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Subquery
+from attendance.models import AttendanceRecord
+from attendance.progress import progress_cache
+from labour_management.shards import (
+    CombinedQuerySet, on_shard, record_aliases, shard_for_company, shards_configured, shards_for_companies,
+)
+from .models import SupervisorAssignment, User
+
+# Assigned-employee sets are recomputed at least this often, whatever happens to the signals
+ASSIGNMENT_TIMEOUT = 60 * 60
+
+
+def assignment_key(supervisor_id):
+    return f'supervisor_employees_{supervisor_id}'
+
+
+def assigned_employee_ids(supervisor_id):
+    """Ids of a supervisor's employees, from the shared cache when possible"""
+    key = assignment_key(supervisor_id)
+    employee_ids = progress_cache().get(key)
+    if employee_ids is None:
+        employee_ids = frozenset(
+            SupervisorAssignment.objects.filter(supervisor_id=supervisor_id).values_list('employee_id', flat=True)
+        )
+        progress_cache().set(key, employee_ids, ASSIGNMENT_TIMEOUT)
+    return employee_ids
+
+
+def forget_assignments(supervisor_id):
+    progress_cache().delete(assignment_key(supervisor_id))
+
+
+class RecordScope:
+    """
+    Which employees, and so which attendance records, a user may see:
+    everything for a master, their company for a company admin, their
+    assigned employees for a supervisor and their own records for an
+    employee. Use scope_for() to get the one memoized on the user.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.role = user.role
+        self._employee_ids = None
+        self._aliases = None
+
+    @property
+    def employee_ids(self):
+        """The supervisor's assigned employee ids, looked up once, for labels and permission checks"""
+        if self._employee_ids is None:
+            self._employee_ids = assigned_employee_ids(self.user.pk)
+        return self._employee_ids
+
+    def assigned(self):
+        """
+        Subquery of the supervisor's employee ids. Queries filter on this
+        rather than employee_ids: the database reads the current
+        assignments, and a large team doesn't turn into a long IN list.
+        """
+        return Subquery(SupervisorAssignment.objects.filter(supervisor_id=self.user.pk).values('employee_id'))
+
+    @property
+    def label(self):
+        """Identical for users who see exactly the same records"""
+        if self.role == 'master':
+            return 'all'
+        if self.role == 'user1':
+            return f'company:{self.user.company_id}'
+        if self.role == 'user2':
+            return 'employees:' + ','.join(str(pk) for pk in sorted(self.employee_ids))
+        if self.role == 'user3':
+            return f'employee:{self.user.pk}'
+        return None
+
+    def users(self):
+        """Users whose records are visible"""
+        if self.role == 'master':
+            return User.objects.all()
+        if self.role == 'user1':
+            return User.objects.filter(company_id=self.user.company_id)
+        if self.role == 'user2':
+            return User.objects.filter(id__in=self.assigned())
+        if self.role == 'user3':
+            return User.objects.filter(id=self.user.pk)
+        return User.objects.none()
+
+    def aliases(self):
+        """The databases holding the visible records; several only with company shards"""
+        if not shards_configured():
+            return [DEFAULT_DB_ALIAS]
+        if self._aliases is None:
+            if self.role == 'master':
+                self._aliases = record_aliases()
+            elif self.role == 'user2':
+                company_ids = self.users().order_by().values_list('company_id', flat=True).distinct()
+                self._aliases = sorted(set(shards_for_companies(company_ids).values())) or [DEFAULT_DB_ALIAS]
+            else:
+                self._aliases = [shard_for_company(self.user.company_id)]
+        return self._aliases
+
+    def records(self, model=AttendanceRecord):
+        """Visible attendance records, or archived ones for model=ArchivedAttendanceRecord"""
+        parts = self.record_parts(model)
+        return parts[0] if len(parts) == 1 else CombinedQuerySet(parts)
+
+    def record_parts(self, model=AttendanceRecord):
+        """The visible records as one queryset per database holding them"""
+        return [on_shard(self._records(model), alias) for alias in self.aliases()]
+
+    def _records(self, model):
+        if self.role == 'master':
+            return model.objects.all()
+        if self.role == 'user1':
+            return model.objects.filter(company_id=self.user.company_id)
+        if self.role == 'user2':
+            return model.objects.filter(user__in=self.assigned())
+        if self.role == 'user3':
+            return model.objects.filter(user=self.user)
+        return model.objects.none()
+
+    def can_see(self, employee):
+        """Whether the employee's records are visible, without a query"""
+        if self.role == 'master':
+            return True
+        if self.role == 'user1':
+            return employee.company_id == self.user.company_id
+        if self.role == 'user2':
+            return employee.pk in self.employee_ids
+        if self.role == 'user3':
+            return employee.pk == self.user.pk
+        return False
+
+
+def scope_for(user):
+    """The user's RecordScope, built once per user object (i.e. per request)"""
+    scope = getattr(user, '_record_scope', None)
+    if scope is None:
+        scope = user._record_scope = RecordScope(user)
+    return scope
@@ -0,0 +1,80 @@
+import unicodedata
+from django.db.models import Count, Q
+from .models import User, UserSearchTrigram
+
+# Fields the attendance filter and the user list search in
+SEARCH_FIELDS = ['username', 'ep_number', 'first_name', 'last_name']
+
+# Trailing padding makes every one- and two-character substring the start of a trigram
+PADDING = '  '
+
+
+def normalize(value):
+    """
+    Casefolded without accents, so no two trigrams are equal under the
+    accent- and case-insensitive collations MySQL compares them with
+    """
+    value = unicodedata.normalize('NFKD', (value or '').strip().casefold())
+    return ''.join(char for char in value if not unicodedata.combining(char))
+
+
+def trigrams(value):
+    """Every three-character piece of a normalized value, padded at the end"""
+    value = normalize(value)
+    if not value:
+        return set()
+    value += PADDING
+    return {value[index:index + 3] for index in range(len(value) - 2)}
+
+
+def user_trigrams(values):
+    """Trigrams of a user's search fields, from a dict of field values"""
+    grams = set()
+    for field in SEARCH_FIELDS:
+        grams |= trigrams(values.get(field))
+    return grams
+
+
+def index_users(user_ids, batch_size=2000):
+    """(Re)build the trigrams of the given users"""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        UserSearchTrigram.objects.filter(user_id__in=batch).delete()
+        # A collation may still equate two normalized trigrams; one row finds the user either way
+        UserSearchTrigram.objects.bulk_create([
+            UserSearchTrigram(user_id=values['id'], trigram=gram)
+            for values in User.objects.filter(id__in=batch).values('id', *SEARCH_FIELDS)
+            for gram in user_trigrams(values)
+        ], batch_size=batch_size, ignore_conflicts=True)
+
+
+def rebuild_index(batch_size=2000):
+    """Index every user from scratch; returns the number of users indexed"""
+    UserSearchTrigram.objects.all().delete()
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    index_users(user_ids, batch_size=batch_size)
+    return len(user_ids)
+
+
+def matching_user_ids(term):
+    """
+    Ids of users with term in one of SEARCH_FIELDS, as a subquery. The
+    trigram index narrows the candidates, the substring check on just
+    those rows removes the false positives, comparing accents as typed.
+    """
+    term = term.strip().lower()
+    normalized = normalize(term)
+    grams = {normalized[index:index + 3] for index in range(len(normalized) - 2)}
+    if grams:
+        candidates = (UserSearchTrigram.objects.filter(trigram__in=grams)
+                      .values('user_id').annotate(matched=Count('id')).filter(matched=len(grams))
+                      .values('user_id'))
+    else:
+        # Shorter than a trigram: any trigram starting with the term
+        candidates = UserSearchTrigram.objects.filter(trigram__startswith=normalized).values('user_id')
+
+    contains = Q()
+    for field in SEARCH_FIELDS:
+        contains |= Q(**{f'{field}__icontains': term})
+    return User.objects.filter(id__in=candidates).filter(contains).values('id')
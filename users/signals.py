@@ -0,0 +1,68 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from labour_management.shards import mirror, shards_configured
+from .dashboard import bump_dashboards
+from .models import Company, SupervisorAssignment, User
+from .scope import forget_assignments
+from .search import SEARCH_FIELDS, index_users
+
+# Saves that don't change anything shown on a dashboard
+DASHBOARD_NEUTRAL_FIELDS = {'last_login', 'password'}
+
+
+@receiver(post_save, sender=User)
+def reindex_user(sender, instance, update_fields=None, **kwargs):
+    # Trigrams go with the user on delete through the foreign key
+    if update_fields and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    index_users([instance.pk])
+
+
+@receiver(pre_save, sender=User)
+def user_moving(sender, instance, update_fields=None, **kwargs):
+    # A user moved to another company changes the previous company's dashboards too
+    instance._previous_company_id = instance.company_id
+    if instance.pk and (update_fields is None or 'company' in update_fields):
+        instance._previous_company_id = User.objects.filter(pk=instance.pk).values_list('company_id', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= DASHBOARD_NEUTRAL_FIELDS:
+        return
+    bump_dashboards({instance.company_id, getattr(instance, '_previous_company_id', instance.company_id)})
+
+
+@receiver(pre_save, sender=SupervisorAssignment)
+def assignment_moving(sender, instance, **kwargs):
+    # An assignment handed to another supervisor changes the previous one's employees too
+    if instance.pk:
+        previous = SupervisorAssignment.objects.filter(pk=instance.pk).values_list('supervisor_id', flat=True).first()
+        if previous and previous != instance.supervisor_id:
+            forget_assignments(previous)
+
+
+@receiver(post_save, sender=SupervisorAssignment)
+@receiver(post_delete, sender=SupervisorAssignment)
+def assignment_changed(sender, instance, **kwargs):
+    forget_assignments(instance.supervisor_id)
+    bump_dashboards(User.objects.filter(pk__in=[instance.supervisor_id, instance.employee_id])
+                    .values_list('company_id', flat=True))
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=SupervisorAssignment)
+@receiver(post_delete, sender=SupervisorAssignment)
+def mirror_to_shards(sender, instance, using, update_fields=None, **kwargs):
+    # Changes to the shards' own copies send these signals too; logins don't matter there
+    if using != DEFAULT_DB_ALIAS or not shards_configured():
+        return
+    if sender is User and update_fields and set(update_fields) <= DASHBOARD_NEUTRAL_FIELDS:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: mirror(sender, [pk]), using=using)
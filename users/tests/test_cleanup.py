@@ -0,0 +1,62 @@
+import csv
+import datetime
+import os
+from django.conf import settings
+from django.test import TestCase
+from django.urls import reverse
+from attendance.models import AttendanceRecord
+from attendance.purge import report_storage
+from attendance.tests.utils import IsolatedFilesMixin
+from users.models import Company, User
+from users.utils import cleanup_orphaned_user3_accounts
+
+
+class OrphanCleanupTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.master = User.objects.create_user('master', password='x', role='master')
+        self.admin = User.objects.create_user('admin', password='x', role='user1', company_name='ACME')
+        for index in range(5):
+            User.objects.create_user(f'A{index}', password='x', role='user3', ep_number=f'A{index}', company_name='ACME')
+        User.objects.create_user('B0', password='x', role='user3', ep_number='B0', company_name='Beta')
+        kept = User.objects.get(username='A0')
+        AttendanceRecord.objects.create(user=kept, date=datetime.date(2024, 1, 1))
+
+    def report_rows(self, report):
+        with report_storage().open(report) as report_file:
+            return list(csv.reader(report_file.read().decode().splitlines()))
+
+    def test_dry_run_lists_without_deleting(self):
+        count, report = cleanup_orphaned_user3_accounts(batch_size=2, dry_run=True)
+
+        self.assertEqual(count, 5)
+        self.assertEqual(User.objects.filter(role='user3').count(), 6)
+        self.assertEqual(len(self.report_rows(report)), 6)
+        self.assertIn('dry_run', report)
+
+    def test_removes_orphans_in_batches_and_lists_them(self):
+        count, report = cleanup_orphaned_user3_accounts(company=Company.objects.get(name='ACME'), batch_size=3)
+
+        self.assertEqual(count, 4)
+        self.assertEqual(set(User.objects.filter(role='user3').values_list('username', flat=True)), {'A0', 'B0'})
+        header, *rows = self.report_rows(report)
+        self.assertEqual(header[:2], ['Username', 'EP Number'])
+        self.assertEqual([row[0] for row in rows], ['A1', 'A2', 'A3', 'A4'])
+
+    def test_reports_are_private_and_only_masters_download_them(self):
+        _, report = cleanup_orphaned_user3_accounts()
+        path = report_storage().path(report)
+        self.assertFalse(path.startswith(os.path.abspath(settings.MEDIA_ROOT)))
+        url = reverse('cleanup_report', args=[report])
+
+        self.client.force_login(self.admin)
+        self.assertRedirects(self.client.get(url), reverse('attendance_list'), fetch_redirect_response=False)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.master)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'A1', b''.join(response.streaming_content))
+        self.assertEqual(self.client.get(reverse('cleanup_report', args=['missing.csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('cleanup_report', args=['..'])).status_code, 404)
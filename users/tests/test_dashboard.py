@@ -0,0 +1,26 @@
+from unittest import mock
+from django.db import OperationalError
+from django.test import TestCase
+from django.urls import reverse
+from attendance.tests.utils import IsolatedFilesMixin
+from users.models import User
+
+
+class DashboardErrorTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('master', password='x', role='master'))
+
+    @mock.patch('users.views.dashboard_context', side_effect=OperationalError('database is locked'))
+    def test_database_errors_are_logged_and_show_an_empty_dashboard(self, context):
+        with self.assertLogs('users.views', 'ERROR') as logs:
+            response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_users'], 0)
+        self.assertIn('database is locked', logs.output[0])
+
+    @mock.patch('users.views.dashboard_context', side_effect=KeyError('total_users'))
+    def test_other_errors_are_not_hidden(self, context):
+        with self.assertRaises(KeyError):
+            self.client.get(reverse('dashboard'))
@@ -0,0 +1,42 @@
+import datetime
+from django.test import TestCase
+from attendance.models import ArchivedAttendanceRecord, AttendanceRecord
+from attendance.tests.utils import IsolatedFilesMixin
+from users.models import SupervisorAssignment, User
+from users.scope import RecordScope
+
+
+class SupervisorScopeTests(IsolatedFilesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.supervisor = User.objects.create_user('sup', password='x', role='user2', company_name='ACME')
+        self.employees = [
+            User.objects.create_user(f'E{index}', password='x', role='user3', company_name='ACME')
+            for index in range(3)
+        ]
+        for employee in self.employees:
+            AttendanceRecord.objects.create(user=employee, date=datetime.date(2024, 1, 1))
+        self.assign(self.employees[0])
+
+    def assign(self, *employees):
+        # bulk_create sends no signals, as a missed cache invalidation would
+        SupervisorAssignment.objects.bulk_create(
+            SupervisorAssignment(supervisor=self.supervisor, employee=employee,
+                                 start_date=datetime.date(2024, 1, 1), assigned_by=self.supervisor)
+            for employee in employees
+        )
+
+    def test_records_follow_the_current_assignments(self):
+        RecordScope(self.supervisor).employee_ids  # cached
+        self.assign(self.employees[1])
+
+        scope = RecordScope(self.supervisor)
+        self.assertEqual({record.user_id for record in scope.records()},
+                         {self.employees[0].pk, self.employees[1].pk})
+        self.assertEqual(set(scope.users()), {self.employees[0], self.employees[1]})
+        self.assertEqual(scope.records(ArchivedAttendanceRecord).count(), 0)
+
+    def test_records_filter_with_a_subquery(self):
+        sql = str(RecordScope(self.supervisor).records().query)
+        self.assertIn('IN (SELECT', sql)
+        self.assertIn('supervisorassignment', sql)
@@ -0,0 +1,20 @@
+from django.test import TestCase
+from attendance.tests.utils import IsolatedFilesMixin
+from users.models import User, UserSearchTrigram
+from users.search import matching_user_ids, normalize, user_trigrams
+
+
+class UserSearchTests(IsolatedFilesMixin, TestCase):
+    def test_trigrams_are_casefolded_without_accents(self):
+        self.assertEqual(normalize(' Jósé Straße '), 'jose strasse')
+        # 'é' and 'e' are the same trigram to an accent-insensitive collation
+        self.assertEqual(user_trigrams({'first_name': 'Renée', 'last_name': 'Renee'}),
+                         {'ren', 'ene', 'nee', 'ee ', 'e  '})
+
+    def test_search_finds_accented_names(self):
+        user = User.objects.create_user('E1', password='x', role='user3', first_name='José', last_name='Müller')
+        User.objects.create_user('E2', password='x', role='user3', first_name='Ann')
+
+        self.assertFalse(UserSearchTrigram.objects.filter(trigram__contains='é').exists())
+        for term in ('josé', 'JOSÉ', 'Mü', 'müller'):
+            self.assertEqual(list(matching_user_ids(term).values_list('id', flat=True)), [user.pk], term)
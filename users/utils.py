@@ -1,27 +1,41 @@
+from django.db import transaction
+from .dashboard import bump_dashboards
+from .hashers import make_provisional_password
 from .models import User
-from attendance.models import AttendanceRecord
+from attendance.export_cache import touch_employee_data
+from attendance.purge import PURGE_BATCH_SIZE, REPORT_FIELDS, append_report, delete_users, orphaned_employees, start_report
 
-def cleanup_orphaned_user3_accounts():
+def cleanup_orphaned_user3_accounts(company=None, batch_size=PURGE_BATCH_SIZE, dry_run=False):
     """
-    Remove User3 (Employee) accounts that have no attendance records.
-    Returns count of deleted users and their usernames.
+    Remove User3 (Employee) accounts that have no attendance records, found
+    with NOT EXISTS and deleted a batch per transaction, optionally only for
+    one company. The accounts are listed in a CSV report instead of being
+    returned. Returns the number of accounts deleted (or, with dry_run, that
+    would be) and the report's storage name, '' if there were none.
     """
-    # Find User3 accounts that have no attendance records
-    users_with_attendance = AttendanceRecord.objects.values_list('user_id', flat=True).distinct()
-    
-    orphaned_users = User.objects.filter(
-        role='user3'
-    ).exclude(
-        id__in=users_with_attendance
-    )
-    
-    deleted_count = orphaned_users.count()
-    deleted_usernames = list(orphaned_users.values_list('username', flat=True))
-    
-    # Delete orphaned User3 accounts
-    orphaned_users.delete()
-    
-    return deleted_count, deleted_usernames
+    orphans = orphaned_employees(company.pk if company else None)
+    count = 0
+    report = ''
+    company_ids = set()
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            # Selected in the deleting transaction, so an employee who just got attendance is kept
+            batch = list(orphans.filter(id__gt=last_id).order_by('id').values_list('id', 'company_id', *REPORT_FIELDS)
+                         [:batch_size])
+            if not batch:
+                break
+            ids = [row[0] for row in batch]
+            count += len(ids) if dry_run else delete_users(ids)[1]
+        last_id = ids[-1]
+        company_ids.update(row[1] for row in batch)
+        report = report or start_report('dry_run' if dry_run else 'orphaned')
+        append_report(report, [row[2:] for row in batch])
+
+    if count and not dry_run:
+        touch_employee_data()
+        bump_dashboards(company_ids)
+    return count, report
 
 def cleanup_user3_by_ep_numbers(ep_numbers_to_keep):
     """
@@ -42,4 +56,47 @@ def cleanup_user3_by_ep_numbers(ep_numbers_to_keep):
     
     users_to_delete.delete()
     
-    return deleted_count, deleted_usernames
\ No newline at end of file
+    return deleted_count, deleted_usernames
+
+def import_users(rows):
+    """
+    Create user accounts from bulk upload rows.
+    Returns count of created users and per-row error messages.
+    """
+    created_count = 0
+    errors = []
+    
+    for row_num, row in enumerate(rows, start=2):
+        try:
+            username = row.get('Username') or row.get('EP Number')
+            password = row.get('Password') or row.get('EP Number')
+            fields = {
+                'email': row.get('Email', ''),
+                'first_name': row.get('Name', '').split()[0] if row.get('Name') else '',
+                'last_name': ' '.join(row.get('Name', '').split()[1:]) if row.get('Name') else '',
+                'role': row.get('Role', 'user3').lower(),
+                'ep_number': row.get('EP Number'),
+                'company_name': row.get('Company Name'),
+                'plant': row.get('Plant'),
+                'department': row.get('Department'),
+                'trade': row.get('Trade'),
+                'skill': row.get('Skill')
+            }
+            
+            if row.get('Password') or fields['role'] != 'user3':
+                User.objects.create_user(username=username, password=password, **fields)
+            else:
+                # Employee with the default EP-number password: hashed properly on first login
+                if not username:
+                    raise ValueError("The given username must be set")
+                fields['email'] = User.objects.normalize_email(fields['email'])
+                User.objects.create(
+                    username=User.normalize_username(username),
+                    password=make_provisional_password(password),
+                    **fields
+                )
+            created_count += 1
+        except Exception as e:
+            errors.append(f"Row {row_num}: {str(e)}")
+    
+    return created_count, errors
@@ -1,16 +1,26 @@
 import csv
-import io
+import logging
+from django.db import DatabaseError
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
-from .models import User, SupervisorAssignment, AuditLog, Notification
+from .dashboard import dashboard_context
+from .models import Company, User, AuditLog, Notification
+from .search import matching_user_ids
 from .forms import CustomUserCreationForm, CustomLoginForm, BulkUserUploadForm, SupervisorAssignmentForm
-from .utils import cleanup_orphaned_user3_accounts
-from attendance.models import AttendanceRecord
+from attendance.models import UploadJob
+from attendance.jobs import enqueue_purge, enqueue_upload
+from attendance.pagination import keyset_page, page_links
+from attendance.purge import date_range_params, purge_description
+from labour_management.replicas import reporting_view
+
+logger = logging.getLogger(__name__)
+
+USER_PAGE_FIELDS = [('id', False)]
 
 def login_view(request):
     if request.method == 'POST':
@@ -34,34 +44,16 @@ def login_view(request):
     return render(request, 'users/login.html', {'form': form})
 
 @login_required
+@reporting_view
 def dashboard(request):
     user = request.user
     context = {'user': user}
     
     try:
-        if user.role == 'master':
-            context.update({
-                'total_companies': User.objects.filter(role='user1').values('company_name').distinct().count(),
-                'total_users': User.objects.count(),
-                'recent_uploads': AttendanceRecord.objects.select_related('user').order_by('-created_at')[:10]
-            })
-        elif user.role == 'user1':
-            context.update({
-                'company_employees': User.objects.filter(company_name=user.company_name, role='user3').count(),
-                'company_supervisors': User.objects.filter(company_name=user.company_name, role='user2').count(),
-                'recent_attendance': AttendanceRecord.objects.filter(user__company_name=user.company_name).order_by('-date')[:10]
-            })
-        elif user.role == 'user2':
-            assigned_employees = SupervisorAssignment.objects.filter(supervisor=user).values_list('employee', flat=True)
-            context.update({
-                'assigned_employees': User.objects.filter(id__in=assigned_employees),
-                'recent_attendance': AttendanceRecord.objects.filter(user__id__in=assigned_employees).order_by('-date')[:10]
-            })
-        elif user.role == 'user3':
-            attendance_summary = AttendanceRecord.objects.filter(user=user).values('status').annotate(count=Count('status'))
-            context['attendance_summary'] = {item['status']: item['count'] for item in attendance_summary}
-    except Exception as e:
-        # Fallback for any database errors
+        context.update(dashboard_context(user))
+    except DatabaseError:
+        # Shown empty while the database is unavailable; anything else is a bug and raises
+        logger.exception('Dashboard of %s could not be read', user.username)
         context.update({
             'total_companies': 0,
             'total_users': 0,
@@ -69,6 +61,7 @@ def dashboard(request):
             'company_employees': 0,
             'company_supervisors': 0,
             'recent_attendance': [],
+            'month_attendance': {},
             'assigned_employees': [],
             'attendance_summary': {}
         })
@@ -105,88 +98,56 @@ def bulk_user_upload(request):
         form = BulkUserUploadForm(request.POST, request.FILES)
         if form.is_valid():
             csv_file = request.FILES['csv_file']
-            decoded_file = csv_file.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
             
-            created_count = 0
-            error_count = 0
-            errors = []
+            # Hand the file to the upload worker and return straight away
+            job = enqueue_upload('users', csv_file, request.user)
             
-            for row_num, row in enumerate(reader, start=2):
-                try:
-                    username = row.get('Username') or row.get('EP Number')
-                    password = row.get('Password') or row.get('EP Number')
-                    
-                    user = User.objects.create_user(
-                        username=username,
-                        password=password,
-                        email=row.get('Email', ''),
-                        first_name=row.get('Name', '').split()[0] if row.get('Name') else '',
-                        last_name=' '.join(row.get('Name', '').split()[1:]) if row.get('Name') else '',
-                        role=row.get('Role', 'user3').lower(),
-                        ep_number=row.get('EP Number'),
-                        company_name=row.get('Company Name'),
-                        plant=row.get('Plant'),
-                        department=row.get('Department'),
-                        trade=row.get('Trade'),
-                        skill=row.get('Skill')
-                    )
-                    created_count += 1
-                except Exception as e:
-                    error_count += 1
-                    errors.append(f"Row {row_num}: {str(e)}")
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'job_id': job.id,
+                    'status_url': reverse('upload_job_status', args=[job.id])
+                }, status=202)
             
-            # Provide detailed feedback
-            if error_count == 0:
-                # All users created successfully
-                messages.success(request, f'✅ Data Successfully Updated! Created {created_count} user accounts.')
-            elif created_count > 0:
-                # Partial success
-                messages.success(request, f'✅ Partially Updated! Created {created_count} user accounts successfully.')
-                messages.warning(request, f'⚠️ {error_count} users could not be created due to errors.')
-                # Show first 5 errors
-                for error in errors[:5]:
-                    messages.error(request, error)
-                if len(errors) > 5:
-                    messages.error(request, f'... and {len(errors) - 5} more errors.')
-            else:
-                # Complete failure
-                messages.error(request, f'❌ Data Not Updated! All {error_count} users failed to create.')
-                # Show first 10 errors
-                for error in errors[:10]:
-                    messages.error(request, error)
-                if len(errors) > 10:
-                    messages.error(request, f'... and {len(errors) - 10} more errors.')
+            messages.success(request, f'✅ Upload queued! {csv_file.name} is being processed as job #{job.id}')
+            messages.info(request, 'You will get a notification with the results when processing finishes.')
             
             return redirect('bulk_user_upload')
     else:
         form = BulkUserUploadForm()
     
-    return render(request, 'users/bulk_upload.html', {'form': form})
+    recent_jobs = UploadJob.objects.filter(uploaded_by=request.user, kind='users')[:5]
+    
+    return render(request, 'users/bulk_upload.html', {'form': form, 'recent_jobs': recent_jobs})
 
 @login_required
 def user_list(request):
     if request.user.role == 'master':
         users = User.objects.all()
     elif request.user.role == 'user1':
-        users = User.objects.filter(company_name=request.user.company_name)
+        users = User.objects.filter(company_id=request.user.company_id)
     else:
         messages.error(request, 'Permission denied.')
         return redirect('dashboard')
     
     search = request.GET.get('search')
     if search:
-        users = users.filter(
-            Q(username__icontains=search) | 
-            Q(first_name__icontains=search) | 
-            Q(last_name__icontains=search) | 
-            Q(ep_number__icontains=search)
-        )
-    
-    paginator = Paginator(users, 25)
-    page = request.GET.get('page')
-    users = paginator.get_page(page)
+        users = users.filter(id__in=matching_user_ids(search))
+    
+    users = keyset_page(request, users, USER_PAGE_FIELDS)
+    
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [{
+                'id': user.pk,
+                'username': user.username,
+                'name': user.get_full_name(),
+                'ep_number': user.ep_number,
+                'role': user.role,
+                'company_name': user.company_name,
+                'is_active': user.is_active,
+            } for user in users],
+            **page_links(users),
+        })
     
     return render(request, 'users/user_list.html', {'users': users})
 
@@ -201,30 +162,22 @@ def delete_company_data(request):
         delete_blank = request.POST.get('delete_blank')
         
         if company_name:
-            # Delete attendance records first
-            attendance_count = AttendanceRecord.objects.filter(user__company_name=company_name).count()
-            AttendanceRecord.objects.filter(user__company_name=company_name).delete()
-            
-            # Delete all users for the company (this includes all roles)
-            user_count = User.objects.filter(company_name=company_name).count()
-            User.objects.filter(company_name=company_name).delete()
-            
-            messages.success(request, f'Deleted {user_count} users and {attendance_count} attendance records for company: {company_name}')
+            company = Company.objects.filter(name=company_name).first()
+            if company:
+                params = {'company_id': company.pk, 'company_name': company.name}
+                enqueue_purge(params, request.user, purge_description(params), company_name=company.name)
+                messages.success(request, f'Deleting all users and attendance records for company {company_name} in the background. You will get a notification when it is done.')
+            else:
+                messages.error(request, f'Company {company_name} not found.')
         elif delete_blank:
-            # Delete attendance records with blank/null company names
-            attendance_count = AttendanceRecord.objects.filter(Q(user__company_name__isnull=True) | Q(user__company_name='')).count()
-            AttendanceRecord.objects.filter(Q(user__company_name__isnull=True) | Q(user__company_name='')).delete()
-            
-            # Delete users with blank company names
-            user_count = User.objects.filter(Q(company_name__isnull=True) | Q(company_name='')).count()
-            User.objects.filter(Q(company_name__isnull=True) | Q(company_name='')).delete()
-            
-            messages.success(request, f'Deleted {user_count} users and {attendance_count} attendance records with blank company names')
+            params = {'blank': True}
+            enqueue_purge(params, request.user, purge_description(params), company_name='')
+            messages.success(request, 'Deleting all users and attendance records with blank company names in the background. You will get a notification when it is done.')
         else:
             messages.error(request, 'Please select a company or choose to delete blank records.')
     
-    companies = User.objects.values_list('company_name', flat=True).distinct().exclude(company_name__isnull=True).exclude(company_name='')
-    blank_count = User.objects.filter(Q(company_name__isnull=True) | Q(company_name='')).count()
+    companies = Company.objects.order_by('name').values_list('name', flat=True)
+    blank_count = User.objects.filter(company__isnull=True).count()
     return render(request, 'users/delete_company.html', {'companies': companies, 'blank_count': blank_count})
 
 @login_required
@@ -250,21 +203,10 @@ def delete_attendance_data(request):
         start_date = request.POST.get('start_date')
         end_date = request.POST.get('end_date')
         
-        if start_date and end_date:
-            from attendance.models import AttendanceRecord
-            
-            # Delete attendance records
-            deleted_count = AttendanceRecord.objects.filter(date__gte=start_date, date__lte=end_date).count()
-            AttendanceRecord.objects.filter(date__gte=start_date, date__lte=end_date).delete()
-            
-            # Clean up orphaned User3 accounts
-            deleted_users_count, deleted_usernames = cleanup_orphaned_user3_accounts()
-            
-            message = f'Deleted {deleted_count} attendance records from {start_date} to {end_date}'
-            if deleted_users_count > 0:
-                message += f' and removed {deleted_users_count} User3 accounts with no remaining attendance: {", ".join(deleted_usernames)}'
-            
-            messages.success(request, message)
+        params = date_range_params(start_date, end_date)
+        if params:
+            enqueue_purge(params, request.user, purge_description(params))
+            messages.success(request, f'Deleting attendance records from {start_date} to {end_date} in the background, then User3 accounts left without attendance. You will get a notification when it is done.')
         else:
             messages.error(request, 'Both start date and end date are required.')
     